@@ -0,0 +1,74 @@
+"""Full export: streamed write-only workbook vs building every cell in memory (user-023).
+
+  stream     - ExcelWorkbookWriter.export_all() on a file with module sheets only (stream_export)
+  in-memory  - the same export when the file has a sheet of its own to keep: every cell is built in the
+               loaded workbook and saved with it (the way every full export used to run)
+
+Each run happens in its own process so peak RSS (ru_maxrss) belongs to that export alone.
+
+    python bench/bench_excel_export.py [sizes...]     (default: 10000 100000)
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_case_capture as tcc
+from openpyxl import Workbook
+
+MODULES = 10
+
+
+def make_case(number, module):
+    return {"test_id": f"TC_{module}_{number:05d}", "test_name": f"Verify Login button on Login page {number}",
+            "module": module, "description": "Test Login functionality on Login page",
+            "preconditions": f"User is on Login page (URL: https://app.example.com/login?i={number})",
+            "test_steps": "1. Navigate to https://app.example.com/login\n2. Click on 'Email' input\n"
+                          "3. Type 'user@example.com'\n4. Click on 'Sign in' button",
+            "expected_result": "User is logged in and sees the dashboard", "actual_result": "",
+            "status": ["Pass", "Fail", "Blocked", "Not Executed"][number % 4], "priority": "High",
+            "page": "Login", "tab": "", "url": "https://app.example.com/login", "browser": "Chrome :9222",
+            "step_timing": "1. +0 ms\n2. +512 ms\n3. +1204 ms\n4. +380 ms", "screenshots": "",
+            "created_date": "2026-01-01 10:00:00"}
+
+
+def run_one(mode, size, path):
+    """One export in this process; prints seconds, peak RSS growth (MB) and file size (MB)"""
+    suite = {f"Module {m}": [make_case(i, f"Module {m}") for i in range(size // MODULES)] for m in range(MODULES)}
+    if mode == "in-memory":
+        wb = Workbook()
+        wb.active.title = "Notes"  # Not a module sheet - export_all() has to keep it, so nothing is streamed
+        wb.save(path)
+    loaded = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    writer = tcc.ExcelWorkbookWriter(path)
+    started = time.perf_counter()
+    writer.export_all(suite)
+    writer.save()
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{elapsed:.2f} {(peak - loaded) / 1024:.0f} {os.path.getsize(path) / 1e6:.1f}")
+
+
+def main():
+    if sys.argv[1:2] == ["--one"]:
+        run_one(sys.argv[2], int(sys.argv[3]), sys.argv[4])
+        return
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+    print(f"{'cases':>7} | {'mode':>9} | {'time':>8} | {'peak RSS':>9} | {'file':>7}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            for mode in ("stream", "in-memory"):
+                path = os.path.join(directory, f"{mode}_{size}.xlsx")
+                output = subprocess.run([sys.executable, __file__, "--one", mode, str(size), path],
+                                        check=True, capture_output=True, text=True).stdout
+                seconds, rss, file_size = output.split()
+                print(f"{size:>7} | {mode:>9} | {float(seconds):>6.1f} s | {'+' + rss:>6} MB | {file_size:>4} MB",
+                      flush=True)
+
+
+if __name__ == "__main__":
+    main()
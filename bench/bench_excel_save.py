@@ -0,0 +1,93 @@
+"""Save cost as the suite grows (user-021).
+
+For each suite size a workbook with that many test cases is written first, then test cases are saved the
+way save_to_excel() does it. Three costs are reported per save:
+
+  capture   - what the capture path pays: ExcelPersistenceWorker.append() (journal fsync + queue)
+  row write - ExcelWorkbookWriter.append(): the new row written into the loaded workbook
+  wb.save   - ExcelWorkbookWriter.save(): openpyxl serializing the whole workbook to disk
+
+The first two stay flat; they are all the capture path and the Tk thread pay. wb.save does not: an .xlsx
+is a zip of whole-sheet XML files and openpyxl can only write the file as a whole, so the background save
+is O(n) in the suite size. The worker only pays it once per burst of saves (debounced), never on the Tk
+thread.
+
+    python bench/bench_excel_save.py [sizes...]     (default: 100 1000 10000 50000)
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_case_capture as tcc
+
+MODULES = 10
+SAVES = 20
+DISK_SAVES = 5  # wb.save takes seconds on big suites
+
+
+def make_case(number, module):
+    return {"test_id": f"TC_{module}_{number:05d}", "test_name": f"Verify Login button on Login page {number}",
+            "module": module, "description": "Test Login functionality on Login page",
+            "preconditions": f"User is on Login page (URL: https://app.example.com/login?i={number})",
+            "test_steps": "1. [10:00:00] Navigated to: https://app.example.com/login\n"
+                          "2. [10:00:01] Mouse left click at (812, 433)\n"
+                          "3. [10:00:02] Enter 'user@example.com' in input (#email)",
+            "expected_result": "User is logged in and sees the dashboard", "actual_result": "",
+            "status": ["Pass", "Fail", "Blocked", "Not Executed"][number % 4], "priority": "High",
+            "page": "Login", "tab": "", "url": "https://app.example.com/login", "browser": "Chrome :9222",
+            "step_timing": "1. 10:00:00.000 +0 ms\n2. 10:00:01.000 +1000 ms\n3. 10:00:02.000 +1000 ms",
+            "screenshots": "", "created_date": "2026-01-01 10:00:00"}
+
+
+def median_ms(samples):
+    return statistics.median(samples) * 1000
+
+
+def bench(size, directory):
+    path = os.path.join(directory, f"suite_{size}.xlsx")
+    per_module = size // MODULES
+    suite = {f"Module {m}": [make_case(i, f"Module {m}") for i in range(per_module)] for m in range(MODULES)}
+    tcc.ExcelWorkbookWriter(path).export_all(suite)
+
+    writer = tcc.ExcelWorkbookWriter(path)
+    writer.load()
+    row_write, disk_write = [], []
+    for i in range(SAVES):
+        started = time.perf_counter()
+        writer.append("Module 0", make_case(per_module + i, "Module 0"))
+        row_write.append(time.perf_counter() - started)
+        if i >= DISK_SAVES:
+            continue
+        started = time.perf_counter()
+        writer.save()
+        disk_write.append(time.perf_counter() - started)
+
+    # Capture path: the worker is not started, so only the journal fsync and the queueing are timed
+    journal = tcc.TestCaseJournal(os.path.join(directory, f"journal_{size}.jsonl"))
+    journal.open()
+    worker = tcc.ExcelPersistenceWorker(writer, lambda func: None, journal=journal)
+    capture = []
+    for i in range(SAVES):
+        test_case = make_case(per_module + SAVES + i, "Module 0")
+        started = time.perf_counter()
+        worker.append("Module 0", test_case)
+        capture.append(time.perf_counter() - started)
+    journal.close()
+    return median_ms(capture), median_ms(row_write), median_ms(disk_write)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000, 50000]
+    print(f"{'cases':>7} | {'capture':>10} | {'row write':>10} | {'wb.save':>10}   (median of {SAVES} saves, {DISK_SAVES} for wb.save)")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            capture, row_write, disk_write = bench(size, directory)
+            print(f"{size:>7} | {capture:>7.2f} ms | {row_write:>7.2f} ms | {disk_write:>7.0f} ms", flush=True)
+
+
+if __name__ == "__main__":
+    main()
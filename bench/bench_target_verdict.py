@@ -0,0 +1,55 @@
+"""Cost of the capture decision per input event (user-014).
+
+Listener threads read the TargetVerdict that BrowserMonitor publishes on every URL / base URL / manual
+override change (_publish_target) instead of re-checking the URLs for each click and key. Reported:
+
+  snapshot   - ActionMonitor._check_target_application() on the published verdict (what listeners do)
+  recompute  - compute_target_verdict() per event, i.e. the URL checks the snapshot saves each event
+  publish    - one URL change: the current_url setter recomputing and swapping in the verdict
+
+    python bench/bench_target_verdict.py [events]     (default: 1000000)
+"""
+import itertools
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_case_capture as tcc
+
+BASE_URL = "https://qa-exchange.doceree.com"
+URLS = {"on target": BASE_URL + "/accounts/users?id=1", "off target": "https://other.example/x"}
+
+
+def main():
+    events = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    browser_monitor = tcc.BrowserMonitor(lambda *args, **kwargs: None, base_url=BASE_URL)
+    browser_monitor.last_valid_url = BASE_URL + "/login"
+    monitor = tcc.ActionMonitor(lambda *args, **kwargs: None, browser_monitor)
+    monitor.monitoring = True
+
+    def recompute():
+        target = tcc.compute_target_verdict(browser_monitor.current_url, browser_monitor.base_url,
+                                            browser_monitor.last_valid_url, browser_monitor.manual_override)
+        return target.manual or target.on_target or (monitor.monitoring and target.continuity)
+
+    print(f"{'':>10} | {'snapshot':>11} | {'recompute':>11}   ({events} events)")
+    for label, url in URLS.items():
+        browser_monitor.current_url = url
+        snapshot = timeit.timeit(monitor._check_target_application, number=events) / events * 1e9
+        recomputed = timeit.timeit(recompute, number=events) / events * 1e9
+        print(f"{label:>10} | {snapshot:>8.0f} ns | {recomputed:>8.0f} ns")
+
+    changes = max(events // 10, 1)
+    urls = itertools.cycle(URLS.values())
+
+    def change_url():
+        browser_monitor.current_url = next(urls)
+
+    publish = timeit.timeit(change_url, number=changes) / changes * 1e9
+    print(f"publish: {publish:.0f} ns per URL change ({changes} changes)")
+
+
+if __name__ == "__main__":
+    main()
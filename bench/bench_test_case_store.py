@@ -0,0 +1,103 @@
+"""SQLite store vs the workbook as the store of record (user-025).
+
+  load     - startup: ExcelWorkbookWriter.load() vs TestCaseStore load() + counters() + unsynced()
+  find     - one test case by ID (Replay Test Case...): scanning the loaded list vs TestCaseStore.find()
+  query    - filtered lookups: scanning the lists loaded from the workbook (the Excel-only path) vs the
+             indexed TestCaseStore.query() / count() - a selective filter (module + status) and a broad
+             one (a month of created dates)
+  add      - one committed save (WAL, synchronous=FULL)
+
+    python bench/bench_test_case_store.py [cases]     (default: 100000)
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_case_capture as tcc
+
+MODULES = 10
+ADDS = 50
+REPEATS = 10
+
+
+def make_case(number, module):
+    return {"test_id": f"TC_{module.replace(' ', '')}_{number:05d}", "test_name": f"Verify Login button {number}",
+            "module": module, "description": "Test Login functionality",
+            "preconditions": f"User is on Login page (URL: https://app.example.com/p/{number % 500})",
+            "test_steps": "1. Navigate to https://app.example.com/login\n2. Click on 'Email' input\n"
+                          "3. Type 'user@example.com'\n4. Click on 'Sign in' button",
+            "expected_result": "User is logged in", "actual_result": "",
+            "status": ["Pass", "Fail", "Blocked", "Not Executed"][number % 4], "priority": "High",
+            "page": "Login", "tab": "", "url": f"https://app.example.com/p/{number % 500}",
+            "browser": "Chrome :9222", "step_timing": "1. +0 ms\n2. +512 ms", "screenshots": "",
+            "created_date": f"2026-{number % 12 + 1:02d}-{number % 28 + 1:02d} 10:{number % 60:02d}:00"}
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    suite = {f"Module {m}": [make_case(i, f"Module {m}") for i in range(size // MODULES)] for m in range(MODULES)}
+    with tempfile.TemporaryDirectory() as directory:
+        xlsx, db = os.path.join(directory, "suite.xlsx"), os.path.join(directory, "suite.db")
+        tcc.ExcelWorkbookWriter(xlsx).export_all(suite)
+        store = tcc.TestCaseStore(db)
+        store.open()
+        store.add_many([(module, test_case) for module, test_cases in suite.items() for test_case in test_cases],
+                       synced=True)
+        store.close()
+        del suite
+
+        by_module, excel_load = timed(tcc.ExcelWorkbookWriter(xlsx).load)
+        store = tcc.TestCaseStore(db)
+
+        def load_store():
+            store.open()
+            loaded = store.load()
+            store.counters()
+            store.unsynced()
+            return loaded
+
+        loaded, store_load = timed(load_store)
+        assert sum(map(len, loaded.values())) == sum(map(len, by_module.values())) == size
+        print(f"{size} cases")
+        print(f"  load: workbook {excel_load:.2f} s, SQLite {store_load:.2f} s")
+
+        test_cases = [test_case for module_cases in by_module.values() for test_case in module_cases]
+        test_id = test_cases[len(test_cases) * 3 // 4]["test_id"]
+        scan = statistics.median(timed(lambda: next(tc for tc in test_cases if tc["test_id"] == test_id))[1]
+                                 for _ in range(20))
+        find = statistics.median(timed(lambda: store.find(test_id))[1] for _ in range(20))
+        print(f"  find by ID: list scan {scan * 1000:.2f} ms, SQLite {find * 1000:.3f} ms")
+
+        filters = (("module + status", {"module": "Module 3", "status": "Fail"},
+                    lambda tc: tc["module"] == "Module 3" and tc["status"] == "Fail"),
+                   ("created_date range", {"created_from": "2026-03-01", "created_to": "2026-04-01"},
+                    lambda tc: "2026-03-01" <= tc["created_date"] < "2026-04-01"))
+        for name, query_filters, match in filters:
+            scanned, _ = timed(lambda: [tc for tc in test_cases if match(tc)])
+            assert len(scanned) == len(store.query(**query_filters)) == store.count(**query_filters)
+            scan = statistics.median(timed(lambda: [tc for tc in test_cases if match(tc)])[1] for _ in range(REPEATS))
+            query = statistics.median(timed(lambda: store.query(**query_filters))[1] for _ in range(REPEATS))
+            count_scan = statistics.median(timed(lambda: sum(1 for tc in test_cases if match(tc)))[1]
+                                           for _ in range(REPEATS))
+            count = statistics.median(timed(lambda: store.count(**query_filters))[1] for _ in range(REPEATS))
+            print(f"  {name} ({len(scanned)} rows): list scan {scan * 1000:.2f} ms, SQLite query "
+                  f"{query * 1000:.2f} ms | count: list scan {count_scan * 1000:.2f} ms, SQLite {count * 1000:.3f} ms")
+
+        _, add = timed(lambda: [store.add("Module 0", make_case(900000 + i, "Module 0")) for i in range(ADDS)])
+        print(f"  add: {add / ADDS * 1000:.2f} ms per committed save")
+        print(f"  size: database {os.path.getsize(db) / 1e6:.1f} MB, workbook {os.path.getsize(xlsx) / 1e6:.1f} MB")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
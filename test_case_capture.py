@@ -4,19 +4,35 @@ Automatically captures test cases with browser URL monitoring and module detecti
 """
 
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
+from tkinter import ttk, messagebox, simpledialog, filedialog
 from datetime import datetime
 from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import CellIsRule
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
 from openpyxl.utils import get_column_letter
 import threading
 import time
 import sys
+import argparse
 import re
 import json
+import sqlite3
 import subprocess
 import os
 import tempfile
+import shutil
+import asyncio
+import base64
+import hashlib
+import struct
+import socket
+import zlib
+from array import array
+from copy import copy
+import http.client
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urlparse, parse_qs
 
 try:
@@ -34,6 +50,12 @@ try:
 except ImportError:
     PSUTIL_AVAILABLE = False
 
+try:
+    from Xlib import X, display as xdisplay, error as xerror
+    XLIB_AVAILABLE = True
+except ImportError:
+    XLIB_AVAILABLE = False
+
 try:
     from selenium import webdriver
     from selenium.webdriver.chrome.service import Service
@@ -61,13 +83,1291 @@ MODULE_PATTERNS = {
 }
 
 
+
+def parse_port_spec(spec):
+    """Parse a port list such as '9222-9226,9300' (invalid parts are ignored)"""
+    ports = []
+    for part in str(spec or "").replace(" ", "").split(","):
+        if not part:
+            continue
+        try:
+            if "-" in part:
+                first, last = (int(p) for p in part.split("-", 1))
+                ports.extend(range(first, last + 1))
+            else:
+                ports.append(int(part))
+        except ValueError:
+            continue
+    # Keep order, drop duplicates and anything outside the TCP port range
+    seen = set()
+    return [p for p in ports if 0 < p < 65536 and not (p in seen or seen.add(p))]
+
+
+def format_port_spec(ports):
+    """Inverse of parse_port_spec - collapse consecutive ports into ranges"""
+    parts = []
+    for port in ports:
+        if parts and port == parts[-1][1] + 1:
+            parts[-1][1] = port
+        else:
+            parts.append([port, port])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in parts)
+
+
+# DevTools ports probed when looking for a browser started with remote debugging
+# (override with e.g. DEVTOOLS_PORTS=9222-9240 when running several debug browsers)
+DEVTOOLS_PORTS = parse_port_spec(os.environ.get("DEVTOOLS_PORTS", "9222-9226")) or [9222, 9223, 9224, 9225, 9226]
+
+# File a Chromium browser writes into its profile once DevTools is listening
+# (line 1: port, line 2: browser WebSocket path) - lets launches use --remote-debugging-port=0
+DEVTOOLS_ACTIVE_PORT_FILE = "DevToolsActivePort"
+DEVTOOLS_ACTIVE_PORT_TIMEOUT = 30  # Seconds to wait for a launched browser to write it
+
+
+def read_devtools_active_port(user_data_dir):
+    """Return (port, browser_ws_path) from a profile's DevToolsActivePort file, or None"""
+    try:
+        with open(os.path.join(user_data_dir, DEVTOOLS_ACTIVE_PORT_FILE), encoding="utf-8") as f:
+            lines = f.read().split()
+        port = int(lines[0])
+        return (port, lines[1] if len(lines) > 1 else None) if 0 < port < 65536 else None
+    except (OSError, ValueError, IndexError):
+        return None  # Not written yet (or half written)
+
+
+def wait_for_devtools_active_port(user_data_dir, process=None, timeout=DEVTOOLS_ACTIVE_PORT_TIMEOUT, interval=0.05):
+    """Block until the browser writes DevToolsActivePort; None on timeout or if the process exits first"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = read_devtools_active_port(user_data_dir)
+        if result:
+            return result
+        if process is not None and process.poll() is not None:
+            # Launcher exited - it may have handed off to a browser already running this profile
+            return read_devtools_active_port(user_data_dir)
+        time.sleep(interval)
+    return None
+
+
+# Default timeout (seconds) for DevTools HTTP endpoint requests
+DEVTOOLS_HTTP_TIMEOUT = 1.0
+
+# Seconds between attempts to (re)open the event-driven DevTools session
+CDP_RECONNECT_INTERVAL = 5
+
+# Debounce for click/Enter-triggered URL re-checks: wait this long after the last input
+# (but never longer than URL_REFRESH_MAX_DELAY after the first) before probing once
+URL_REFRESH_DEBOUNCE = 0.15
+URL_REFRESH_MAX_DELAY = 0.6
+URL_REFRESH_JOIN_TIMEOUT = 1.0  # stop_monitoring() waits this long for the re-check thread (a probe in flight may take longer)
+
+# Input coalescing (OS-level hooks): wheel notches closer than SCROLL_GAP merge into one scroll step,
+# a second click within DOUBLE_CLICK_GAP s and DOUBLE_CLICK_DISTANCE px folds into a double-click,
+# and a typing run becomes one step after TYPING_IDLE s without keys (or on Enter/Tab/click/window change)
+COALESCE_SCROLL_GAP = 0.4
+COALESCE_DOUBLE_CLICK_GAP = 0.35
+COALESCE_DOUBLE_CLICK_DISTANCE = 4
+COALESCE_TYPING_IDLE = 1.5
+
+# Listener threads hand UI work to Tk through a bounded queue drained once per tick:
+# tick period (ms), queue bound for log/notice records, and max records handled per tick
+UI_TICK_MS = 30
+UI_QUEUE_MAXSIZE = 2000
+UI_TICK_BATCH = 1000
+
+# Magic value from RFC 6455 used to verify the WebSocket handshake
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Page binding the in-page capture script reports DOM events through (Runtime.addBinding)
+DOM_CAPTURE_BINDING = "__testCaseCapture"
+
+# Element description helpers shared by the in-page capture script and click-to-element resolution
+DOM_DESCRIBE_JS = r"""
+  var INTERACTIVE = "a,button,input,select,textarea,label,summary,option,[role],[onclick],[tabindex]";
+  function clip(s, n) {
+    s = (s || "").replace(/\s+/g, " ").trim();
+    return s.length > n ? s.slice(0, n - 1) + "…" : s;
+  }
+  function esc(s) { return window.CSS && CSS.escape ? CSS.escape(s) : s.replace(/([^\w-])/g, "\\$1"); }
+  function selector(el) {
+    var parts = [];
+    while (el && el.nodeType === 1 && parts.length < 6) {
+      if (el.id) { parts.unshift("#" + esc(el.id)); break; }
+      var part = el.tagName.toLowerCase(), name = el.getAttribute("name");
+      if (name) {
+        part += '[name="' + name.replace(/"/g, '\\"') + '"]';
+      } else if (el.parentElement) {
+        var same = 0, index = 0;
+        for (var c = el.parentElement.firstElementChild; c; c = c.nextElementSibling) {
+          if (c.tagName === el.tagName) { same++; if (c === el) index = same; }
+        }
+        if (same > 1) part += ":nth-of-type(" + index + ")";
+      }
+      parts.unshift(part);
+      el = el.parentElement;
+    }
+    return parts.join(" > ");
+  }
+  function label(el) {
+    var text = el.getAttribute("aria-label") || el.getAttribute("title") ||
+               el.getAttribute("placeholder") || el.getAttribute("alt");
+    if (!text && el.labels && el.labels.length) text = el.labels[0].innerText;
+    if (!text && /^(button|submit|reset)$/.test(el.type || "") && el.tagName === "INPUT") text = el.value;
+    if (!text && !/^(INPUT|SELECT|TEXTAREA)$/.test(el.tagName)) text = el.innerText || el.textContent;
+    return clip(text, 80);
+  }
+  function describe(el) {
+    return {tag: el.tagName.toLowerCase(), id: el.id || "", role: el.getAttribute("role") || "",
+            type: el.getAttribute("type") || "", name: el.getAttribute("name") || "",
+            text: label(el), selector: selector(el)};
+  }
+"""
+
+# Injected into every document of every monitored tab while in-page capture is on.
+# Reports trusted click/change/submit/keydown events with a description of the element.
+DOM_CAPTURE_SCRIPT = r"""
+(function () {
+  if (window.__testCaseCaptureInstalled) return;
+  window.__testCaseCaptureInstalled = true;
+  var BINDING = "%s";
+%s
+  function send(kind, el, extra) {
+    try {
+      if (!(el instanceof Element)) return;
+      var payload = describe(el);
+      payload.kind = kind;
+      payload.url = location.href;
+      payload.ts = Date.now();
+      for (var k in extra) payload[k] = extra[k];
+      window[BINDING](JSON.stringify(payload));
+    } catch (e) {}
+  }
+  document.addEventListener("click", function (e) {
+    if (!e.isTrusted || !(e.target instanceof Element)) return;
+    send("click", e.target.closest(INTERACTIVE) || e.target, {x: e.clientX, y: e.clientY, button: e.button});
+  }, true);
+  document.addEventListener("change", function (e) {
+    if (!e.isTrusted) return;
+    var el = e.target, value = el.value;
+    if (el.tagName === "SELECT") value = el.selectedIndex >= 0 ? el.options[el.selectedIndex].text : el.value;
+    else if (el.type === "checkbox" || el.type === "radio") value = el.checked ? "checked" : "unchecked";
+    else if (el.type === "password") value = "********";
+    send("change", el, {value: clip(value, 200)});
+  }, true);
+  document.addEventListener("submit", function (e) {
+    if (!e.isTrusted) return;
+    send("submit", e.target, {});
+  }, true);
+  document.addEventListener("keydown", function (e) {
+    if (!e.isTrusted || !/^(Enter|Escape|Tab)$/.test(e.key)) return;
+    send("keydown", e.target, {key: e.key});
+  }, true);
+})();
+""" % (DOM_CAPTURE_BINDING, DOM_DESCRIBE_JS)
+
+# Runtime.callFunctionOn body - describes the interactive element around a hit-tested node
+DOM_DESCRIBE_FUNCTION = """function () {
+%s
+  var el = this.nodeType === 1 ? this : this.parentElement;
+  return el ? describe(el.closest(INTERACTIVE) || el) : null;
+}""" % DOM_DESCRIBE_JS
+
+# Where the page viewport sits on screen (CSS px), to map global click coordinates into the page
+DOM_VIEWPORT_EXPRESSION = """(function () {
+  var border = Math.max(0, (window.outerWidth - window.innerWidth) / 2);
+  return {left: window.screenX + border, top: window.screenY + window.outerHeight - window.innerHeight - border,
+          width: window.innerWidth, height: window.innerHeight};
+})()"""
+
+# Tags treated as the element a user meant to click (anything else is refined to its interactive ancestor)
+DOM_INTERACTIVE_TAGS = {"a", "button", "input", "select", "textarea", "label", "summary", "option"}
+
+
+def _dom_element_kind(tag, role, input_type):
+    """Readable element kind for a step, e.g. 'button', 'dropdown', 'text field'"""
+    if role in ("button", "link", "tab", "menuitem", "checkbox", "radio", "option", "switch", "combobox"):
+        return {"menuitem": "menu item", "radio": "radio button", "combobox": "dropdown"}.get(role, role)
+    if tag == "input":
+        if input_type in ("submit", "button", "reset", "image"):
+            return "button"
+        return {"checkbox": "checkbox", "radio": "radio button", "file": "file input"}.get(input_type, "text field")
+    return {"a": "link", "button": "button", "select": "dropdown", "textarea": "text area",
+            "form": "form", "label": "label", "option": "option", "summary": "section",
+            "img": "image"}.get(tag, f"{tag} element" if tag else "element")
+
+
+def describe_dom_event(event):
+    """Turn an in-page capture event into a step, e.g. "Click button 'Save' (#save)" """
+    kind = event.get("kind", "")
+    element = _dom_element_kind(event.get("tag", ""), event.get("role", ""), event.get("type", ""))
+    name = event.get("text") or event.get("name") or event.get("id") or ""
+    target = f"{element} '{name}'" if name else element
+    value = event.get("value", "")
+    if kind == "click":
+        step = f"Click {target}"
+    elif kind == "change" and event.get("type") in ("checkbox", "radio"):
+        step = f"{'Check' if value == 'checked' else 'Uncheck'} {target}"
+    elif kind == "change":
+        step = f"Select '{value}' in {target}" if event.get("tag") == "select" else f"Enter '{value}' in {target}"
+    elif kind == "submit":
+        step = f"Submit {target}"
+    elif kind == "keydown":
+        step = f"Press {event.get('key', 'key')} in {target}"
+    else:
+        step = f"{kind.capitalize()} {target}"
+    if event.get("selector"):
+        step += f" ({event['selector']})"
+    return step
+
+
+class CDPError(Exception):
+    """Raised when a DevTools command fails or the connection is lost"""
+
+
+class CDPEventLoop:
+    """Shared asyncio loop (one daemon thread) that runs every DevTools session"""
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name="cdp-event-loop", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def instance(cls):
+        """Return the process-wide loop, starting it on first use"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule a coroutine from any thread - returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and block the calling thread until it finishes"""
+        return self.submit(coro).result(timeout)
+
+
+class CDPConnection:
+    """Minimal DevTools WebSocket client on asyncio streams (no extra dependency)"""
+
+    def __init__(self, ws_url, on_event=None, on_close=None):
+        self.ws_url = ws_url
+        self.on_event = on_event  # on_event(method, params, session_id)
+        self.on_close = on_close  # Called once if the browser drops the connection
+        self.connected = False
+        self._reader = None
+        self._writer = None
+        self._write_lock = None
+        self._read_task = None
+        self._next_id = 0
+        self._pending = {}  # message id -> Future awaiting the reply
+        self._closing = False
+
+    async def connect(self, timeout=2.0):
+        """Open the TCP connection and perform the WebSocket upgrade"""
+        parsed = urlparse(self.ws_url)
+        host = parsed.hostname or "localhost"
+        port = parsed.port or 80
+        path = parsed.path or "/"
+        if parsed.query:
+            path += "?" + parsed.query
+
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port), timeout)
+        key = base64.b64encode(os.urandom(16)).decode()
+        handshake = (f"GET {path} HTTP/1.1\r\n"
+                     f"Host: {host}:{port}\r\n"
+                     "Upgrade: websocket\r\n"
+                     "Connection: Upgrade\r\n"
+                     f"Sec-WebSocket-Key: {key}\r\n"
+                     "Sec-WebSocket-Version: 13\r\n\r\n")
+        self._writer.write(handshake.encode())
+        await self._writer.drain()
+
+        response = await asyncio.wait_for(self._reader.readuntil(b"\r\n\r\n"), timeout)
+        lines = response.decode("latin-1").split("\r\n")
+        status = lines[0].split()
+        if len(status) < 2 or status[1] != "101":
+            self._writer.close()
+            raise CDPError(f"WebSocket upgrade refused: {lines[0]}")
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        expected = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        if headers.get("sec-websocket-accept") != expected:
+            self._writer.close()
+            raise CDPError("WebSocket handshake failed (bad Sec-WebSocket-Accept)")
+
+        self._write_lock = asyncio.Lock()
+        self.connected = True
+        self._read_task = asyncio.ensure_future(self._read_loop())
+
+    async def send(self, method, params=None, session_id=None, timeout=5.0):
+        """Send a DevTools command and wait for its result"""
+        if not self.connected:
+            raise CDPError("DevTools connection is closed")
+        self._next_id += 1
+        message_id = self._next_id
+        message = {"id": message_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            await self._write_frame(0x1, json.dumps(message).encode())
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._pending.pop(message_id, None)
+
+    async def close(self):
+        """Close the connection without triggering on_close"""
+        self._closing = True
+        if self.connected:
+            try:
+                await self._write_frame(0x8, struct.pack("!H", 1000))
+            except Exception:
+                pass
+        if self._read_task:
+            self._read_task.cancel()
+        self._connection_lost()
+
+    async def _write_frame(self, opcode, payload):
+        # Client frames must always be masked (RFC 6455 section 5.3)
+        header = bytearray([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header.append(0x80 | length)
+        elif length < 65536:
+            header.append(0x80 | 126)
+            header += struct.pack("!H", length)
+        else:
+            header.append(0x80 | 127)
+            header += struct.pack("!Q", length)
+        mask = os.urandom(4)
+        header += mask
+        async with self._write_lock:
+            self._writer.write(bytes(header) + self._apply_mask(payload, mask))
+            await self._writer.drain()
+
+    @staticmethod
+    def _apply_mask(payload, mask):
+        """XOR payload with the 4-byte mask (done as one big-int operation for speed)"""
+        length = len(payload)
+        if not length:
+            return b""
+        key = (mask * (length // 4 + 1))[:length]
+        return (int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")).to_bytes(length, "big")
+
+    async def _read_frame(self):
+        head = await self._reader.readexactly(2)
+        fin = bool(head[0] & 0x80)
+        opcode = head[0] & 0x0F
+        length = head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack("!H", await self._reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack("!Q", await self._reader.readexactly(8))[0]
+        mask = await self._reader.readexactly(4) if head[1] & 0x80 else None
+        payload = await self._reader.readexactly(length) if length else b""
+        if mask:
+            payload = self._apply_mask(payload, mask)
+        return fin, opcode, payload
+
+    async def _read_loop(self):
+        """Read frames until the connection closes, dispatching replies and events"""
+        fragments = []
+        try:
+            while True:
+                fin, opcode, payload = await self._read_frame()
+                if opcode == 0x9:  # Ping
+                    await self._write_frame(0xA, payload)
+                    continue
+                if opcode == 0xA:  # Pong
+                    continue
+                if opcode == 0x8:  # Close
+                    break
+                fragments.append(payload)
+                if not fin:
+                    continue
+                data = b"".join(fragments)
+                fragments = []
+                try:
+                    message = json.loads(data.decode("utf-8"))
+                except ValueError:
+                    continue
+                self._dispatch(message)
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError, OSError):
+            pass
+        finally:
+            self._connection_lost()
+
+    def _dispatch(self, message):
+        if "id" in message:
+            future = self._pending.get(message["id"])
+            if future and not future.done():
+                if "error" in message:
+                    future.set_exception(CDPError(message["error"].get("message", "DevTools error")))
+                else:
+                    future.set_result(message.get("result", {}))
+        elif self.on_event:
+            try:
+                self.on_event(message.get("method", ""), message.get("params", {}), message.get("sessionId"))
+            except Exception:
+                pass  # A faulty handler must not kill the read loop
+
+    def _connection_lost(self):
+        was_connected = self.connected
+        self.connected = False
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(CDPError("DevTools connection closed"))
+        self._pending.clear()
+        if self._writer:
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+        if was_connected and not self._closing and self.on_close:
+            try:
+                self.on_close()
+            except Exception:
+                pass
+
+
+class CDPNavigationTracker:
+    """Subscribes to one browser's DevTools target/page events and pushes URL changes as they happen"""
+
+    def __init__(self, ws_url, on_navigation, on_close=None, on_dom_event=None, dom_capture=False):
+        self.ws_url = ws_url
+        self.on_navigation = on_navigation  # on_navigation(url, target_id)
+        self.on_close = on_close  # on_close(tracker)
+        self.on_dom_event = on_dom_event  # on_dom_event(event, target_id) for in-page captured events
+        self.dom_capture = dom_capture  # Inject DOM_CAPTURE_SCRIPT into attached tabs
+        self.capture_scripts = {}  # sessionId -> addScriptToEvaluateOnNewDocument identifier
+        self.connection = None
+        self.targets = {}  # targetId -> targetInfo for page targets
+        self.sessions = {}  # sessionId -> targetId
+        self.target_sessions = {}  # targetId -> sessionId
+        self.main_frames = {}  # sessionId -> main frame id
+        self.active_target_id = None
+        self.has_focus = False  # Active tab had keyboard focus at the last resolve_active_url()
+        self.last_event_time = 0
+
+    @property
+    def connected(self):
+        return bool(self.connection and self.connection.connected)
+
+    async def start(self, timeout=2.0):
+        """Connect and subscribe - existing tabs arrive as Target.targetCreated events"""
+        self.connection = CDPConnection(self.ws_url, on_event=self._on_event,
+                                        on_close=self._on_connection_closed)
+        await self.connection.connect(timeout)
+        await self.connection.send("Target.setDiscoverTargets", {"discover": True}, timeout=timeout)
+
+    async def stop(self):
+        if self.connection:
+            await self.connection.close()
+
+    def _on_connection_closed(self):
+        if self.on_close:
+            self.on_close(self)
+
+    async def _attach(self, target_id):
+        """Attach to a page target with a flat session and enable Page events on it"""
+        if target_id in self.target_sessions:
+            return
+        self.target_sessions[target_id] = None  # Attach in progress
+        try:
+            result = await self.connection.send("Target.attachToTarget",
+                                                {"targetId": target_id, "flatten": True})
+            session_id = result.get("sessionId")
+            self.sessions[session_id] = target_id
+            self.target_sessions[target_id] = session_id
+            await self.connection.send("Page.enable", session_id=session_id)
+            if self.dom_capture:
+                await self._install_capture(session_id)
+        except Exception:
+            self.target_sessions.pop(target_id, None)
+    
+    async def _install_capture(self, session_id):
+        """Inject the DOM event capture script into a tab - the current document and every later one"""
+        await self.connection.send("Runtime.addBinding", {"name": DOM_CAPTURE_BINDING}, session_id=session_id)
+        result = await self.connection.send("Page.addScriptToEvaluateOnNewDocument",
+                                            {"source": DOM_CAPTURE_SCRIPT}, session_id=session_id)
+        self.capture_scripts[session_id] = result.get("identifier")
+        await self.connection.send("Runtime.evaluate", {"expression": DOM_CAPTURE_SCRIPT}, session_id=session_id)
+    
+    async def _remove_capture(self, session_id):
+        """Stop reporting DOM events from a tab (listeners already in the page go quiet without the binding)"""
+        identifier = self.capture_scripts.pop(session_id, None)
+        if identifier:
+            await self.connection.send("Page.removeScriptToEvaluateOnNewDocument",
+                                       {"identifier": identifier}, session_id=session_id)
+        await self.connection.send("Runtime.removeBinding", {"name": DOM_CAPTURE_BINDING}, session_id=session_id)
+    
+    async def set_dom_capture(self, enabled):
+        """Turn in-page capture on/off for every attached tab (tabs attached later follow self.dom_capture)"""
+        self.dom_capture = enabled
+        change = self._install_capture if enabled else self._remove_capture
+        sessions = [s for s in self.target_sessions.values() if s]
+        await asyncio.gather(*(change(s) for s in sessions), return_exceptions=True)
+
+    def _on_event(self, method, params, session_id):
+        if method in ("Target.targetCreated", "Target.targetInfoChanged"):
+            info = params.get("targetInfo", {})
+            if info.get("type") != "page":
+                return
+            target_id = info.get("targetId")
+            self.targets[target_id] = info
+            if method == "Target.targetCreated":
+                asyncio.ensure_future(self._attach(target_id))
+        elif method == "Target.targetDestroyed":
+            target_id = params.get("targetId")
+            self.targets.pop(target_id, None)
+            session = self.target_sessions.pop(target_id, None)
+            self.sessions.pop(session, None)
+            self.main_frames.pop(session, None)
+            if self.active_target_id == target_id:
+                self.active_target_id = None
+        elif method == "Target.detachedFromTarget":
+            target_id = self.sessions.pop(params.get("sessionId"), None)
+            self.target_sessions.pop(target_id, None)
+        elif method == "Page.frameNavigated":
+            frame = params.get("frame", {})
+            if frame.get("parentId"):
+                return  # Sub-frame (iframe) navigation - not the page URL
+            self.main_frames[session_id] = frame.get("id")
+            url = frame.get("url", "") + frame.get("urlFragment", "")
+            self._navigated(self.sessions.get(session_id), url)
+        elif method == "Page.navigatedWithinDocument":
+            # Same-document navigation (history.pushState / hash change in SPAs)
+            target_id = self.sessions.get(session_id)
+            if params.get("frameId") == self.main_frames.get(session_id, target_id):
+                self._navigated(target_id, params.get("url", ""))
+        elif method == "Runtime.bindingCalled" and params.get("name") == DOM_CAPTURE_BINDING:
+            target_id = self.sessions.get(session_id)
+            try:
+                event = json.loads(params.get("payload", ""))
+            except ValueError:
+                return
+            # The user is interacting with this tab - it is the active one
+            self.active_target_id = target_id or self.active_target_id
+            self.has_focus = True
+            if self.on_dom_event and isinstance(event, dict):
+                try:
+                    self.on_dom_event(event, target_id)
+                except Exception:
+                    pass
+
+    def _navigated(self, target_id, url):
+        if not target_id or not url:
+            return
+        if target_id in self.targets:
+            self.targets[target_id]["url"] = url
+        if self.active_target_id in (None, target_id):
+            self._publish(target_id, url)
+        else:
+            # Navigation in another tab - only follow it if that tab is the one on screen
+            asyncio.ensure_future(self._publish_if_visible(target_id, url))
+
+    async def _publish_if_visible(self, target_id, url):
+        session_id = self.target_sessions.get(target_id)
+        try:
+            result = await self.connection.send("Runtime.evaluate",
+                                                {"expression": "document.visibilityState",
+                                                 "returnByValue": True},
+                                                session_id=session_id, timeout=1.0)
+            if result.get("result", {}).get("value") != "visible":
+                return
+        except Exception:
+            pass  # Can't tell - assume the user is looking at it
+        self._publish(target_id, url)
+
+    async def resolve_active_url(self):
+        """Ask every attached tab whether it is visible (and focused) and make that tab the active one - returns its URL"""
+        target_ids = [t for t, session in self.target_sessions.items() if session]
+        
+        async def visibility(target_id):
+            try:
+                result = await self.connection.send(
+                    "Runtime.evaluate",
+                    {"expression": "document.visibilityState + (document.hasFocus() ? ' focused' : '')",
+                     "returnByValue": True},
+                    session_id=self.target_sessions.get(target_id), timeout=1.0)
+                return result.get("result", {}).get("value")
+            except Exception:
+                return None
+        
+        states = await asyncio.gather(*(visibility(t) for t in target_ids))
+        visible = [t for t, state in zip(target_ids, states) if state and state.startswith("visible")]
+        focused = [t for t, state in zip(target_ids, states) if state == "visible focused"]
+        self.has_focus = bool(focused)
+        if focused:
+            target_id = focused[0]
+        elif self.active_target_id in visible:
+            target_id = self.active_target_id
+        elif visible:
+            target_id = visible[0]
+        else:
+            target_id = self.active_target_id
+        if target_id is None or target_id not in self.targets:
+            return None
+        self.active_target_id = target_id
+        return self.targets[target_id].get("url")
+
+    def _publish(self, target_id, url):
+        self.active_target_id = target_id
+        self.last_event_time = time.time()
+        try:
+            self.on_navigation(url, target_id)
+        except Exception:
+            pass
+
+
+class DevToolsClient:
+    """Shared DevTools HTTP client - one keep-alive http.client connection per port, with latency counters"""
+
+    def __init__(self, host="localhost", timeout=DEVTOOLS_HTTP_TIMEOUT):
+        self.host = host
+        self.timeout = timeout  # Default for every DevTools HTTP request
+        self._connections = {}  # port -> HTTPConnection (kept open between polls)
+        self._port_locks = {}  # port -> Lock (an HTTPConnection is not thread-safe)
+        self._lock = threading.Lock()
+        self._stats = {}  # port -> counters, see get_stats()
+
+    def _port_lock(self, port):
+        with self._lock:
+            if port not in self._port_locks:
+                self._port_locks[port] = threading.Lock()
+                self._stats[port] = {"requests": 0, "failures": 0, "connects": 0,
+                                     "total_ms": 0.0, "last_ms": 0.0, "max_ms": 0.0}
+            return self._port_locks[port]
+
+    def get_json(self, port, path="/json", timeout=None):
+        """GET a DevTools JSON endpoint, reusing the port's connection and reconnecting once if it went stale"""
+        timeout = timeout or self.timeout
+        with self._port_lock(port):
+            stats = self._stats[port]
+            started = time.perf_counter()
+            conn = self._connections.get(port)
+            reused = conn is not None
+            while True:
+                if conn is None:
+                    conn = http.client.HTTPConnection(self.host, port, timeout=timeout)
+                    self._connections[port] = conn
+                    stats["connects"] += 1
+                try:
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    conn.request("GET", path)
+                    response = conn.getresponse()
+                    body = response.read()
+                    if response.status != 200:
+                        raise CDPError(f"DevTools HTTP {response.status} for {path}")
+                    data = json.loads(body.decode())
+                    break
+                except (http.client.HTTPException, OSError, ValueError) as e:
+                    conn.close()
+                    self._connections.pop(port, None)
+                    conn = None
+                    if reused and not isinstance(e, (socket.timeout, ValueError)):
+                        reused = False  # Stale keep-alive connection - retry once on a fresh one
+                        continue
+                    stats["failures"] += 1
+                    raise
+                except CDPError:
+                    stats["failures"] += 1
+                    raise
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            stats["requests"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["last_ms"] = elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            return data
+
+    def get_stats(self):
+        """Snapshot of per-port counters: requests, failures, connects and avg/last/max latency in ms"""
+        with self._lock:
+            snapshot = {}
+            for port, stats in self._stats.items():
+                if not stats["requests"] and not stats["failures"]:
+                    continue
+                entry = dict(stats)
+                entry["avg_ms"] = stats["total_ms"] / stats["requests"] if stats["requests"] else 0.0
+                snapshot[port] = entry
+            return snapshot
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections.values():
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._connections.clear()
+
+
+class DevToolsPortScanner:
+    """Finds DevTools endpoints by probing all candidate ports at once and remembering the port that answered"""
+
+    def __init__(self, ports=None, client=None, max_workers=16):
+        self.ports = list(ports) if ports else list(DEVTOOLS_PORTS)
+        self.client = client or DevToolsClient()
+        self.max_workers = max_workers
+        self.last_good_port = None  # Sticky port - tried alone before any rescan
+        self.last_answer_time = 0  # time.monotonic() of the last successful probe
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def set_ports(self, ports):
+        """Replace the candidate port list (e.g. from the Setup tab)"""
+        self.ports = list(ports)
+        if self.last_good_port not in self.ports:
+            self.last_good_port = None
+
+    def add_port(self, port, sticky=False):
+        """Add a single port (e.g. one a launched browser picked) and optionally try it first"""
+        if port not in self.ports:
+            self.ports.append(port)
+        if sticky:
+            self.last_good_port = port
+
+    def _pool(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="devtools-probe")
+            return self._executor
+
+    def _fetch(self, port, path, timeout):
+        data = self.client.get_json(port, path, timeout)
+        self.last_answer_time = time.monotonic()
+        return data
+
+    def _probe_all(self, path, timeout, exclude=None, ports=None):
+        """Yield (port, data) for every answering port as soon as each probe completes"""
+        futures = {self._pool().submit(self._fetch, port, path, timeout): port
+                   for port in (self.ports if ports is None else ports) if port != exclude}
+        for future in as_completed(futures):
+            try:
+                data = future.result()
+            except Exception:
+                continue  # Nothing listening (or not DevTools) on this port
+            yield futures[future], data
+
+    def scan(self, path="/json", timeout=None, ports=None):
+        """Probe every candidate port (or just `ports`) concurrently - returns [(port, data)] in port order"""
+        order = {port: i for i, port in enumerate(self.ports)}
+        return sorted(self._probe_all(path, timeout, ports=ports), key=lambda item: order.get(item[0], len(order)))
+
+    def iter_responses(self, path="/json", timeout=None):
+        """Yield (port, data) starting with the sticky port; other ports are scanned only if the caller keeps going"""
+        sticky = self.last_good_port
+        if sticky is not None:
+            try:
+                data = self._fetch(sticky, path, timeout)
+                yield sticky, data
+            except Exception:
+                self.last_good_port = None  # Stopped answering - rescan below
+        # Fastest answer first, so one hung port can't stall discovery
+        for port, data in self._probe_all(path, timeout, exclude=sticky):
+            self.last_good_port = port
+            yield port, data
+
+
+# Browser name (and optional profile) that browsers append to window titles
+BROWSER_TITLE_SUFFIX = re.compile(
+    r"(\s+and \d+ more pages?)?(\s+[-\u2013\u2014]\s+[^-\u2013\u2014]+)?\s+[-\u2013\u2014]\s+"
+    r"(google chrome|chromium|microsoft\u200b?\s*edge|brave|vivaldi|opera)\s*$", re.IGNORECASE)
+
+
+class TargetIndex:
+    """DevTools page targets of one browser keyed by target id, updated from per-refresh diffs.
+    The active tab is tracked explicitly, so resolving it only looks at what changed."""
+
+    def __init__(self):
+        self.targets = {}  # target id -> (type, url, title)
+        self.by_title = {}  # lower-cased title -> set of target ids (O(1) window-title matching)
+        self.active_id = None
+        self.last_window_title = None
+        self.first_page_id = None  # First http(s) page in /json order (Chrome lists most recently used first)
+        self.title_matched = False  # Last resolve found the foreground window's tab in this browser
+        self.changes_applied = 0
+
+    @staticmethod
+    def _is_web_page(entry):
+        return entry[0] == 'page' and (entry[1].startswith('http://') or entry[1].startswith('https://'))
+
+    def _index_title(self, target_id, title):
+        self.by_title.setdefault(title.lower(), set()).add(target_id)
+
+    def _unindex_title(self, target_id, title):
+        ids = self.by_title.get(title.lower())
+        if ids:
+            ids.discard(target_id)
+            if not ids:
+                del self.by_title[title.lower()]
+
+    def apply(self, tabs):
+        """Diff a /json tab list against the index - returns (added, removed, changed) target ids"""
+        added, changed = [], []
+        seen = set()
+        self.first_page_id = None
+        for tab in tabs:
+            target_id = tab.get('id')
+            if not target_id:
+                continue
+            seen.add(target_id)
+            entry = (tab.get('type', ''), tab.get('url', ''), tab.get('title', ''))
+            if self.first_page_id is None and self._is_web_page(entry):
+                self.first_page_id = target_id
+            old = self.targets.get(target_id)
+            if old == entry:
+                continue
+            if old is None:
+                added.append(target_id)
+            else:
+                changed.append(target_id)
+                self._unindex_title(target_id, old[2])
+            self.targets[target_id] = entry
+            self._index_title(target_id, entry[2])
+        removed = list(self.targets.keys() - seen)
+        for target_id in removed:
+            self._unindex_title(target_id, self.targets.pop(target_id)[2])
+            if target_id == self.active_id:
+                self.active_id = None
+        self.changes_applied += len(added) + len(removed) + len(changed)
+        return added, removed, changed
+
+    def _title_candidates(self, window_title):
+        """'Page - Profile - Google Chrome' -> 'page - profile', then 'page'"""
+        title = BROWSER_TITLE_SUFFIX.sub("", window_title).strip().lower()
+        yield title
+        for _ in range(2):
+            if " - " not in title:
+                break
+            title = title.rsplit(" - ", 1)[0]
+            yield title
+
+    def resolve_active(self, window_title, touched):
+        """Pick the active target using the foreground window title and the ids touched by the last diff"""
+        active = self.targets.get(self.active_id)
+        title_changed = window_title != self.last_window_title
+        self.last_window_title = window_title
+        
+        # Same window title and the active tab still exists - nothing to resolve
+        if active and self._is_web_page(active) and window_title and not title_changed:
+            return self.active_id
+        
+        self.title_matched = False
+        if window_title:
+            for candidate in self._title_candidates(window_title):
+                ids = [t for t in self.by_title.get(candidate, ()) if self._is_web_page(self.targets[t])]
+                if ids:
+                    self.title_matched = True
+                    # Prefer the current tab, then a tab that just changed
+                    for target_id in ids:
+                        if target_id == self.active_id:
+                            return target_id
+                    for target_id in ids:
+                        if target_id in touched:
+                            return target_id
+                    return ids[0]
+        
+        # No usable window title - most recently used web page
+        return self.first_page_id
+
+    def refresh(self, tabs, window_title=None):
+        """Apply a /json refresh and return the active tab URL (None if there is no web page)"""
+        added, removed, changed = self.apply(tabs)
+        self.active_id = self.resolve_active(window_title, set(added) | set(changed))
+        active = self.targets.get(self.active_id)
+        return active[1] if active else None
+
+
+# Window titles that belong to a browser (foreground-window tracking)
+BROWSER_WINDOW_KEYWORDS = ['chrome', 'chromium', 'edge', 'microsoft edge', 'firefox']
+
+
+class FocusBackend:
+    """Foreground window title source. start(on_change) delivers on_change(title) from a
+    background thread whenever the focused window or its title changes; get_title() reads
+    the current title on demand. Subclasses are picked by create_focus_backend(). Failures on the
+    background thread go to on_error(message) - the app log - or stdout without one."""
+    
+    name = "none"
+    event_driven = False
+
+    def __init__(self):
+        self.on_change = None
+        self.on_error = None
+        self.title = ""  # Last title seen
+        self.changes = 0  # Title changes delivered
+
+    def get_title(self):
+        return ""
+
+    def start(self, on_change):
+        self.on_change = on_change
+        return False
+
+    def stop(self):
+        self.on_change = None
+
+    def _deliver(self, title):
+        if title == self.title:
+            return
+        self.title = title
+        self.changes += 1
+        on_change = self.on_change
+        if on_change:
+            try:
+                on_change(title)
+            except Exception as e:
+                self._report(f"Window title handler failed: {e}")
+
+    def _report(self, message):
+        on_error = self.on_error
+        if on_error:
+            try:
+                on_error(message)
+                return
+            except Exception:
+                pass
+        print(message)
+
+
+class Win32FocusBackend(FocusBackend):
+    """Windows: GetForegroundWindow/GetWindowText, checked every `interval` seconds while started"""
+    
+    name = "win32"
+
+    def __init__(self, interval=0.5):
+        super().__init__()
+        self.interval = interval
+        self._stop = None  # Event of the running poll thread
+
+    def get_title(self):
+        try:
+            import win32gui
+            return win32gui.GetWindowText(win32gui.GetForegroundWindow())
+        except:
+            return ""
+
+    def start(self, on_change):
+        self.stop()
+        self.on_change = on_change
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, args=(self._stop,), daemon=True).start()
+        return True
+
+    def stop(self):
+        super().stop()
+        if self._stop:
+            self._stop.set()
+            self._stop = None
+
+    def _run(self, stop):
+        while not stop.is_set():
+            title = self.get_title()
+            if title:
+                self._deliver(title)
+            stop.wait(self.interval)
+
+
+class X11FocusBackend(FocusBackend):
+    """X11 (EWMH window managers): PropertyNotify on the root window's _NET_ACTIVE_WINDOW and on the
+    active window's _NET_WM_NAME/WM_NAME - titles are pushed as they change, nothing is polled"""
+    
+    name = "x11"
+    event_driven = True
+
+    def __init__(self, display_name=None):
+        super().__init__()
+        self.display_name = display_name
+        self._stop = None  # (event, wake pipe write end) of the running event thread
+
+    def get_title(self):
+        if self._stop:
+            return self.title  # Kept current by the event thread
+        try:
+            d = xdisplay.Display(self.display_name)
+            try:
+                atoms = self._atoms(d)
+                window = self._active_window(d, d.screen().root, atoms)
+                return self._window_title(window, atoms) if window else ""
+            finally:
+                d.close()
+        except Exception:
+            return ""
+
+    def start(self, on_change):
+        self.stop()
+        self.on_change = on_change
+        try:
+            d = xdisplay.Display(self.display_name)  # Owned by the event thread from here on
+        except Exception as e:
+            self._report(f"X11 focus tracking unavailable: {e} - window changes are not followed")
+            return False
+        stop, (wake_r, wake_w) = threading.Event(), os.pipe()
+        self._stop = (stop, wake_w)
+        threading.Thread(target=self._run, args=(d, stop, wake_r), daemon=True).start()
+        return True
+
+    def stop(self):
+        super().stop()
+        if self._stop:
+            stop, wake_w = self._stop
+            self._stop = None
+            stop.set()
+            try:
+                os.write(wake_w, b"x")  # Release select()
+            except OSError:
+                pass
+            os.close(wake_w)
+
+    @staticmethod
+    def _atoms(d):
+        return {name: d.intern_atom(name) for name in ("_NET_ACTIVE_WINDOW", "_NET_WM_NAME", "UTF8_STRING", "WM_NAME")}
+
+    @staticmethod
+    def _active_window(d, root, atoms):
+        prop = root.get_full_property(atoms["_NET_ACTIVE_WINDOW"], X.AnyPropertyType)
+        if not prop or not prop.value or not prop.value[0]:
+            return None
+        return d.create_resource_object('window', prop.value[0])
+
+    @staticmethod
+    def _window_title(window, atoms):
+        try:
+            prop = window.get_full_property(atoms["_NET_WM_NAME"], atoms["UTF8_STRING"])
+            if prop and prop.value:
+                value = prop.value
+                return value.decode("utf-8", "replace") if isinstance(value, bytes) else str(value)
+            name = window.get_wm_name()
+            if isinstance(name, bytes):
+                name = name.decode("latin-1", "replace")
+            return name or ""
+        except xerror.XError:
+            return ""  # Window already gone
+
+    def _run(self, d, stop, wake_r):
+        import select
+        root = d.screen().root
+        atoms = self._atoms(d)
+        title_atoms = (atoms["_NET_WM_NAME"], atoms["WM_NAME"])
+        d.set_error_handler(lambda *args: None)  # Windows vanish between events - BadWindow is expected
+        root.change_attributes(event_mask=X.PropertyChangeMask)
+        active = None
+        
+        def follow_active():
+            nonlocal active
+            window = self._active_window(d, root, atoms)
+            if active is not None and (window is None or window.id != active.id):
+                try:
+                    active.change_attributes(event_mask=X.NoEventMask)
+                except xerror.XError:
+                    pass
+            if window is not None and (active is None or window.id != active.id):
+                try:
+                    window.change_attributes(event_mask=X.PropertyChangeMask)
+                except xerror.XError:
+                    window = None
+            active = window
+            d.flush()
+            self._deliver(self._window_title(active, atoms) if active else "")
+        
+        try:
+            follow_active()
+            while not stop.is_set():
+                while d.pending_events():
+                    event = d.next_event()
+                    if event.type != X.PropertyNotify:
+                        continue
+                    if event.window.id == root.id and event.atom == atoms["_NET_ACTIVE_WINDOW"]:
+                        follow_active()
+                    elif active is not None and event.window.id == active.id and event.atom in title_atoms:
+                        self._deliver(self._window_title(active, atoms))
+                select.select([d.fileno(), wake_r], [], [])
+        except Exception as e:
+            self._report(f"X11 focus tracking stopped: {e} - window changes are no longer followed")
+        finally:
+            os.close(wake_r)  # The write end belongs to stop()
+            try:
+                d.close()
+            except Exception:
+                pass
+
+
+def create_focus_backend():
+    """Focus/title backend for this platform (FocusBackend that reports nothing if none applies)"""
+    if sys.platform == "win32":
+        return Win32FocusBackend()
+    if XLIB_AVAILABLE and os.environ.get("DISPLAY"):
+        return X11FocusBackend()
+    return FocusBackend()
+
+
+class PollScheduler:
+    """Activity-aware poll interval: fast right after user input, exponential backoff while idle,
+    parked (no wakeups at all) once no browser answers"""
+
+    def __init__(self, fast_interval=0.25, active_window=3.0, idle_interval=1.0,
+                 max_interval=16.0, backoff=2.0, park_after_misses=3):
+        self.fast_interval = fast_interval  # Seconds between polls right after input
+        self.active_window = active_window  # How long input keeps polling fast
+        self.idle_interval = idle_interval  # First interval once input stops
+        self.max_interval = max_interval  # Backoff ceiling while idle
+        self.backoff = backoff  # Interval multiplier per idle poll
+        self.park_after_misses = park_after_misses  # Consecutive polls with no browser before parking
+        self._wake = threading.Event()
+        self._poll_times = deque(maxlen=240)
+        self.reset()
+
+    def reset(self):
+        self.last_activity = 0.0
+        self.current_interval = self.idle_interval
+        self.misses = 0
+        self.parked = False
+        self._poll_times.clear()
+
+    def note_activity(self):
+        """Called from input listener threads - cheap, only signals when the poller is slow or parked"""
+        self.last_activity = time.monotonic()
+        if self.parked or self.current_interval > self.fast_interval:
+            self.misses = 0
+            self.parked = False
+            self.current_interval = self.fast_interval
+            self._wake.set()
+
+    def wake(self):
+        """Release a waiting poller immediately (e.g. on stop or an explicit re-check)"""
+        self._wake.set()
+
+    def record_poll(self, browser_found):
+        """Update the schedule after a poll"""
+        now = time.monotonic()
+        self._poll_times.append(now)
+        if browser_found:
+            self.misses = 0
+            self.parked = False
+        else:
+            self.misses += 1
+            self.parked = self.misses >= self.park_after_misses
+        if now - self.last_activity < self.active_window:
+            self.current_interval = self.fast_interval
+        elif self.current_interval < self.idle_interval:
+            self.current_interval = self.idle_interval
+        else:
+            self.current_interval = min(self.current_interval * self.backoff, self.max_interval)
+
+    def wait(self):
+        """Sleep until the next poll is due (or indefinitely while parked) - returns early on wake()"""
+        self._wake.wait(None if self.parked else self.current_interval)
+        self._wake.clear()
+
+    def poll_rate(self, window=60.0):
+        """Observed polls per second over the last `window` seconds"""
+        cutoff = time.monotonic() - window
+        recent = [t for t in self._poll_times if t >= cutoff]
+        return len(recent) / window
+
+    def get_state(self):
+        """Schedule parameters and live state, for display/logging"""
+        return {
+            "fast_interval": self.fast_interval,
+            "active_window": self.active_window,
+            "idle_interval": self.idle_interval,
+            "max_interval": self.max_interval,
+            "backoff": self.backoff,
+            "park_after_misses": self.park_after_misses,
+            "current_interval": self.current_interval,
+            "parked": self.parked,
+            "polls_per_second": self.poll_rate(),
+        }
+
+
+# Whether input should be captured, decided once per URL / base URL / manual override change.
+# Listener threads read BrowserMonitor.target (one attribute load) instead of re-checking URLs per event.
+TargetVerdict = namedtuple("TargetVerdict", "url base_url manual has_url on_target continuity")
+
+
+def compute_target_verdict(url, base_url, last_valid_url, manual):
+    """Snapshot for the current URL state (on_target = URL is under base_url or there is no base_url yet;
+    continuity = the last valid URL was, which keeps capture going while a login redirect settles)"""
+    return TargetVerdict(
+        url=url,
+        base_url=base_url,
+        manual=bool(manual),
+        has_url=bool(url),
+        on_target=bool(url) and (not base_url or url.startswith(base_url)),
+        continuity=bool(url and last_valid_url) and (not base_url or last_valid_url.startswith(base_url)),
+    )
+
+
+class BrowserInstance:
+    """One monitored browser (DevTools endpoint) with its own URL/module/page state"""
+    
+    # User-Agent tokens checked in order (Edge/Opera/Vivaldi agents also contain "Chrome/")
+    UA_NAMES = (("Edg/", "Edge"), ("OPR/", "Opera"), ("Vivaldi/", "Vivaldi"), ("Brave", "Brave"),
+                ("HeadlessChrome/", "Headless Chrome"), ("Chrome/", "Chrome"))
+    
+    def __init__(self, port=None, label=None):
+        self.port = port  # None for the window-title fallback (no DevTools endpoint)
+        self.label = label or (f"Browser :{port}" if port else "Browser")
+        self.fixed_label = bool(label)  # Named by the launcher - keep it instead of the User-Agent name
+        self.tracker = None  # CDPNavigationTracker while an event-driven session is open
+        self.target_index = TargetIndex()  # Tabs from /json while polling
+        self.current_url = ""
+        self.last_url = ""
+        self.current_module = ""
+        self.current_page = ""
+        self.active_target_id = None
+        self.last_seen = 0  # time.monotonic() the endpoint last answered
+    
+    @property
+    def tracked(self):
+        return bool(self.tracker and self.tracker.connected)
+    
+    def update_label(self, version_info):
+        """Name the browser from its /json/version answer, e.g. 'Edge :9223'"""
+        if self.fixed_label or not isinstance(version_info, dict):
+            return
+        agent = f"{version_info.get('User-Agent', '')} {version_info.get('Browser', '')}"
+        for token, name in self.UA_NAMES:
+            if token in agent:
+                self.label = f"{name} :{self.port}"
+                return
+
+
 class BrowserMonitor:
-    """Monitors browser URLs and navigation"""
+    """Monitors browser URLs and navigation - every browser with a DevTools endpoint at once"""
     
-    def __init__(self, callback, base_url=BASE_URL):
+    def __init__(self, callback, base_url=BASE_URL, ports=None):
         self.callback = callback
+        self._current_url = ""
+        self._base_url = base_url
+        self._last_valid_url = None
+        self._manual_override = False
+        self.target = compute_target_verdict("", base_url or BASE_URL, None, False)
         self.base_url = base_url
+        self.port_scanner = DevToolsPortScanner(ports)
+        self.devtools_client = self.port_scanner.client  # Shared keep-alive client (latency counters)
+        self.scheduler = PollScheduler()  # Adaptive interval for the polling fallback
+        self.focus = create_focus_backend()  # Foreground window title (Win32 / X11)
         self.monitoring = False
+        # current_url/module/page mirror the active browser (the one the user is working in)
         self.current_url = ""
         self.last_url = ""
         self.last_valid_url = None  # Track last valid URL for action capture continuity
@@ -76,17 +1376,100 @@ class BrowserMonitor:
         self.driver = None
         self.monitor_thread = None
         self.current_tab = None
-        
-    def start_monitoring(self):
-        """Start monitoring browser URLs"""
-        self.monitoring = True
-        self.monitor_thread = threading.Thread(target=self._monitor_urls, daemon=True)
-        self.monitor_thread.start()
+        self.browsers = {}  # port -> BrowserInstance (None = window-title fallback without DevTools)
+        self.active_browser = None
+        self.active_target_id = None  # DevTools target id of the tab the current URL came from
+        self._discovery_due = True  # Look for browsers on the next monitor pass
+        self.dom_capture = False  # In-page DOM event capture (DOM_CAPTURE_SCRIPT) in every session
+        self.on_dom_event = None  # on_dom_event(event, browser_label)
+        self._cdp_state_changed = threading.Event()  # Wakes the monitor thread (session dropped, port added, stop)
+        self._url_lock = threading.RLock()  # URL changes arrive from the monitor, DevTools and UI threads
+        # Click/Enter-triggered re-checks (debounced so a burst of input costs one probe)
+        self._refresh_cond = threading.Condition()
+        self._refresh_due = None  # time.monotonic() when the pending re-check should run
+        self._refresh_deadline = None  # Upper bound so a long burst can't postpone it forever
+        self._refresh_callbacks = []  # on_done(url) for steps waiting on the re-check
+        self._refresh_thread = None  # _refresh_worker thread (None once it has exited)
+        self.refresh_count = 0  # Probes actually run
+        self.refresh_requests = 0  # Re-checks requested (>= refresh_count thanks to debouncing)
+        
+    # URL state that decides capture - every write republishes the target verdict
+    
+    @property
+    def current_url(self):
+        return self._current_url
+    
+    @current_url.setter
+    def current_url(self, url):
+        self._current_url = url
+        self._publish_target()
+    
+    @property
+    def base_url(self):
+        return self._base_url
+    
+    @base_url.setter
+    def base_url(self, base_url):
+        self._base_url = base_url
+        self._publish_target()
+    
+    @property
+    def last_valid_url(self):
+        return self._last_valid_url
+    
+    @last_valid_url.setter
+    def last_valid_url(self, url):
+        self._last_valid_url = url
+        self._publish_target()
+    
+    @property
+    def manual_override(self):
+        """URL set by hand - capture everything regardless of the URL"""
+        return self._manual_override
+    
+    @manual_override.setter
+    def manual_override(self, manual):
+        self._manual_override = manual
+        self._publish_target()
+    
+    def _publish_target(self):
+        """Recompute the capture verdict and swap it in as a new immutable snapshot"""
+        self.target = compute_target_verdict(self._current_url, self._base_url or BASE_URL,
+                                             self._last_valid_url, self._manual_override)
+    
+    def start_monitoring(self):
+        """Start monitoring browser URLs"""
+        self.monitoring = True
+        self._discovery_due = True
+        self._cdp_state_changed.clear()
+        self.scheduler.reset()
+        self.monitor_thread = threading.Thread(target=self._monitor_urls, daemon=True)
+        self.monitor_thread.start()
+        with self._refresh_cond:
+            # A worker still finishing after a quick stop/start sees monitoring again and carries on
+            if self._refresh_thread is None:
+                self._refresh_thread = threading.Thread(target=self._refresh_worker, name="url-refresh", daemon=True)
+                self._refresh_thread.start()
         return True
     
     def stop_monitoring(self):
         """Stop monitoring browser URLs"""
         self.monitoring = False
+        for browser in list(self.browsers.values()):
+            tracker, browser.tracker = browser.tracker, None
+            if tracker:
+                try:
+                    CDPEventLoop.instance().submit(tracker.stop())
+                except Exception:
+                    pass
+        self._cdp_state_changed.set()  # Release the monitor thread if it is parked
+        self.scheduler.wake()
+        with self._refresh_cond:
+            self._refresh_cond.notify_all()
+            refresh_thread = self._refresh_thread
+        if refresh_thread and refresh_thread is not threading.current_thread():
+            refresh_thread.join(URL_REFRESH_JOIN_TIMEOUT)
+        self._flush_refresh_callbacks(self.current_url)  # Don't drop steps waiting on a re-check
         if self.driver:
             try:
                 self.driver.quit()
@@ -94,72 +1477,309 @@ class BrowserMonitor:
                 pass
             self.driver = None
     
+    def _browser(self, port, label=None):
+        """Get (or register) the BrowserInstance for a DevTools port"""
+        browser = self.browsers.get(port)
+        if browser is None:
+            browser = self.browsers[port] = BrowserInstance(port, label)
+        elif label:
+            browser.label, browser.fixed_label = label, True
+        return browser
+    
+    def add_port(self, port, label=None):
+        """Watch a browser that reported its own DevTools port (e.g. one launched by the tool)"""
+        self.port_scanner.add_port(port, sticky=True)
+        self._browser(port, f"{label} :{port}" if label else None)
+        self._discovery_due = True
+        self.note_activity()
+        self._cdp_state_changed.set()  # Open its DevTools session now, even if the monitor is parked
+    
+    def several_browsers(self):
+        """True when more than one browser is monitored (steps then name the browser they came from)"""
+        return sum(1 for port in self.browsers if port is not None) > 1
+    
+    def active_label(self):
+        """Name of the browser the user is working in (None until one is seen)"""
+        return self.active_browser.label if self.active_browser else None
+    
     def _monitor_urls(self):
-        """Monitor URLs from active browser tabs"""
-        last_check_time = 0
-        check_count = 0
+        """Monitor URLs in every debug browser - event-driven via DevTools WebSocket, adaptive polling as fallback"""
+        last_discovery = 0
         last_window_title = ""  # Track window title for tab switch detection
         while self.monitoring:
             try:
                 current_time = time.time()
-                # Check URL every 2 seconds
-                if current_time - last_check_time >= 2:
-                    last_check_time = current_time
-                    check_count += 1
-                    
-                    # Log periodic check (every 10 checks = 20 seconds)
-                    if check_count % 10 == 0:
-                        if hasattr(self, 'callback') and self.callback:
-                            # Try to log through callback if available
-                            pass
-                    
-                    # Primary method: Chrome DevTools Protocol
-                    url = self._get_url_from_chrome_devtools()
+                poll_started = time.monotonic()
+                
+                # Look for new browsers and (re)open DevTools sessions every few seconds
+                endpoints = [b for port, b in self.browsers.items() if port is not None]
+                if self._discovery_due or not endpoints or current_time - last_discovery >= CDP_RECONNECT_INTERVAL:
+                    self._discovery_due = False
+                    last_discovery = current_time
+                    self._discover_browsers()
+                    endpoints = [b for port, b in self.browsers.items() if port is not None]
+                
+                # Event-driven mode: every browser pushes its navigations, so park until a
+                # session drops, a port is added or it is time to look for new browsers
+                if endpoints and all(b.tracked for b in endpoints):
+                    self._cdp_state_changed.wait(CDP_RECONNECT_INTERVAL)
+                    self._cdp_state_changed.clear()
+                    continue
+                
+                # Primary method: Chrome DevTools Protocol (browsers without a session are polled)
+                url = self._poll_browsers([b for b in endpoints if not b.tracked])
+                
+                # Fallback: Try to extract from window title (less reliable)
+                if not url and sys.platform == "win32":
+                    url = self._get_url_from_window_title()
                     if url:
-                        # Always update if URL is different (even slightly) - regardless of domain
-                        if url != self.current_url:
-                            self._handle_url_change(url)
-                        # Also update if current_url is empty
-                        elif not self.current_url:
-                                self._handle_url_change(url)
-                    elif not url and self.current_url:
-                        # URL might have changed to non-target URL, but keep monitoring
+                        # Allow URL changes from window title regardless of base_url
+                        self._handle_url_change(url, self._browser(None))
+                
+                # Also monitor window title for tab switches (when URL doesn't change)
+                if self.focus.name != "none" and url and url.startswith(self.base_url):
+                    try:
+                        current_title = self.focus.get_title()
+                        
+                        # Check if title changed (might indicate tab switch)
+                        if current_title and current_title != last_window_title and last_window_title:
+                            # Title changed - check if it's a tab switch
+                            tab_keywords = ["Accounts", "Users", "Notification"]
+                            for keyword in tab_keywords:
+                                if keyword in current_title and keyword not in last_window_title:
+                                    # Tab switch detected!
+                                    if self.callback:
+                                        navigation_action = f"Tab switched to '{keyword}' (URL unchanged: {url})"
+                                        self.callback(navigation_action, url, self.current_module, self.current_page,
+                                                      browser=self.active_label())
+                                    break
+                        
+                        last_window_title = current_title
+                    except:
                         pass
-                    
-                    # Fallback: Try to extract from window title (less reliable)
-                    if not url and sys.platform == "win32":
-                        url = self._get_url_from_window_title()
-                        if url and url != self.current_url:
-                            # Allow URL changes from window title regardless of base_url
-                            self._handle_url_change(url)
-                    
-                    # Also monitor window title for tab switches (when URL doesn't change)
-                    if sys.platform == "win32" and url and url.startswith(self.base_url):
-                        try:
-                            import win32gui
-                            hwnd = win32gui.GetForegroundWindow()
-                            current_title = win32gui.GetWindowText(hwnd)
-                            
-                            # Check if title changed (might indicate tab switch)
-                            if current_title and current_title != last_window_title and last_window_title:
-                                # Title changed - check if it's a tab switch
-                                tab_keywords = ["Accounts", "Users", "Notification"]
-                                for keyword in tab_keywords:
-                                    if keyword in current_title and keyword not in last_window_title:
-                                        # Tab switch detected!
-                                        if self.callback:
-                                            navigation_action = f"Tab switched to '{keyword}' (URL unchanged: {url})"
-                                            self.callback(navigation_action, url, self.current_module, self.current_page)
-                                        break
-                            
-                            last_window_title = current_title
-                        except:
-                            pass
+            
+                # Feed the scheduler: a browser counts as present if any DevTools port answered
+                browser_found = bool(url) or self.port_scanner.last_answer_time >= poll_started
+                self.scheduler.record_poll(browser_found)
                         
-            except Exception as e:
+            except Exception:
                 pass
             
-            time.sleep(1)  # Check every second
+            # Fast right after user input, backing off while idle, parked while no browser answers
+            self.scheduler.wait()
+    
+    def _discover_browsers(self):
+        """Probe every DevTools port, register the browsers that answer and open sessions for new ones"""
+        answering = dict(self.port_scanner.scan("/json/version"))
+        now = time.monotonic()
+        pending = []
+        for port, info in answering.items():
+            browser = self._browser(port)
+            browser.last_seen = now
+            browser.update_label(info)
+            ws_url = info.get("webSocketDebuggerUrl") if isinstance(info, dict) else None
+            if ws_url and not browser.tracked and self.monitoring:
+                pending.append((browser, ws_url))
+        # Browsers that went away (and have no live session) lose their state
+        for port, browser in list(self.browsers.items()):
+            if port is not None and port not in answering and not browser.tracked:
+                del self.browsers[port]
+                if self.active_browser is browser:
+                    self.active_browser = None
+        if pending:
+            self._start_cdp_tracking(pending)
+            # Sessions only push changes - read the page each new session's browser is on now
+            self._poll_browsers([browser for browser, ws_url in pending if browser.tracked])
+        return answering
+    
+    def _poll_browsers(self, browsers):
+        """Poll /json of browsers without a DevTools session - returns the active browser's URL"""
+        if not browsers:
+            return None
+        window_title = self._get_foreground_window_title()
+        found = None
+        for port, tabs in self.port_scanner.scan("/json", ports=[b.port for b in browsers]):
+            browser = self._browser(port)
+            try:
+                url = browser.target_index.refresh(tabs, window_title)
+            except Exception:
+                url = None
+            if not url:
+                continue
+            browser.active_target_id = browser.target_index.active_id
+            self._handle_url_change(url, browser)
+            if found is None or browser is self.active_browser:
+                found = url
+        return found
+    
+    def note_activity(self):
+        """User input happened (from ActionMonitor) - poll fast for a short while"""
+        self.scheduler.note_activity()
+    
+    def request_refresh(self, on_done=None):
+        """Ask for an immediate (debounced) re-check of the active URL, e.g. right after a click.
+        on_done(url) is called once the re-check has run, before any resulting navigation is reported."""
+        with self._refresh_cond:
+            self.refresh_requests += 1
+            if on_done:
+                self._refresh_callbacks.append(on_done)
+            now = time.monotonic()
+            if self._refresh_due is None:
+                self._refresh_deadline = now + URL_REFRESH_MAX_DELAY
+            self._refresh_due = min(now + URL_REFRESH_DEBOUNCE, self._refresh_deadline)
+            self._refresh_cond.notify()
+    
+    def after_pending_refresh(self, on_done):
+        """Call on_done(url) behind any steps still waiting on a re-check (keeps steps in order), or right away"""
+        with self._refresh_cond:
+            if self._refresh_callbacks:
+                self._refresh_callbacks.append(on_done)
+                return
+        on_done(None)
+    
+    def _refresh_worker(self):
+        """Run requested re-checks - every request that arrives before the probe collapses into it.
+        Decides to exit under _refresh_cond, where start_monitoring() checks whether a worker is running."""
+        while True:
+            with self._refresh_cond:
+                while self.monitoring and self._refresh_due is None:
+                    self._refresh_cond.wait()
+                if not self.monitoring:
+                    self._refresh_thread = None
+                    break
+                delay = self._refresh_due - time.monotonic()
+                if delay > 0:
+                    # Let the click's navigation commit (and further clicks join this probe)
+                    self._refresh_cond.wait(delay)
+                    continue
+                self._refresh_due = None
+            self.refresh_count += 1
+            try:
+                browser, url, focused = self._probe_active_url()
+                if url and (url.startswith('http://') or url.startswith('https://')):
+                    self._handle_url_change(url, browser, focused=focused)
+            except Exception:
+                pass
+            self._flush_refresh_callbacks(self.current_url)
+    
+    def _probe_active_url(self):
+        """One-off lookup of the tab the user is looking at, across all browsers - returns (browser, url, focused)"""
+        results = []  # (browser, url, focused)
+        tracked = [b for b in self.browsers.values() if b.tracked]
+        if tracked:
+            async def resolve_all():
+                return await asyncio.gather(*(b.tracker.resolve_active_url() for b in tracked),
+                                            return_exceptions=True)
+            try:
+                urls = CDPEventLoop.instance().run(resolve_all(), timeout=2)
+            except Exception:
+                urls = []
+            for browser, url in zip(tracked, urls):
+                if isinstance(url, str) and url:
+                    browser.active_target_id = browser.tracker.active_target_id
+                    results.append((browser, url, browser.tracker.has_focus))
+        
+        endpoints = [b for port, b in self.browsers.items() if port is not None]
+        polled = [b.port for b in endpoints if not b.tracked]
+        if polled or not endpoints:
+            window_title = self._get_foreground_window_title()
+            for port, tabs in self.port_scanner.scan("/json", ports=polled or None):
+                browser = self._browser(port)
+                try:
+                    url = browser.target_index.refresh(tabs, window_title)
+                except Exception:
+                    url = None
+                if url:
+                    browser.active_target_id = browser.target_index.active_id
+                    # The foreground window title names one of this browser's tabs - it has focus
+                    results.append((browser, url, browser.target_index.title_matched))
+        
+        if results:
+            focused = [r for r in results if r[2]]
+            for candidates in (focused, results):
+                for result in candidates:
+                    if result[0] is self.active_browser:
+                        return result
+                if candidates:
+                    return candidates[0]
+        if sys.platform == "win32":
+            url = self._get_url_from_window_title()
+            if url:
+                return self._browser(None), url, False
+        return None, None, False
+    
+    def _flush_refresh_callbacks(self, url):
+        with self._refresh_cond:
+            callbacks = self._refresh_callbacks
+            self._refresh_callbacks = []
+        for on_done in callbacks:
+            try:
+                on_done(url)
+            except Exception:
+                pass
+    
+    def _start_cdp_tracking(self, pending):
+        """Open DevTools WebSocket sessions [(browser, ws_url)] so navigations are pushed instead of polled.
+        All sessions share the single DevTools event loop thread."""
+        loop = CDPEventLoop.instance()
+        starting = []
+        for browser, ws_url in pending:
+            tracker = CDPNavigationTracker(
+                ws_url,
+                lambda url, target_id, browser=browser: self._on_cdp_navigation(browser, url, target_id),
+                lambda tracker, browser=browser: self._on_cdp_closed(browser, tracker),
+                on_dom_event=lambda event, target_id, browser=browser: self._on_dom_event(browser, event, target_id),
+                dom_capture=self.dom_capture)
+            starting.append((browser, tracker, loop.submit(tracker.start())))
+        deadline = time.monotonic() + 3
+        started = 0
+        for browser, tracker, future in starting:
+            try:
+                future.result(timeout=max(0.1, deadline - time.monotonic()))
+            except Exception:
+                future.cancel()
+                loop.submit(tracker.stop())
+                continue
+            if tracker.connected:
+                browser.tracker = tracker
+                started += 1
+        self._cdp_state_changed.clear()
+        return started
+    
+    def _on_cdp_navigation(self, browser, url, target_id):
+        """Navigation pushed by a browser's DevTools session (runs on the DevTools event loop thread)"""
+        browser.active_target_id = target_id
+        if self.monitoring and (url.startswith('http://') or url.startswith('https://')):
+            self._handle_url_change(url, browser)
+    
+    def set_dom_capture(self, enabled, on_dom_event=None):
+        """Turn in-page DOM event capture on/off in every browser session - returns how many browsers have a session"""
+        self.dom_capture = enabled
+        if on_dom_event:
+            self.on_dom_event = on_dom_event
+        tracked = [b for b in self.browsers.values() if b.tracked]
+        for browser in tracked:
+            try:
+                CDPEventLoop.instance().submit(browser.tracker.set_dom_capture(enabled))
+            except Exception:
+                pass
+        return len(tracked)
+    
+    def _on_dom_event(self, browser, event, target_id):
+        """DOM event reported by the in-page capture script (runs on the DevTools event loop thread)"""
+        browser.active_target_id = target_id or browser.active_target_id
+        url = event.get("url", "")
+        if browser is not self.active_browser and (url.startswith('http://') or url.startswith('https://')):
+            # The user is working in this browser now
+            self._handle_url_change(url, browser, focused=True)
+        if self.dom_capture and self.on_dom_event:
+            self.on_dom_event(event, browser.label)
+    
+    def _on_cdp_closed(self, browser, tracker):
+        """A DevTools session dropped - poll that browser until it can be re-opened"""
+        if browser.tracker is tracker:
+            browser.tracker = None
+        self._cdp_state_changed.set()
     
     def _get_url_from_window_title(self):
         """Try to extract URL from browser window title (fallback method) - improved to check all browser windows"""
@@ -228,113 +1848,61 @@ class BrowserMonitor:
     def _get_url_from_chrome_devtools(self):
         """Get current URL using Chrome DevTools Protocol - returns exact active tab URL"""
         try:
-            import json as json_lib
-            import urllib.request
-            
-            # Try multiple common ports
-            ports = [9222, 9223, 9224, 9225, 9226]  # Added more ports
-            for port in ports:
+            window_title = self._get_foreground_window_title()
+            # Sticky last-good port first; all other ports are probed concurrently only if needed
+            for port, tabs in self.port_scanner.iter_responses("/json"):
+                index = self._browser(port).target_index
                 try:
-                    response = urllib.request.urlopen(f"http://localhost:{port}/json", timeout=1)  # Faster timeout
-                    tabs = json_lib.loads(response.read().decode())
-                    
-                    if not tabs:
-                        continue
-                    
-                    # Strategy 1: Find the active/focused tab (most reliable)
-                    # Get the currently active window title to match with tab
-                    active_window_title = None
-                    if sys.platform == "win32":
-                        try:
-                            import win32gui
-                            hwnd = win32gui.GetForegroundWindow()
-                            active_window_title = win32gui.GetWindowText(hwnd)
-                        except:
-                            pass
-                    
-                    active_tab = None
-                    active_tab_title_match = None
-                    
-                    for tab in tabs:
-                        url = tab.get('url', '')
-                        tab_type = tab.get('type', '')
-                        title = tab.get('title', '')
-                        
-                        # Check if this is a page tab with a valid URL
-                        if tab_type == 'page' and url and (url.startswith('http://') or url.startswith('https://')):
-                            # If we have active window title, try to match it with tab title
-                            if active_window_title and title:
-                                if title.lower() in active_window_title.lower() or active_window_title.lower() in title.lower():
-                                    # This tab matches the active window - use it!
-                                    return url
-                            
-                            # Prefer tabs that have webSocketDebuggerUrl (usually means they're active)
-                            if 'webSocketDebuggerUrl' in tab and tab['webSocketDebuggerUrl']:
-                                if not active_tab:
-                                    active_tab = url
-                                    active_tab_title_match = title
-                            
-                            # If no active tab found yet, use the first valid page tab
-                            if not active_tab:
-                                active_tab = url
-                                active_tab_title_match = title
-                    
-                    if active_tab:
-                        return active_tab
-                    
-                    # Strategy 2: If base_url is set, prioritize tabs matching base_url
-                    if self.base_url:
-                        matching_base_url = []
-                    for tab in tabs:
-                        url = tab.get('url', '')
-                        tab_type = tab.get('type', '')
-                        if tab_type == 'page' and url and url.startswith(self.base_url):
-                            matching_base_url.append(url)
-                        
-                        if matching_base_url:
-                            return matching_base_url[0]  # Return first match
-                    
-                    # Strategy 3: Return first valid page tab URL (fallback - return ANY valid URL)
-                    # This ensures we detect the URL even if domain doesn't match
-                    for tab in tabs:
-                        url = tab.get('url', '')
-                        tab_type = tab.get('type', '')
-                        # Return any page tab with a valid URL
-                        if tab_type == 'page' and url:
-                            # Return any HTTP/HTTPS URL (be lenient)
-                            if url.startswith('http://') or url.startswith('https://'):
-                                # Basic validation - just check it has a domain
-                                try:
-                                    url_parts = url.split('://')
-                                    if len(url_parts) == 2:
-                                        domain_part = url_parts[1].split('/')[0].split(':')[0]  # Remove port if present
-                                        # Valid domain should have at least one dot and be longer than 3 chars
-                                        if '.' in domain_part and len(domain_part) > 3:
-                                            return url  # Return first valid URL found
-                                except:
-                                    # If parsing fails, still return it if it starts with http/https
-                                    return url
-                            
-                except urllib.error.URLError:
-                    # Port not available - this is normal for manually opened browsers
-                    continue
-                except Exception as e:
-                    continue
+                    url = index.refresh(tabs, window_title)
+                except Exception:
+                    url = None
+                if url:
+                    self.active_target_id = index.active_id
+                    return url
         except:
             pass
         return None
     
+    def _get_foreground_window_title(self):
+        """Title of the foreground window (used to tell which tab is on screen) - Windows/X11"""
+        return self.focus.get_title() or None
+    
     def _get_url_from_selenium(self):
         """Get URL using Selenium (if browser is controlled by Selenium)"""
         # This would work if the browser was opened by Selenium
         # For monitoring existing browsers, we need Chrome DevTools Protocol
         return None
     
-    def _handle_url_change(self, url):
-        """Handle URL change event"""
+    def _handle_url_change(self, url, browser=None, focused=False):
+        """Handle URL change event (browser = BrowserInstance it came from, focused = it has the user's focus)"""
+        with self._url_lock:
+            self._apply_url_change(url, browser or self._browser_for_url(url), focused)
+    
+    def _browser_for_url(self, url):
+        """Best guess at which browser a URL (e.g. from a one-off detection) belongs to"""
+        candidates = ([self.active_browser] if self.active_browser else []) + list(self.browsers.values())
+        for browser in candidates:
+            active = browser.target_index.targets.get(browser.target_index.active_id)
+            if url == browser.current_url or (active and active[1] == url):
+                return browser
+        return self.active_browser or self._browser(None)
+    
+    def _apply_url_change(self, url, browser, focused=False):
+        """Update the browser's and the mirrored URL/module/page state and notify the callback (caller holds _url_lock)"""
+        navigated = url != browser.current_url
+        switched = self.active_browser is not None and browser is not self.active_browser
         # Prevent processing the same URL change multiple times
-        if url == self.current_url:
-            return  # URL hasn't actually changed, skip processing
+        if not navigated:
+            if switched and not focused:
+                return  # Another browser, still on the same page - the user is not working in it
+            if not switched and url == self.current_url:
+                return  # URL hasn't actually changed, skip processing
+        
+        self.active_browser = browser
+        self.active_target_id = browser.active_target_id
+        
+        # Steps waiting on a re-check ran before this navigation - report them first, with the new URL
+        self._flush_refresh_callbacks(url)
         
         from urllib.parse import urlparse
         global BASE_URL
@@ -355,21 +1923,29 @@ class BrowserMonitor:
             self.base_url = new_base_url
             BASE_URL = self.base_url
         
+        # Identify module and page from URL
+        module, page = self._identify_module_and_page(url)
+        if navigated:
+            browser.last_url = browser.current_url
+        browser.current_url = url
+        browser.current_module = module
+        browser.current_page = page
+        
         # Always process URL changes (removed the restriction that blocked different domains)
         self.last_url = self.current_url
         self.current_url = url
         # Track last valid URL to help with action capture after login
         self.last_valid_url = url
-        
-        # Identify module and page from URL
-        module, page = self._identify_module_and_page(url)
         self.current_module = module
         self.current_page = page
         
         # Notify callback
         if self.callback:
-            navigation_action = f"Navigated to: {url}\nModule: {module} | Page: {page}"
-            self.callback(navigation_action, url, module, page)
+            if switched and not navigated:
+                navigation_action = f"Switched to {browser.label}: {url}\nModule: {module} | Page: {page}"
+            else:
+                navigation_action = f"Navigated to: {url}\nModule: {module} | Page: {page}"
+            self.callback(navigation_action, url, module, page, browser=browser.label)
     
     def _identify_module_and_page(self, url):
         """Identify module and page from URL"""
@@ -399,13 +1975,2343 @@ class BrowserMonitor:
         
         return module, page
     
-    def get_current_info(self):
-        """Get current URL, module, and page"""
-        return {
-            'url': self.current_url,
-            'module': self.current_module,
-            'page': self.current_page
-        }
+    def get_current_info(self):
+        """Get current URL, module, and page"""
+        return {
+            'url': self.current_url,
+            'module': self.current_module,
+            'page': self.current_page,
+            'browser': self.active_label()
+        }
+
+
+def element_from_node(node):
+    """Element description (same keys as the in-page capture script) from a DOM.describeNode result"""
+    values = node.get("attributes") or []
+    attrs = dict(zip(values[::2], values[1::2]))
+    tag = (node.get("localName") or node.get("nodeName") or "").lower()
+    text = " ".join(child.get("nodeValue", "") for child in node.get("children") or []
+                    if child.get("nodeType") == 3)
+    text = (attrs.get("aria-label") or attrs.get("title") or attrs.get("placeholder") or attrs.get("alt")
+            or " ".join(text.split()) or (attrs.get("value", "") if tag == "input" else ""))
+    if attrs.get("id"):
+        selector = "#" + attrs["id"]
+    elif attrs.get("name"):
+        selector = f'{tag}[name="{attrs["name"]}"]'
+    elif attrs.get("class"):
+        selector = f"{tag}." + ".".join(attrs["class"].split()[:2])
+    else:
+        selector = tag
+    return {"tag": tag, "id": attrs.get("id", ""), "role": attrs.get("role", ""), "type": attrs.get("type", ""),
+            "name": attrs.get("name", ""), "text": text[:80], "selector": selector}
+
+
+class ElementResolver:
+    """Resolves screen click coordinates to the DOM element under them (DOM.getNodeForLocation +
+    DOM.describeNode) on the DevTools event loop, cached per (URL, layout version, rounded position)"""
+    
+    def __init__(self, browser_monitor, grid=8, max_entries=512):
+        self.browser_monitor = browser_monitor
+        self.grid = grid  # Cache cell size in CSS px
+        self.max_entries = max_entries
+        self.cache = OrderedDict()  # (url, layout_version, cell_x, cell_y) -> element description (None = nothing)
+        self.layout_versions = {}  # url -> version, bumped when the page scrolls
+        self.viewports = {}  # (target_id, layout_version) -> viewport rectangle on screen
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._inflight = {}  # key -> asyncio future of a lookup in progress
+    
+    def bump_layout(self, url=None):
+        """What is under a screen position changed (scroll) - stop reusing cached elements for this page"""
+        url = url or self.browser_monitor.current_url
+        with self._lock:
+            self.layout_versions[url] = self.layout_versions.get(url, 0) + 1
+    
+    def resolve_async(self, x, y, on_resolved):
+        """Queue a lookup and return at once - on_resolved(description) runs on the DevTools thread if an
+        element is found. False if there is no DevTools session for the active tab."""
+        browser = self.browser_monitor.active_browser
+        if not (browser and browser.tracked):
+            return False
+        tracker = browser.tracker
+        target_id = tracker.active_target_id or browser.active_target_id
+        session_id = tracker.target_sessions.get(target_id)
+        if not session_id:
+            return False
+        CDPEventLoop.instance().submit(self._resolve(tracker, target_id, session_id,
+                                                     browser.current_url, x, y, on_resolved))
+        return True
+    
+    async def _resolve(self, tracker, target_id, session_id, url, x, y, on_resolved):
+        try:
+            with self._lock:
+                version = self.layout_versions.get(url, 0)
+                viewport = self.viewports.get((target_id, version))
+            if viewport is None:
+                viewport = await self._once(("viewport", target_id, version),
+                                            lambda: self._fetch_viewport(tracker.connection, session_id))
+                with self._lock:
+                    self.viewports[(target_id, version)] = viewport
+            page_x = x - viewport.get("left", 0)
+            page_y = y - viewport.get("top", 0)
+            if not (0 <= page_x < viewport.get("width", 0) and 0 <= page_y < viewport.get("height", 0)):
+                return  # Browser toolbar, another window, ...
+            
+            key = (url, version, int(page_x // self.grid), int(page_y // self.grid))
+            with self._lock:
+                cached = key in self.cache
+                if cached:
+                    self.hits += 1
+                    self.cache.move_to_end(key)
+                    description = self.cache[key]
+            if not cached:
+                # A second click on the same spot while the first lookup runs shares its answer
+                description = await self._once(key, lambda: self._lookup(
+                    key, tracker.connection, session_id, int(page_x), int(page_y)))
+            if description:
+                on_resolved(description)
+        except Exception:
+            self.failures += 1
+    
+    async def _once(self, key, factory):
+        """Run factory() once per key while it is in flight (DevTools loop thread only)"""
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(factory())
+            future.add_done_callback(lambda done: self._inflight.pop(key, None))
+        else:
+            self.hits += 1
+        return await asyncio.shield(future)
+    
+    async def _fetch_viewport(self, connection, session_id):
+        result = await connection.send("Runtime.evaluate",
+                                       {"expression": DOM_VIEWPORT_EXPRESSION, "returnByValue": True},
+                                       session_id=session_id, timeout=1.0)
+        return result.get("result", {}).get("value") or {}
+    
+    async def _lookup(self, key, connection, session_id, x, y):
+        description = await self._describe_at(connection, session_id, x, y)
+        with self._lock:
+            self.misses += 1
+            self.cache[key] = description
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return description
+    
+    async def _describe_at(self, connection, session_id, x, y):
+        """Hit-test a viewport point - returns an element description or None"""
+        node = await connection.send("DOM.getNodeForLocation",
+                                     {"x": x, "y": y, "includeUserAgentShadowDOM": False,
+                                      "ignorePointerEventsNone": True}, session_id=session_id, timeout=1.0)
+        backend_id = node.get("backendNodeId")
+        if not backend_id:
+            return None
+        described = await connection.send("DOM.describeNode", {"backendNodeId": backend_id, "depth": 1},
+                                          session_id=session_id, timeout=1.0)
+        description = element_from_node(described.get("node", {}))
+        if description["tag"] in DOM_INTERACTIVE_TAGS or description["role"]:
+            return description
+        # Icon/span inside a button or link - describe the interactive ancestor instead
+        try:
+            remote = await connection.send("DOM.resolveNode", {"backendNodeId": backend_id},
+                                           session_id=session_id, timeout=1.0)
+            result = await connection.send(
+                "Runtime.callFunctionOn",
+                {"objectId": remote["object"]["objectId"], "functionDeclaration": DOM_DESCRIBE_FUNCTION,
+                 "returnByValue": True}, session_id=session_id, timeout=1.0)
+            await connection.send("Runtime.releaseObject", {"objectId": remote["object"]["objectId"]},
+                                  session_id=session_id, timeout=1.0)
+            return result.get("result", {}).get("value") or description
+        except Exception:
+            return description
+    
+    def get_stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "failures": self.failures, "entries": len(self.cache)}
+
+
+# Per-step screenshots: content-addressed files (same screen = same file), referenced from test cases by id
+SCREENSHOT_DIR = "screenshots"
+SCREENSHOT_FORMAT = "jpeg"
+SCREENSHOT_QUALITY = 80
+SCREENSHOT_WORKERS = 2  # Encoder threads (base64 decode, hash, write)
+SCREENSHOT_MAX_PENDING = 4  # Requests in flight - more are dropped rather than queued
+
+
+class ScreenshotStore:
+    """Content-addressed screenshot directory: an image's id is the hash of its bytes and it is stored once
+    as <dir>/<id[:2]>/<id>.<ext>, however many steps show the same screen"""
+    
+    def __init__(self, directory=SCREENSHOT_DIR, extension="jpg"):
+        self.directory = directory
+        self.extension = extension
+        self.known = set()  # Ids already on disk
+        self.written = 0
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+    
+    def path(self, screenshot_id):
+        return os.path.join(self.directory, screenshot_id[:2], f"{screenshot_id}.{self.extension}")
+    
+    def put(self, data):
+        """Store image bytes (any thread); returns the screenshot id"""
+        screenshot_id = hashlib.sha256(data).hexdigest()[:20]
+        with self._lock:
+            if screenshot_id in self.known:
+                self.deduplicated += 1
+                return screenshot_id
+            self.known.add(screenshot_id)
+        path = self.path(screenshot_id)
+        if os.path.exists(path):
+            with self._lock:
+                self.deduplicated += 1
+            return screenshot_id
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)  # Readers never see a half-written image
+        with self._lock:
+            self.written += 1
+        return screenshot_id
+
+
+class ScreenshotCapturer:
+    """Takes step screenshots of the tab the user is working in (Page.captureScreenshot on the DevTools loop)
+    and hands decoding/hashing/writing to a small encoder pool - nothing runs on the caller's thread.
+    At most max_pending requests are in flight; further requests are dropped."""
+    
+    def __init__(self, browser_monitor, store=None, workers=SCREENSHOT_WORKERS, max_pending=SCREENSHOT_MAX_PENDING):
+        self.browser_monitor = browser_monitor
+        self.store = store or ScreenshotStore()
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="screenshot-encoder")
+        self.pending = 0
+        self.taken = 0
+        self.dropped = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+    
+    def request(self, on_done):
+        """Queue a screenshot of the active tab; on_done(screenshot_id or None) runs on the DevTools loop thread.
+        False (on_done is not called) when there is no DevTools session or too many are in flight."""
+        browser = self.browser_monitor.active_browser
+        if not (browser and browser.tracked):
+            return False
+        tracker = browser.tracker
+        session_id = tracker.target_sessions.get(tracker.active_target_id or browser.active_target_id)
+        if not session_id:
+            return False
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.dropped += 1
+                return False
+            self.pending += 1
+        CDPEventLoop.instance().submit(self._capture(tracker.connection, session_id, on_done))
+        return True
+    
+    async def _capture(self, connection, session_id, on_done):
+        try:
+            result = await connection.send("Page.captureScreenshot",
+                                           {"format": SCREENSHOT_FORMAT, "quality": SCREENSHOT_QUALITY},
+                                           session_id=session_id, timeout=3.0)
+            # Decoding and hashing a few hundred KB would stall every DevTools session - do it off the loop
+            screenshot_id = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._encode, result.get("data", ""))
+        except Exception:
+            screenshot_id = None
+        with self._lock:
+            self.pending -= 1
+            if screenshot_id:
+                self.taken += 1
+            else:
+                self.failures += 1
+        try:
+            on_done(screenshot_id)
+        except Exception:
+            pass
+    
+    def _encode(self, data):
+        return self.store.put(base64.b64decode(data)) if data else None
+    
+    def get_stats(self):
+        with self._lock:
+            return {"taken": self.taken, "dropped": self.dropped, "failures": self.failures, "pending": self.pending,
+                    "written": self.store.written, "deduplicated": self.store.deduplicated}
+    
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+# Test case replay
+REPLAY_SPEEDS = {"1x": 1.0, "5x": 5.0, "Max": None}  # None = as fast as possible (no think time)
+REPLAY_ALL_FILTER = "All"  # Module/status filter value that doesn't filter (Replay All)
+REPLAY_DEFAULT_GAP_MS = 500  # Think time at 1x for steps saved without Step_Timing
+REPLAY_MAX_GAP_MS = 10000  # Longer recorded pauses are capped
+REPLAY_STEP_TIMEOUT = 5  # Seconds to find an element / answer a command
+REPLAY_NAVIGATION_TIMEOUT = 15  # Seconds to wait for a page load
+
+# Where a captured step's target element is (scrolled into view), or null - called with the CSS selector
+REPLAY_LOCATE_FUNCTION = """(function (selector) {
+  var el = document.querySelector(selector);
+  if (!el) return null;
+  el.scrollIntoView({block: 'center', inline: 'center'});
+  var r = el.getBoundingClientRect();
+  return {x: r.left + r.width / 2, y: r.top + r.height / 2, checked: !!el.checked};
+})"""
+
+# Clear and focus a field before its value is typed again
+REPLAY_FOCUS_FUNCTION = """(function (selector) {
+  var el = document.querySelector(selector);
+  if (!el) return false;
+  el.focus();
+  if ('value' in el) el.value = '';
+  return true;
+})"""
+
+# Pick a dropdown option by value or visible text
+REPLAY_SELECT_FUNCTION = """(function (selector, value) {
+  var el = document.querySelector(selector);
+  if (!el || !el.options) return false;
+  for (var i = 0; i < el.options.length; i++) {
+    var option = el.options[i];
+    if (option.value === value || option.text.trim() === value) {
+      el.value = option.value;
+      el.dispatchEvent(new Event('input', {bubbles: true}));
+      el.dispatchEvent(new Event('change', {bubbles: true}));
+      return true;
+    }
+  }
+  return false;
+})"""
+
+# Key name -> (DOM key, code, virtual key code, text) for Input.dispatchKeyEvent
+REPLAY_KEYS = {
+    "enter": ("Enter", "Enter", 13, "\r"),
+    "tab": ("Tab", "Tab", 9, ""),
+    "backspace": ("Backspace", "Backspace", 8, ""),
+    "delete": ("Delete", "Delete", 46, ""),
+    "escape": ("Escape", "Escape", 27, ""),
+    "esc": ("Escape", "Escape", 27, ""),
+}
+
+# "N. [browser] [HH:MM:SS] text" - the browser tag is only there when several browsers were monitored
+REPLAY_STEP_LINE = re.compile(
+    r"^\s*(\d+)\.\s+(?:\[(?!\d{1,2}:\d{2}:\d{2}\])([^\]]+)\]\s*)?(?:\[\d{1,2}:\d{2}:\d{2}\]\s*)?(.*)$")
+REPLAY_TIMING_LINE = re.compile(r"^\s*(\d+)\.\s+\S+\s+\+(\d+(?:\.\d+)?) ms")
+REPLAY_URL = re.compile(r"^(?:Navigated to|Open URL|Switched to [^:']+?)\s*:\s*((?:https?|file)://\S+|about:\S+)", re.I)
+REPLAY_POINT = re.compile(r"\s+at \((-?\d+), (-?\d+)\)\s*$")
+REPLAY_SELECTOR = re.compile(r"\s\(([^()]+)\)\s*$")
+
+ReplayStep = namedtuple("ReplayStep", "number text action args gap_ms")
+ReplayStepResult = namedtuple("ReplayStepResult", "number text status duration_ms error")
+
+
+def parse_replay_step(text):
+    """(action, args) for one captured step - action is one of navigate/click/check/scroll/type/select/key,
+    or skip (args["reason"]) for steps that can't be driven from what was saved"""
+    first = text.split("\n", 1)[0].strip()
+    match = REPLAY_URL.match(first)
+    if match:
+        return "navigate", {"url": match.group(1)}
+    point = REPLAY_POINT.search(first)
+    x, y = (int(point.group(1)), int(point.group(2))) if point else (None, None)
+    rest = first[:point.start()] if point else first
+    selector = REPLAY_SELECTOR.search(rest)
+    selector = selector.group(1) if selector else None
+    
+    match = re.match(r"Mouse (\w+) (double-)?click$", rest)
+    if match:
+        return "click", {"x": x, "y": y, "button": match.group(1), "count": 2 if match.group(2) else 1}
+    match = re.match(r"(Double-)?(?:(Right|Middle)-)?[Cc]lick\b", rest)
+    if match and (selector or point):
+        return "click", {"x": x, "y": y, "selector": selector, "button": (match.group(2) or "left").lower(),
+                         "count": 2 if match.group(1) else 1}
+    match = re.match(r"(Check|Uncheck) ", rest)
+    if match and selector:
+        return "check", {"selector": selector, "checked": match.group(1) == "Check"}
+    match = re.match(r"Scroll(?:ed)? (up|down|left|right)(?: (\d+) notches)?$", rest)
+    if match and point:
+        return "scroll", {"x": x, "y": y, "direction": match.group(1), "count": int(match.group(2) or 1)}
+    match = re.match(r"(Enter|Select) '(.*)' in ", rest)
+    if match and selector:
+        return ("type" if match.group(1) == "Enter" else "select"), {"value": match.group(2), "selector": selector}
+    match = re.match(r"(?:(\w+) key pressed|Press (\w+)\b)", rest)
+    if match and (match.group(1) or match.group(2)).lower() in REPLAY_KEYS:
+        return "key", {"key": (match.group(1) or match.group(2)).lower(), "selector": selector}
+    if rest.startswith("Entered text in field"):
+        return "skip", {"reason": "typed text was not recorded (enable in-page DOM capture to record values)"}
+    if rest.startswith("Switched to"):
+        return "skip", {"reason": "tab/window switch"}
+    return "skip", {"reason": "not a recorded browser action"}
+
+
+def parse_test_steps(test_steps, step_timing=""):
+    """Split a saved Execution_Steps cell into ReplaySteps (continuation lines such as
+    "Module: ... | Page: ..." stay with their step); think time comes from the Step_Timing cell.
+    A "[browser]" tag before the time stamp (multi-browser recordings) is dropped from the step text."""
+    gaps = {}
+    for line in (step_timing or "").splitlines():
+        match = REPLAY_TIMING_LINE.match(line)
+        if match:
+            gaps[int(match.group(1))] = float(match.group(2))
+    
+    numbered = []  # [number, text, browser tag]
+    for line in (test_steps or "").splitlines():
+        match = REPLAY_STEP_LINE.match(line)
+        if match:
+            numbered.append([int(match.group(1)), match.group(3), match.group(2)])
+        elif numbered and line.strip():
+            numbered[-1][1] += "\n" + line.strip()
+    steps = []
+    for number, text, browser in numbered:
+        action, args = parse_replay_step(text)
+        if browser:
+            args["browser"] = browser  # Informational - a test case replays in one browser
+        steps.append(ReplayStep(number, text, action, args, gaps.get(number)))
+    return steps
+
+
+# Workbook layout: (header, test case key) per column, one sheet per module
+EXCEL_COLUMNS = [
+    ("TC_ID", "test_id"), ("TC_Module", "module"), ("Prerequisite", "preconditions"),
+    ("Execution_Steps", "test_steps"), ("Expected_Output", "expected_result"), ("Actual_Output", "actual_result"),
+    ("Status", "status"), ("Priority", "priority"), ("URL", "url"), ("Created Date", "created_date"),
+    ("Browser", "browser"), ("Step_Timing", "step_timing"), ("Screenshots", "screenshots"),
+]
+EXCEL_HEADERS = [header for header, key in EXCEL_COLUMNS]
+EXCEL_HEADER_KEYS = dict(EXCEL_COLUMNS)  # Header -> test case key
+
+
+def load_replay_test_cases(path):
+    """Saved test cases from the Excel workbook (every module sheet) or the JSON backup format.
+    Excel rows also carry "sheet" and "row" so results can be written back."""
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return [tc for tc in (data if isinstance(data, list) else [data]) if isinstance(tc, dict)]
+    
+    test_cases = []
+    wb = load_workbook(path, read_only=True)
+    try:
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None) or ()
+            columns = {i: EXCEL_HEADER_KEYS[name] for i, name in enumerate(header) if name in EXCEL_HEADER_KEYS}
+            if "test_steps" not in columns.values():
+                continue  # Not a test case sheet
+            for row_num, row in enumerate(rows, 2):
+                test_case = {key: ("" if i >= len(row) or row[i] is None else str(row[i]))
+                             for i, key in columns.items()}
+                if test_case.get("test_id"):
+                    test_case.update(sheet=ws.title, row=row_num)
+                    test_cases.append(test_case)
+    finally:
+        wb.close()
+    return test_cases
+
+
+def browser_ws_url(port, client=None):
+    """Browser-level DevTools WebSocket URL of the browser listening on `port`"""
+    info = (client or DevToolsClient()).get_json(port, "/json/version")
+    ws_url = info.get("webSocketDebuggerUrl") if isinstance(info, dict) else None
+    if not ws_url:
+        raise CDPError(f"No DevTools browser endpoint on port {port}")
+    return ws_url
+
+
+def format_replay_report(report):
+    """Readable replay result (Actual_Output): one line per step plus a summary"""
+    lines = [f"Replay {report['status']} in {report['duration_ms'] / 1000:.1f}s "
+             f"({report['passed']} passed, {report['failed']} failed, {report['skipped']} skipped)"]
+    if report.get("error"):
+        lines.append(report["error"])
+    for step in report["steps"]:
+        line = f"{step.number}. {step.status} ({step.duration_ms:.0f} ms)"
+        if step.error:
+            line += f" - {step.error}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+class ReplayStepError(Exception):
+    """A replayed step could not be carried out (element missing, wrong page, ...)"""
+
+
+class ReplayEngine:
+    """Re-runs a saved test case in a DevTools-enabled browser: a fresh tab is opened over the browser's
+    WebSocket and driven with Page.navigate, Input.dispatchMouseEvent, Input.insertText and
+    Input.dispatchKeyEvent. Recorded think time is replayed divided by `speed` (None = no waiting).
+    isolated = run in a fresh browser context (own cookies/storage) that is disposed afterwards.
+    Runs on the shared CDPEventLoop; on_step(test_case, ReplayStepResult) is called on that thread."""
+    
+    def __init__(self, ws_url, speed=1.0, on_step=None, stop_on_failure=True, isolated=False):
+        self.ws_url = ws_url
+        self.speed = speed
+        self.on_step = on_step
+        self.stop_on_failure = stop_on_failure
+        self.isolated = isolated
+        self.connection = None
+        self.context_id = None
+        self.target_id = None
+        self.session_id = None
+        self.url = ""
+        self.main_frame = None
+        self._load = None  # Future resolved by Page.loadEventFired while the main frame is loading
+    
+    def replay(self, test_case, timeout=None):
+        """Blocking replay from any thread except the DevTools loop - returns the report"""
+        return CDPEventLoop.instance().run(self.run(test_case), timeout)
+    
+    async def run(self, test_case):
+        """Replay one test case; returns {"test_id", "status" (Pass/Fail, Blocked if it could not start),
+        "steps", "passed", "failed", "skipped", "duration_ms", "error"}"""
+        steps = parse_test_steps(test_case.get("test_steps", ""), test_case.get("step_timing", ""))
+        report = {"test_id": test_case.get("test_id", ""), "status": "Pass", "steps": [],
+                  "passed": 0, "failed": 0, "skipped": 0, "duration_ms": 0.0, "error": ""}
+        started = time.perf_counter()
+        try:
+            await self._open()
+            if test_case.get("url") and not (steps and steps[0].action == "navigate"):
+                await self._navigate(test_case["url"])  # Start where the recording started
+            for step in steps:
+                if step is not steps[0]:
+                    await self._think(step.gap_ms)
+                result = await self._run_step(step)
+                report["steps"].append(result)
+                report[{"Pass": "passed", "Fail": "failed", "Skipped": "skipped"}[result.status]] += 1
+                if self.on_step:
+                    try:
+                        self.on_step(test_case, result)
+                    except Exception:
+                        pass
+                if result.status == "Fail" and self.stop_on_failure:
+                    break
+        except Exception as e:  # Browser gone, refused connection, unexpected DevTools reply, ...
+            report["error"] = f"Replay aborted: {e or type(e).__name__}"
+        finally:
+            await self._close()
+        if report["error"] and not report["steps"]:
+            report["status"] = "Blocked"
+        elif report["failed"] or report["error"]:
+            report["status"] = "Fail"
+        report["duration_ms"] = (time.perf_counter() - started) * 1000
+        return report
+    
+    async def _run_step(self, step):
+        started = time.perf_counter()
+        status, error = "Pass", ""
+        if step.action == "skip":
+            status, error = "Skipped", step.args["reason"]
+        else:
+            try:
+                await getattr(self, "_" + step.action)(**step.args)
+            except (CDPError, ReplayStepError) as e:
+                status, error = "Fail", str(e)
+            except asyncio.TimeoutError:
+                status, error = "Fail", "timed out"
+        return ReplayStepResult(step.number, step.text, status, (time.perf_counter() - started) * 1000, error)
+    
+    async def _think(self, gap_ms):
+        if not self.speed:
+            return
+        gap_ms = REPLAY_DEFAULT_GAP_MS if gap_ms is None else min(gap_ms, REPLAY_MAX_GAP_MS)
+        await asyncio.sleep(gap_ms / 1000 / self.speed)
+    
+    # Session
+    
+    async def _open(self):
+        self.connection = CDPConnection(self.ws_url, on_event=self._on_event)
+        await self.connection.connect()
+        params = {"url": "about:blank"}
+        if self.isolated:
+            context = await self.connection.send("Target.createBrowserContext", {"disposeOnDetach": True})
+            self.context_id = params["browserContextId"] = context["browserContextId"]
+        target = await self.connection.send("Target.createTarget", params)
+        self.target_id = target["targetId"]
+        attached = await self.connection.send("Target.attachToTarget", {"targetId": self.target_id, "flatten": True})
+        self.session_id = attached["sessionId"]
+        await self._send("Page.enable")
+    
+    async def _close(self):
+        if not self.connection:
+            return
+        try:
+            if self.target_id and self.connection.connected:
+                await self.connection.send("Target.closeTarget", {"targetId": self.target_id}, timeout=2.0)
+            if self.context_id and self.connection.connected:
+                await self.connection.send("Target.disposeBrowserContext",
+                                           {"browserContextId": self.context_id}, timeout=2.0)
+        except Exception:
+            pass
+        await self.connection.close()
+        self.connection = None
+    
+    async def _send(self, method, params=None, timeout=REPLAY_STEP_TIMEOUT):
+        return await self.connection.send(method, params, session_id=self.session_id, timeout=timeout)
+    
+    def _on_event(self, method, params, session_id):
+        if session_id != self.session_id:
+            return
+        if method == "Page.frameStartedLoading" and params.get("frameId") in (self.main_frame, self.target_id):
+            if self._load is None or self._load.done():
+                self._load = asyncio.get_running_loop().create_future()
+        elif method == "Page.loadEventFired":
+            if self._load and not self._load.done():
+                self._load.set_result(True)
+        elif method == "Page.frameNavigated":
+            frame = params.get("frame", {})
+            if not frame.get("parentId"):
+                self.main_frame = frame.get("id")
+                self.url = frame.get("url", "") + frame.get("urlFragment", "")
+        elif method == "Page.navigatedWithinDocument" and params.get("frameId") == self.main_frame:
+            self.url = params.get("url", "")
+    
+    async def _wait_for_load(self):
+        if self._load and not self._load.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(self._load), REPLAY_NAVIGATION_TIMEOUT)
+            except asyncio.TimeoutError:
+                self._load = None  # Don't make every later step wait for it too
+                raise ReplayStepError(f"page did not finish loading within {REPLAY_NAVIGATION_TIMEOUT}s")
+    
+    @staticmethod
+    def _same_page(a, b):
+        a, b = urlparse(a or ""), urlparse(b or "")
+        return (a.netloc, a.path.rstrip("/"), a.query) == (b.netloc, b.path.rstrip("/"), b.query)
+    
+    async def _evaluate(self, expression):
+        result = await self._send("Runtime.evaluate", {"expression": expression, "returnByValue": True})
+        if result.get("exceptionDetails"):
+            raise ReplayStepError(result["exceptionDetails"].get("text", "script error"))
+        return result.get("result", {}).get("value")
+    
+    async def _call(self, function, *args):
+        return await self._evaluate(f"{function}({', '.join(json.dumps(arg) for arg in args)})")
+    
+    async def _locate(self, selector):
+        """Center of the element (viewport px), waiting up to REPLAY_STEP_TIMEOUT for it to appear"""
+        deadline = time.monotonic() + REPLAY_STEP_TIMEOUT
+        while True:
+            await self._wait_for_load()
+            found = await self._call(REPLAY_LOCATE_FUNCTION, selector)
+            if found:
+                return found
+            if time.monotonic() >= deadline:
+                raise ReplayStepError(f"element not found: {selector}")
+            await asyncio.sleep(0.1)
+    
+    async def _to_viewport(self, x, y):
+        """Map recorded screen coordinates into the replay tab's viewport"""
+        await self._wait_for_load()
+        viewport = await self._evaluate(DOM_VIEWPORT_EXPRESSION) or {}
+        page_x, page_y = x - viewport.get("left", 0), y - viewport.get("top", 0)
+        if not (0 <= page_x < viewport.get("width", 0) and 0 <= page_y < viewport.get("height", 0)):
+            raise ReplayStepError(f"({x}, {y}) is outside the page")
+        return page_x, page_y
+    
+    # Step actions
+    
+    async def _navigate(self, url):
+        await self._wait_for_load()  # A click may already be taking us there
+        if self._same_page(self.url, url):
+            return
+        result = await self._send("Page.navigate", {"url": url}, timeout=REPLAY_NAVIGATION_TIMEOUT)
+        if result.get("errorText"):
+            raise ReplayStepError(f"navigation failed: {result['errorText']}")
+        if result.get("loaderId"):
+            if self._load is None or self._load.done():
+                self._load = asyncio.get_running_loop().create_future()
+            await self._wait_for_load()
+    
+    async def _mouse(self, x, y, button="left", count=1):
+        await self._send("Input.dispatchMouseEvent", {"type": "mouseMoved", "x": x, "y": y})
+        for click in range(1, count + 1):
+            for kind in ("mousePressed", "mouseReleased"):
+                await self._send("Input.dispatchMouseEvent",
+                                 {"type": kind, "x": x, "y": y, "button": button, "clickCount": click})
+    
+    async def _click(self, x=None, y=None, selector=None, button="left", count=1):
+        if selector:
+            found = await self._locate(selector)
+            x, y = found["x"], found["y"]
+        else:
+            x, y = await self._to_viewport(x, y)
+        await self._mouse(x, y, button, count)
+    
+    async def _check(self, selector, checked):
+        found = await self._locate(selector)
+        if found["checked"] != checked:
+            await self._mouse(found["x"], found["y"])
+    
+    async def _scroll(self, x, y, direction, count=1):
+        x, y = await self._to_viewport(x, y)
+        delta = 100 * count * (-1 if direction in ("up", "left") else 1)
+        horizontal = direction in ("left", "right")
+        await self._send("Input.dispatchMouseEvent",
+                         {"type": "mouseWheel", "x": x, "y": y,
+                          "deltaX": delta if horizontal else 0, "deltaY": 0 if horizontal else delta})
+    
+    async def _type(self, value, selector):
+        await self._locate(selector)
+        if not await self._call(REPLAY_FOCUS_FUNCTION, selector):
+            raise ReplayStepError(f"element not found: {selector}")
+        await self._send("Input.insertText", {"text": value})
+    
+    async def _select(self, value, selector):
+        await self._locate(selector)
+        if not await self._call(REPLAY_SELECT_FUNCTION, selector, value):
+            raise ReplayStepError(f"option '{value}' not found in {selector}")
+    
+    async def _key(self, key, selector=None):
+        if selector:
+            await self._locate(selector)
+            await self._evaluate(f"document.querySelector({json.dumps(selector)}).focus()")
+        dom_key, code, key_code, text = REPLAY_KEYS[key]
+        params = {"key": dom_key, "code": code, "windowsVirtualKeyCode": key_code}
+        await self._send("Input.dispatchKeyEvent", dict(params, type="keyDown", text=text) if text
+                         else dict(params, type="rawKeyDown"))
+        await self._send("Input.dispatchKeyEvent", dict(params, type="keyUp"))
+
+
+# Headless batch replay
+REPLAY_BROWSER_EXECUTABLES = ["google-chrome", "google-chrome-stable", "chromium", "chromium-browser",
+                              "microsoft-edge", "chrome", "msedge"]
+REPLAY_WINDOWS_BROWSERS = [
+    r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+    r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+    os.path.expanduser(r"~\AppData\Local\Google\Chrome\Application\chrome.exe"),
+    r"C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe",
+    r"C:\Program Files\Microsoft\Edge\Application\msedge.exe",
+]
+REPLAY_HEADLESS_ARGS = ["--headless=new", "--remote-debugging-port=0", "--no-first-run", "--no-default-browser-check",
+                        "--disable-gpu", "--disable-extensions", "--window-size=1366,768"]
+# Status cell colors (same as export_to_excel)
+STATUS_COLORS = {"Pass": "C6EFCE", "Fail": "FFC7CE", "Blocked": "FFEB9C"}
+EXCEL_CELL_LIMIT = 32767  # Characters Excel keeps in one cell
+
+
+def find_chromium_browser():
+    """Path of an installed Chromium-based browser for headless replay, or None"""
+    if os.name == 'nt':
+        for path in REPLAY_WINDOWS_BROWSERS:
+            if os.path.exists(path):
+                return path
+    for name in REPLAY_BROWSER_EXECUTABLES:
+        path = shutil.which(name)
+        if path:
+            return path
+    return None
+
+
+def default_replay_workers(count=None):
+    """One headless browser per core available to this process (never more than there are test cases)"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    return max(1, min(cores, count) if count else cores)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class HeadlessBrowser:
+    """One headless Chromium process on its own throwaway profile (a user_data_dir like _launch_browser's);
+    the browser picks its DevTools port and reports it through DevToolsActivePort"""
+    
+    def __init__(self, executable, worker):
+        self.executable = executable
+        name = os.path.splitext(os.path.basename(executable))[0].lower()
+        self.user_data_dir = os.path.join(tempfile.gettempdir(),
+                                          f"{name}_debug_profile_headless_{os.getpid()}_{worker}")
+        self.process = None
+        self.ws_url = None
+    
+    def start(self, timeout=DEVTOOLS_ACTIVE_PORT_TIMEOUT):
+        """Launch and wait for DevTools - returns the browser WebSocket URL"""
+        shutil.rmtree(self.user_data_dir, ignore_errors=True)  # No stale DevToolsActivePort
+        os.makedirs(self.user_data_dir, exist_ok=True)
+        self.process = subprocess.Popen([self.executable, *REPLAY_HEADLESS_ARGS,
+                                         f"--user-data-dir={self.user_data_dir}", "about:blank"],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        result = wait_for_devtools_active_port(self.user_data_dir, self.process, timeout)
+        if not result or not result[1]:
+            self.stop()
+            raise CDPError(f"{self.executable} did not report a DevTools port")
+        self.ws_url = f"ws://127.0.0.1:{result[0]}{result[1]}"
+        return self.ws_url
+    
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.process = None
+        shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+
+class BatchReplayRunner:
+    """Replays every test case of a workbook across a pool of headless browsers - one browser process per
+    worker, each case in its own browser context. on_result(test_case, report) is called as cases finish
+    (DevTools loop thread). With test_cases the cases are replayed from that list instead of being read
+    from the workbook at path."""
+    
+    def __init__(self, path, workers=None, speed=None, executable=None, on_result=None, test_cases=None):
+        self.path = path
+        self.test_cases = test_cases
+        self.workers = workers  # None = default_replay_workers()
+        self.speed = speed  # None = as fast as possible
+        self.executable = executable
+        self.on_result = on_result
+        self.cancelled = False
+    
+    def run(self):
+        """Blocking: replay everything; returns (reports in workbook order, summary)"""
+        started = time.perf_counter()
+        test_cases = self.test_cases if self.test_cases is not None else load_replay_test_cases(self.path)
+        if not test_cases:
+            return [], self.summarize([], 0, 0)
+        executable = self.executable or find_chromium_browser()
+        if not executable:
+            raise CDPError("No Chromium-based browser found for headless replay")
+        workers = min(self.workers or default_replay_workers(), len(test_cases))
+        
+        browsers = [HeadlessBrowser(executable, worker) for worker in range(workers)]
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay-browser") as pool:
+            started_browsers = list(pool.map(self._start_browser, browsers))
+        try:
+            ws_urls = [ws_url for ws_url in started_browsers if ws_url]
+            if not ws_urls:
+                raise CDPError(f"No headless browser could be started ({executable})")
+            reports = CDPEventLoop.instance().run(self._run_all(ws_urls, test_cases))
+        finally:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="replay-browser") as pool:
+                list(pool.map(HeadlessBrowser.stop, browsers))
+        return reports, self.summarize(reports, len(ws_urls), (time.perf_counter() - started) * 1000)
+    
+    @staticmethod
+    def _start_browser(browser):
+        try:
+            return browser.start()
+        except Exception:
+            return None  # Run with the workers that did come up
+    
+    async def _run_all(self, ws_urls, test_cases):
+        queue = asyncio.Queue()
+        for index, test_case in enumerate(test_cases):
+            queue.put_nowait((index, test_case))
+        reports = [None] * len(test_cases)
+        
+        async def worker(ws_url):
+            while not self.cancelled and not queue.empty():
+                index, test_case = queue.get_nowait()
+                report = await ReplayEngine(ws_url, self.speed, isolated=True).run(test_case)
+                report.update(sheet=test_case.get("sheet"), row=test_case.get("row"))
+                reports[index] = report
+                if self.on_result:
+                    try:
+                        self.on_result(test_case, report)
+                    except Exception:
+                        pass
+        
+        await asyncio.gather(*(worker(ws_url) for ws_url in ws_urls))
+        return [report for report in reports if report]
+    
+    @staticmethod
+    def summarize(reports, workers, duration_ms):
+        """Case counts per status plus step latency percentiles (executed steps only)"""
+        latencies = [step.duration_ms for report in reports for step in report["steps"] if step.status != "Skipped"]
+        summary = {"cases": len(reports), "workers": workers, "duration_ms": duration_ms,
+                   "steps": len(latencies), "step_p50_ms": percentile(latencies, 0.5),
+                   "step_p95_ms": percentile(latencies, 0.95), "step_max_ms": max(latencies, default=0.0)}
+        for status in ("Pass", "Fail", "Blocked"):
+            summary[status] = sum(1 for report in reports if report["status"] == status)
+        return summary
+
+
+def format_batch_summary(summary):
+    return (f"{summary['cases']} test cases in {summary['duration_ms'] / 1000:.1f}s on {summary['workers']} "
+            f"headless browsers: {summary['Pass']} passed, {summary['Fail']} failed, {summary['Blocked']} blocked | "
+            f"step latency p50 {summary['step_p50_ms']:.0f} ms, p95 {summary['step_p95_ms']:.0f} ms, "
+            f"max {summary['step_max_ms']:.0f} ms ({summary['steps']} steps)")
+
+
+def write_replay_results(path, reports):
+    """Write replay outcomes into the Status and Actual_Output columns - one load and one save of the
+    workbook for the whole batch (saved to a temp file and swapped in). Returns the number of rows written."""
+    wb = load_workbook(path)
+    columns = {}  # sheet -> (status column, actual output column)
+    written = 0
+    for report in reports:
+        if report.get("sheet") not in wb.sheetnames or not report.get("row"):
+            continue
+        ws = wb[report["sheet"]]
+        if ws.title not in columns:
+            header = {cell.value: cell.column for cell in ws[1]}
+            columns[ws.title] = (header.get("Status"), header.get("Actual_Output"))
+        status_col, actual_col = columns[ws.title]
+        if status_col:
+            cell = ws.cell(row=report["row"], column=status_col, value=report["status"])
+            color = STATUS_COLORS.get(report["status"])
+            if color:
+                cell.fill = PatternFill(start_color=color, end_color=color, fill_type="solid")
+        if actual_col:
+            ws.cell(row=report["row"], column=actual_col, value=format_replay_report(report)[:EXCEL_CELL_LIMIT])
+        written += 1
+    temp_path = path + ".tmp"
+    wb.save(temp_path)
+    os.replace(temp_path, path)
+    return written
+
+
+# Excel persistence
+EXCEL_WRAP_COLUMNS = {"preconditions", "test_steps", "expected_result", "actual_result", "step_timing", "screenshots"}
+EXCEL_MAX_COLUMN_WIDTH = 50
+EXCEL_MAX_ROW = 1048576
+EXCEL_SAVE_DEBOUNCE = 0.5  # Seconds without a new save request before the workbook is written
+EXCEL_SAVE_MAX_DELAY = 5.0  # ...but never hold a save longer than this during a steady stream of requests
+EXCEL_SHUTDOWN_FLUSH_TIMEOUT = 60  # Seconds to wait for the final save when the window is closed
+TEST_CASE_JOURNAL_FILE = "test_cases_journal.jsonl"  # Saved test cases not yet compacted into the workbook
+EXCEL_HEADER_FILL = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+EXCEL_HEADER_FONT = Font(bold=True, color="FFFFFF", size=11)
+EXCEL_BORDER = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+EXCEL_WRAP = Alignment(wrap_text=True, vertical="top")
+# Layout before TC_ID/TC_Module/... headers (read positionally, rewritten in the current layout on the next save)
+EXCEL_LEGACY_KEYS = ["test_id", "test_name", "description", "preconditions", "test_steps", "expected_result",
+                     "actual_result", "status", "priority", "module", "page", "tab", "url", "created_date"]
+
+
+def excel_column_widths(test_cases):
+    """Width of every column for a sheet of test cases - the longest value (capped), at least the header"""
+    widths = [len(header) + 2 for header, key in EXCEL_COLUMNS]
+    for test_case in test_cases:
+        for index, (header, key) in enumerate(EXCEL_COLUMNS):
+            value = test_case.get(key)
+            if value:
+                width = min(len(str(value)) + 2, EXCEL_MAX_COLUMN_WIDTH)
+                if width > widths[index]:
+                    widths[index] = width
+    return widths
+
+
+class ExcelWorkbookWriter:
+    """Keeps the workbook in step with the saved test cases without rebuilding its sheets on every save.
+    
+    The workbook stays loaded between saves. append() writes a new test case below the last row of its
+    module sheet and update() rewrites an edited one in place (rows are found by test ID), so a save
+    touches only what changed in memory (column widths are widened from the written rows only). save()
+    still writes the whole file, so it is O(n) in the suite size; that is why it runs only on the worker
+    thread, once per debounced burst. export_all() - the full rewrite of every module sheet - runs only
+    when asked for or when a sheet's header differs from EXCEL_HEADERS (schema change). If the file was changed behind our back it is reloaded before writing.
+    Not thread-safe: after load() it is used by the ExcelPersistenceWorker thread only.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.wb = None
+        self.mtime = None  # File mtime after our last load/save
+        self.rows = {}  # test ID -> (sheet title, row)
+        self.next_row = {}  # sheet title -> first free row (ws.max_row scans every cell)
+        self.widths = {}  # sheet title -> {column: width}
+        self.needs_export = False  # A sheet has an older/other layout - export_all() rewrites it
+        self.unsaved = False  # The loaded workbook has changes save() hasn't written yet
+        self.generation = 0  # Bumped whenever the workbook is (re)loaded - unsaved writes to older ones are gone
+    
+    # Loading
+    
+    def load(self):
+        """Read every module sheet (the workbook stays loaded); returns {module: [test cases]}"""
+        by_module = {}
+        self._reset()
+        try:
+            wb = load_workbook(self.path)
+        except FileNotFoundError:
+            return by_module
+        for ws in wb.worksheets:
+            header = [cell.value for cell in ws[1]] if ws.max_row else []
+            if header[:len(EXCEL_HEADERS)] != EXCEL_HEADERS or len([h for h in header if h]) != len(EXCEL_HEADERS):
+                self.needs_export = True  # Older/other layout - rewritten in the current one
+            if "Execution_Steps" in header:
+                keys = [EXCEL_HEADER_KEYS.get(name) for name in header]
+            else:
+                keys = EXCEL_LEGACY_KEYS
+            test_cases = by_module.setdefault(ws.title, [])
+            for row_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), 2):
+                if not row or not row[0]:
+                    continue
+                test_case = {"test_name": "", "description": "", "page": "", "tab": ""}
+                test_case.update({key: ("" if value is None else value) for key, value in zip(keys, row) if key})
+                test_case["status"] = test_case.get("status") or "Not Executed"
+                test_case["priority"] = test_case.get("priority") or "Medium"
+                test_case["module"] = test_case.get("module") or ws.title
+                if not (isinstance(test_case.get("created_date"), str) and ':' in test_case["created_date"]):
+                    test_case["created_date"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                test_cases.append(test_case)
+                self.rows[str(row[0])] = (ws.title, row_num)
+            self.next_row[ws.title] = ws.max_row + 1
+        self.wb = wb
+        self.generation += 1
+        self.mtime = self._file_mtime()
+        return by_module
+    
+    def _reset(self):
+        self.wb = None
+        self.rows.clear()
+        self.next_row.clear()
+        self.widths.clear()
+        self.needs_export = False
+        self.unsaved = False
+    
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+    
+    def _workbook(self):
+        """The loaded workbook - reloaded (rows re-indexed by test ID) if the file changed since our last save"""
+        if self.wb is not None and self._file_mtime() == self.mtime:
+            return self.wb
+        self._reset()
+        try:
+            wb = load_workbook(self.path)
+        except FileNotFoundError:
+            wb = Workbook()
+            wb.remove(wb.active)  # Remove default sheet
+        for ws in wb.worksheets:
+            for row_num, (test_id,) in enumerate(ws.iter_rows(min_row=2, max_col=1, values_only=True), 2):
+                if test_id:
+                    self.rows[str(test_id)] = (ws.title, row_num)
+            self.next_row[ws.title] = ws.max_row + 1
+        self.wb = wb
+        self.generation += 1
+        self.mtime = self._file_mtime()
+        return wb
+    
+    def current_generation(self):
+        """Generation of the workbook the next write goes to (reloaded first if the file changed)"""
+        self._workbook()
+        return self.generation
+    
+    # Writing (in memory - save() puts it on disk)
+    
+    def append(self, module, test_case):
+        """Write a new test case below the last row of its module sheet"""
+        ws = self._sheet(self._workbook(), module)
+        row = self.next_row[ws.title]
+        self.next_row[ws.title] = row + 1
+        self._write_row(ws, row, test_case)
+        self.rows[str(test_case.get("test_id"))] = (ws.title, row)
+        self.unsaved = True
+    
+    def update(self, test_case):
+        """Rewrite an already written test case in place (resolved step, screenshot, replay result, ...);
+        returns False if its row is not in the workbook"""
+        wb = self._workbook()
+        location = self.rows.get(str(test_case.get("test_id")))
+        if not location or location[0] not in wb.sheetnames:
+            return False
+        self._write_row(wb[location[0]], location[1], test_case)
+        self.unsaved = True
+        return True
+    
+    def export_all(self, test_cases_by_module):
+        """Full rewrite: every module sheet is cleared and written again from memory (other sheets are kept).
+        Streamed straight to disk (stream_export) unless the file has sheets of its own to keep."""
+        if self._module_sheets_only(test_cases_by_module):
+            self.stream_export(test_cases_by_module)
+            return
+        wb = self._workbook()
+        for module, test_cases in test_cases_by_module.items():
+            if not test_cases:
+                continue
+            title = module[:31]  # Excel sheet name limit
+            index = None
+            if title in wb.sheetnames:
+                index = wb.sheetnames.index(title)  # Recreated in the same place
+                del wb[title]
+            ws = self._sheet(wb, module, index)
+            for row, test_case in enumerate(test_cases, 2):
+                self._write_row(ws, row, test_case)
+                self.rows[str(test_case.get("test_id"))] = (ws.title, row)
+            self.next_row[ws.title] = len(test_cases) + 2
+        self.needs_export = False
+        self.unsaved = True
+    
+    def _module_sheets_only(self, test_cases_by_module):
+        """True if every sheet in the workbook is one of the module sheets an export rewrites"""
+        titles = {module[:31] for module in test_cases_by_module}
+        try:
+            if self.wb is not None and self._file_mtime() == self.mtime:
+                sheetnames = self.wb.sheetnames
+            else:
+                wb = load_workbook(self.path, read_only=True)
+                sheetnames = wb.sheetnames
+                wb.close()
+        except FileNotFoundError:
+            return True
+        return set(sheetnames) <= titles
+    
+    def stream_export(self, test_cases_by_module):
+        """Full export with openpyxl's write-only workbook: rows are streamed to disk module by module
+        instead of building every cell in memory, so memory use stays flat however big the suite is.
+        
+        Column widths are set up front from excel_column_widths() (write-only sheets can't be widened
+        afterwards), status colors are conditional formatting rules on the Status column instead of a fill
+        per cell, and data cells copy the style of one prebuilt cell per column. Existing sheets keep
+        their order; the loaded workbook is dropped and reloaded by the next incremental write.
+        """
+        order = []
+        try:
+            wb = load_workbook(self.path, read_only=True)
+            order = wb.sheetnames
+            wb.close()
+        except FileNotFoundError:
+            pass
+        sheets = {}
+        for module, test_cases in test_cases_by_module.items():
+            sheets.setdefault(module[:31], []).extend(test_cases)
+        titles = [title for title in order if title in sheets] + [title for title in sheets if title not in order]
+        
+        wb = Workbook(write_only=True)
+        status_column = get_column_letter(EXCEL_HEADERS.index("Status") + 1)
+        for title in titles:
+            test_cases = sheets[title]
+            ws = wb.create_sheet(title=title)
+            for col_num, width in enumerate(excel_column_widths(test_cases), 1):
+                ws.column_dimensions[get_column_letter(col_num)].width = width
+            ws.freeze_panes = "A2"  # Freeze header row
+            for status, color in STATUS_COLORS.items():
+                ws.conditional_formatting.add(
+                    f"{status_column}2:{status_column}{EXCEL_MAX_ROW}",
+                    CellIsRule(operator="equal", formula=[f'"{status}"'],
+                               fill=PatternFill(start_color=color, end_color=color, fill_type="solid")))
+            header_row = []
+            for header in EXCEL_HEADERS:
+                cell = WriteOnlyCell(ws, header)
+                cell.fill = EXCEL_HEADER_FILL
+                cell.font = EXCEL_HEADER_FONT
+                cell.alignment = Alignment(horizontal="center", vertical="center")
+                cell.border = EXCEL_BORDER
+                header_row.append(cell)
+            ws.append(header_row)
+            templates = []
+            for header, key in EXCEL_COLUMNS:
+                template = WriteOnlyCell(ws)
+                template.border = EXCEL_BORDER
+                if key in EXCEL_WRAP_COLUMNS:
+                    template.alignment = EXCEL_WRAP
+                templates.append((key, template._style))
+            for test_case in test_cases:
+                row = []
+                for key, style in templates:
+                    cell = WriteOnlyCell(ws, test_case.get(key, ""))
+                    cell._style = copy(style)  # Shared style ids - no per-cell style lookups
+                    row.append(cell)
+                ws.append(row)
+        self._replace(wb)
+        self._reset()  # Reloaded from the new file by the next incremental write
+    
+    def save(self):
+        """Put the workbook on disk: written to a temp file next to it and swapped in, so a crash or a
+        failed write never leaves a half-written workbook"""
+        if self.wb is None or not self.unsaved:
+            return
+        self._replace(self.wb)
+        self.unsaved = False
+    
+    def _replace(self, wb):
+        temp_path = self.path + ".tmp"
+        try:
+            wb.save(temp_path)
+            os.replace(temp_path, self.path)
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        self.mtime = self._file_mtime()
+    
+    def _sheet(self, wb, module, index=None):
+        """Module sheet, created with the styled header row if it doesn't exist yet"""
+        title = module[:31]
+        if title in wb.sheetnames:
+            ws = wb[title]
+            if title not in self.next_row:
+                self.next_row[title] = ws.max_row + 1
+            return ws
+        ws = wb.create_sheet(title=title, index=index)
+        for col_num, header in enumerate(EXCEL_HEADERS, 1):
+            cell = ws.cell(row=1, column=col_num, value=header)
+            cell.fill = EXCEL_HEADER_FILL
+            cell.font = EXCEL_HEADER_FONT
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+            cell.border = EXCEL_BORDER
+            ws.column_dimensions[get_column_letter(col_num)].width = len(header) + 2
+        self.widths[title] = {}
+        ws.freeze_panes = "A2"  # Freeze header row
+        self.next_row[title] = 2
+        return ws
+    
+    def _write_row(self, ws, row, test_case):
+        widths = self.widths.setdefault(ws.title, {})
+        for col_num, (header, key) in enumerate(EXCEL_COLUMNS, 1):
+            value = test_case.get(key, "")
+            cell = ws.cell(row=row, column=col_num, value=value)
+            cell.border = EXCEL_BORDER
+            if key in EXCEL_WRAP_COLUMNS:
+                cell.alignment = EXCEL_WRAP
+            # Widen the column if this value is longer than anything written so far (capped)
+            if value:
+                width = min(len(str(value)) + 2, EXCEL_MAX_COLUMN_WIDTH)
+                dimension = ws.column_dimensions[get_column_letter(col_num)]
+                if col_num not in widths:
+                    widths[col_num] = dimension.width or len(header) + 2
+                if width > widths[col_num]:
+                    widths[col_num] = dimension.width = width
+        color = STATUS_COLORS.get(test_case.get("status", ""))
+        status_cell = ws.cell(row=row, column=EXCEL_HEADERS.index("Status") + 1)
+        status_cell.fill = (PatternFill(start_color=color, end_color=color, fill_type="solid") if color
+                            else PatternFill(fill_type=None))
+
+
+class TestCaseJournal:
+    """Write-ahead log of saved test cases: one JSON line per new ("append") or edited ("update") test
+    case, flushed and fsync'd before append() returns, so a test case is on disk long before the
+    workbook is written - and survives a workbook that can't be written or read.
+    
+    position() is (generation, end offset). checkpoint(position) is called once everything up to that
+    position is in the workbook; the file is emptied (next generation) if nothing was journaled since.
+    open() returns the entries still in the file - the ones a crash kept out of the workbook - and drops
+    a torn last line.
+    """
+    
+    def __init__(self, path=TEST_CASE_JOURNAL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self.generation = 0
+        self.appended = 0
+        self.checkpoints = 0  # Times the file was emptied
+        self.sync_seconds = 0.0  # Time spent in append() (write + fsync)
+        self.torn_bytes = 0  # Torn/unreadable data dropped by open()
+    
+    def open(self):
+        """Open (creating if needed); returns the entries found as [(op, module, test case)]"""
+        entries = []
+        with self._lock:
+            try:
+                with open(self.path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                data = b""
+            good_end = data.rfind(b"\n") + 1  # A line without its newline was torn by a crash
+            for line in data[:good_end].splitlines():
+                try:
+                    record = json.loads(line)
+                    entries.append((record["op"], record.get("module"), record["test_case"]))
+                except (ValueError, KeyError, TypeError):
+                    self.torn_bytes += len(line) + 1
+            self.torn_bytes += len(data) - good_end
+            self._file = open(self.path, "r+b" if data else "w+b")
+            self._file.truncate(good_end)
+            self._file.seek(good_end)
+        return entries
+    
+    def append(self, entries):
+        """Journal [(op, module, test case)] durably (one fsync); returns the position after them"""
+        data = b"".join(json.dumps({"op": op, "module": module, "test_case": test_case},
+                                   ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+                        for op, module, test_case in entries)
+        with self._lock:
+            started = time.perf_counter()
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.sync_seconds += time.perf_counter() - started
+            self.appended += len(entries)
+            return (self.generation, self._file.tell())
+    
+    def position(self):
+        with self._lock:
+            return (self.generation, self._file.tell()) if self._file else None
+    
+    def checkpoint(self, position):
+        """Everything journaled up to position is in the workbook"""
+        with self._lock:
+            if not self._file or position != (self.generation, self._file.tell()) or not position[1]:
+                return
+            self._file.seek(0)
+            self._file.truncate()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.generation += 1
+            self.checkpoints += 1
+    
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+    
+    def get_stats(self):
+        return {"appended": self.appended, "checkpoints": self.checkpoints, "torn_bytes": self.torn_bytes,
+                "sync_ms": self.sync_seconds * 1000}
+
+
+class ExcelPersistenceWorker:
+    """Writes the workbook on its own thread so saving never blocks the Tk thread.
+    
+    The Tk thread queues operations - append(), update(), export_all() - holding shallow copies of the
+    test cases, so the worker never reads the live test_cases_by_module. Bursts are coalesced: the
+    writer thread waits until no request has come in for EXCEL_SAVE_DEBOUNCE seconds (but no longer
+    than EXCEL_SAVE_MAX_DELAY after the first one), applies everything queued to the workbook and
+    saves it once. Outcomes are reported through post(func) - the UI event queue - as
+    on_saved(count, seconds) / on_error(exception); an operation's on_written callback runs (on the Tk
+    thread) once it is on disk. A failed save is retried with the next request or at stop().
+    
+    With a TestCaseJournal, append() and update() journal the test case (fsync'd) before queuing it, so
+    it is durable when they return; after a successful save the journal is checkpointed - the workbook
+    is the compacted form of the journal.
+    """
+    
+    DISK = "disk"
+    
+    def __init__(self, writer, post, on_saved=None, on_error=None, journal=None,
+                 debounce=EXCEL_SAVE_DEBOUNCE, max_delay=EXCEL_SAVE_MAX_DELAY):
+        self.writer = writer
+        self.post = post
+        self.journal = journal
+        self.on_saved = on_saved
+        self.on_error = on_error
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._ops = []  # (kind, payload, on_written, journal position) waiting for the next write
+        self._first_request = 0.0
+        self._last_request = 0.0
+        self._flush = False  # Skip the quiet period (flush()/stop())
+        self._stopping = False
+        self._busy = False
+        self._unsaved = None  # Operations of a failed write, retried with the next one; None: all saved
+        self._thread = None
+        self.writes = 0
+        self.requests = 0  # Operations queued (writes / requests = coalescing)
+        self.failures = 0
+        self.last_write_seconds = 0.0
+    
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="ExcelPersistence", daemon=True)
+            self._thread.start()
+    
+    # Requests (any thread)
+    
+    def append(self, module, test_case, on_written=None):
+        test_case = dict(test_case)
+        self._queue([("append", (module, test_case), on_written, ("append", module, test_case))])
+    
+    def update(self, test_case, on_written=None):
+        self.update_many([test_case], on_written)
+    
+    def update_many(self, test_cases, on_written=None):
+        """update() for a batch of test cases (one journal fsync); on_written runs once for all of them"""
+        test_cases = [dict(test_case) for test_case in test_cases]
+        self._queue([("update", test_case, on_written if index == len(test_cases) - 1 else None,
+                      ("update", None, test_case)) for index, test_case in enumerate(test_cases)])
+    
+    def export_all(self, test_cases_by_module, on_written=None):
+        """Queue a full rewrite from a snapshot of every module's test cases"""
+        snapshot = {module: [dict(test_case) for test_case in test_cases]
+                    for module, test_cases in test_cases_by_module.items()}
+        self._queue([("export", snapshot, on_written, None)])
+    
+    def recover(self, entries, on_written=None):
+        """Queue journal/store entries found at startup (already journaled - not written to it again);
+        "upsert" entries rewrite the test case's row, or append it if the workbook doesn't have it"""
+        self._queue([(op, (module, test_case) if op != "update" else test_case,
+                      on_written if index == len(entries) - 1 else None, None)
+                     for index, (op, module, test_case) in enumerate(entries)])
+    
+    def _queue(self, requests):
+        """requests: [(kind, payload, on_written, journal entry or None)]"""
+        if not requests:
+            return
+        with self._cond:
+            # Journaled under the lock so journal order is queue order; export/recovered operations cover
+            # everything journaled so far (the test cases are in memory)
+            position = None
+            if self.journal:
+                entries = [request[3] for request in requests if request[3]]
+                position = self.journal.append(entries) if entries else self.journal.position()
+            now = time.monotonic()
+            if not self._ops:
+                self._first_request = now
+            self._last_request = now
+            self._ops.extend((kind, payload, on_written, position) for kind, payload, on_written, _ in requests)
+            self.requests += len(requests)
+            self._cond.notify_all()
+    
+    def pending(self):
+        with self._cond:
+            return len(self._ops) + (1 if self._busy else 0) + (1 if self._unsaved is not None else 0)
+    
+    def flush(self, timeout=None):
+        """Write what is queued now (no quiet period) and wait for it; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if self._unsaved is not None and not self._ops:
+                self._ops.append(("retry", None, None, None))
+            self._flush = True
+            self._cond.notify_all()
+            while self._ops or self._busy:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return self._unsaved is None
+    
+    def stop(self, timeout=None):
+        """Final flush (atomic save of everything still queued) and end the thread; returns False if
+        something could not be written. timeout bounds the flush and the join together."""
+        if self._thread is None:
+            return not self._ops and self._unsaved is None
+        deadline = None if timeout is None else time.monotonic() + timeout
+        written = self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        self._thread = None
+        return written
+    
+    # Writer thread
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._ops and not self._stopping:
+                    self._cond.wait()
+                if not self._ops:
+                    return
+                # Coalesce: wait for a quiet period (bounded by max_delay since the first request)
+                while not (self._flush or self._stopping):
+                    due = min(self._last_request + self.debounce, self._first_request + self.max_delay)
+                    remaining = due - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                ops, self._ops = self._ops, []
+                self._flush = False
+                self._busy = True
+            self._write(ops)
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+    
+    def _write(self, ops):
+        # (op, where it was applied): None = not yet, DISK = written straight to the file (streamed
+        # export), else the writer generation it went into - lost if the workbook was reloaded since
+        pending = (self._unsaved or []) + [(op, None) for op in ops]
+        count = sum(1 for op, _ in pending if op[0] != "retry")
+        done = []
+        started = time.perf_counter()
+        try:
+            generation = (self.writer.current_generation()
+                          if any(isinstance(applied, int) for op, applied in pending) else None)
+            for op, applied in pending:
+                if applied is None or (isinstance(applied, int) and applied != generation):
+                    applied = self._apply(op, retry=applied is not None)
+                done.append((op, applied))
+            # Re-apply what a reload (file changed by someone else) dropped from the loaded workbook
+            for _ in range(3):
+                if not any(isinstance(applied, int) for op, applied in done):
+                    break
+                generation = self.writer.current_generation()
+                stale = [index for index, (op, applied) in enumerate(done)
+                         if isinstance(applied, int) and applied != generation]
+                if not stale:
+                    break
+                for index in stale:
+                    done[index] = (done[index][0], self._apply(done[index][0], retry=True))
+            else:
+                raise RuntimeError(f"{self.writer.path} keeps changing while it is being saved")
+            self.writer.save()
+        except Exception as e:
+            # Applied operations are in the loaded workbook (the next save writes them, or re-applies them
+            # if it was reloaded meanwhile); the rest run again
+            self._unsaved = done + pending[len(done):]
+            self.failures += 1
+            if self.on_error:
+                self.post(lambda error=e: self.on_error(error))
+            return
+        ops = [op for op, _ in pending]
+        self._unsaved = None
+        self.writes += 1
+        self.last_write_seconds = time.perf_counter() - started
+        seconds = self.last_write_seconds
+        positions = [op[3] for op in ops if op[3] is not None]
+        if positions:
+            self.journal.checkpoint(positions[-1])
+        for kind, payload, on_written, _ in ops:
+            if on_written:
+                self.post(on_written)
+        if self.on_saved:
+            self.post(lambda: self.on_saved(count, seconds))
+    
+    def _apply(self, op, retry):
+        """Apply one operation to the writer; returns where it went (see _write). A retried append is
+        an upsert - the reloaded file may already have the row."""
+        kind, payload = op[0], op[1]
+        if kind == "export":
+            self.writer.export_all(payload)
+            return self.DISK if self.writer.wb is None else self.writer.generation
+        if kind == "append" and not retry:
+            self.writer.append(*payload)
+        elif kind == "update":
+            self.writer.update(payload)
+        elif kind in ("append", "upsert"):
+            if not self.writer.update(payload[1]):
+                self.writer.append(*payload)
+        else:
+            return self.DISK  # "retry" - nothing to write
+        return self.writer.generation
+    
+    def get_stats(self):
+        return {"requests": self.requests, "writes": self.writes, "failures": self.failures,
+                "pending": self.pending(), "last_write_seconds": self.last_write_seconds}
+
+
+# Optional SQLite test case store (--sqlite): indexed source of truth, the workbook becomes an export view
+TEST_CASE_DB_FILE = "test_cases.db"
+TEST_CASE_ID_NUMBER = re.compile(r"_(\d+)$")
+
+
+class TestCaseStore:
+    """Saved test cases in SQLite (WAL mode), indexed by test ID, module, status, URL and created date.
+    
+    A row is the test case as JSON plus the indexed columns, which query()/count() filter on instead of
+    scanning the loaded test cases; `sheet` is its key in test_cases_by_module
+    and `synced` is 0 until the ExcelPersistenceWorker has written it to the workbook (rows still at 0
+    on startup are queued again). Every add/update gives the row a new `version`; mark_synced() only
+    applies to the version that was written, so an edit made meanwhile stays unsynced. Each add/update
+    is one committed transaction. Used from the Tk thread only.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS test_cases (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_id TEXT NOT NULL UNIQUE,
+            sheet TEXT NOT NULL,
+            module TEXT,
+            status TEXT,
+            url TEXT,
+            created_date TEXT,
+            number INTEGER,
+            version INTEGER NOT NULL DEFAULT 0,
+            synced INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS test_cases_sheet ON test_cases (sheet, number);
+        CREATE INDEX IF NOT EXISTS test_cases_module ON test_cases (module, status);
+        CREATE INDEX IF NOT EXISTS test_cases_status ON test_cases (status);
+        CREATE INDEX IF NOT EXISTS test_cases_url ON test_cases (url);
+        CREATE INDEX IF NOT EXISTS test_cases_created ON test_cases (created_date);
+        CREATE INDEX IF NOT EXISTS test_cases_unsynced ON test_cases (synced) WHERE synced = 0;
+    """
+    
+    def __init__(self, path=TEST_CASE_DB_FILE):
+        self.path = path
+        self.db = None
+        self.version = 0  # Last version handed out
+        self.writes = 0
+        self.write_seconds = 0.0
+    
+    def open(self):
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL")  # A committed save survives a power cut too
+        self.db.executescript(self.SCHEMA)
+        self.db.commit()
+        self.version = self.db.execute("SELECT MAX(version) FROM test_cases").fetchone()[0] or 0
+    
+    def close(self):
+        if self.db:
+            self.db.close()
+            self.db = None
+    
+    def _next_version(self):
+        self.version += 1
+        return self.version
+    
+    # Writing - each returns {test ID: version} for mark_synced()
+    
+    def add(self, sheet, test_case):
+        return self.add_many([(sheet, test_case)])
+    
+    def add_many(self, items, synced=False):
+        """Insert [(sheet, test case)] in one transaction (an existing test ID is replaced)"""
+        started = time.perf_counter()
+        rows = []
+        for sheet, test_case in items:
+            match = TEST_CASE_ID_NUMBER.search(str(test_case.get("test_id", "")))
+            rows.append((str(test_case.get("test_id", "")), sheet, test_case.get("module") or sheet,
+                         test_case.get("status"), test_case.get("url"), str(test_case.get("created_date") or ""),
+                         int(match.group(1)) if match else None, self._next_version(), int(synced),
+                         json.dumps(test_case, ensure_ascii=False, default=str)))
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO test_cases (test_id, sheet, module, status, url, created_date, number, "
+                "version, synced, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.writes += 1
+        self.write_seconds += time.perf_counter() - started
+        return {row[0]: row[7] for row in rows}
+    
+    def update(self, test_case):
+        return self.update_many([test_case])
+    
+    def update_many(self, test_cases):
+        """Store edited test cases (found by test ID) in one transaction"""
+        started = time.perf_counter()
+        rows = [(test_case.get("status"), test_case.get("url"), json.dumps(test_case, ensure_ascii=False, default=str),
+                 self._next_version(), str(test_case.get("test_id", ""))) for test_case in test_cases]
+        with self.db:
+            self.db.executemany(
+                "UPDATE test_cases SET status = ?, url = ?, data = ?, version = ?, synced = 0 WHERE test_id = ?", rows)
+        self.writes += 1
+        self.write_seconds += time.perf_counter() - started
+        return {row[4]: row[3] for row in rows}
+    
+    def mark_synced(self, versions):
+        """These versions of the test cases ({test ID: version}) are in the workbook"""
+        with self.db:
+            self.db.executemany("UPDATE test_cases SET synced = 1 WHERE test_id = ? AND version = ?",
+                                list(versions.items()))
+    
+    # Reading
+    
+    def is_empty(self):
+        return self.db.execute("SELECT 1 FROM test_cases LIMIT 1").fetchone() is None
+    
+    def count(self, module=None, status=None, url=None, created_from=None, created_to=None):
+        """Number of test cases matching query()'s filters (all of them without any)"""
+        where, params = self._where(module, status, url, created_from, created_to)
+        return self.db.execute("SELECT COUNT(*) FROM test_cases" + where, params).fetchone()[0]
+    
+    def load(self):
+        """{sheet: [test cases]} in save order"""
+        by_module = {}
+        for sheet, data in self.db.execute("SELECT sheet, data FROM test_cases ORDER BY seq"):
+            by_module.setdefault(sheet, []).append(json.loads(data))
+        return by_module
+    
+    def counters(self):
+        """{sheet: highest test case number} - where the test ID counters continue from"""
+        return {sheet: number or 0 for sheet, number in
+                self.db.execute("SELECT sheet, MAX(number) FROM test_cases GROUP BY sheet")}
+    
+    def unsynced(self):
+        """[(sheet, test case)] not written to the workbook yet, and their {test ID: version}"""
+        items, versions = [], {}
+        for test_id, sheet, version, data in self.db.execute(
+                "SELECT test_id, sheet, version, data FROM test_cases WHERE synced = 0 ORDER BY seq"):
+            items.append((sheet, json.loads(data)))
+            versions[test_id] = version
+        return items, versions
+    
+    def find(self, test_id):
+        row = self.db.execute("SELECT data FROM test_cases WHERE test_id = ?", (str(test_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    def query(self, module=None, status=None, url=None, created_from=None, created_to=None):
+        """[(sheet, test case)] matching every given filter, in save order. created_from <= created_date
+        < created_to ("YYYY-MM-DD[ HH:MM:SS]" strings, as written by the app)."""
+        where, params = self._where(module, status, url, created_from, created_to)
+        return [(sheet, json.loads(data)) for sheet, data in
+                self.db.execute("SELECT sheet, data FROM test_cases" + where + " ORDER BY seq", params)]
+    
+    @staticmethod
+    def _where(module=None, status=None, url=None, created_from=None, created_to=None):
+        """WHERE clause (bound parameters only) over the indexed columns"""
+        clauses, params = [], []
+        for column, value in (("module", module), ("status", status), ("url", url)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if created_from:
+            clauses.append("created_date >= ?")
+            params.append(created_from)
+        if created_to:
+            clauses.append("created_date < ?")
+            params.append(created_to)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+    
+    def recent_ids(self, limit=5):
+        return [test_id for (test_id,) in
+                self.db.execute("SELECT test_id FROM test_cases ORDER BY seq DESC LIMIT ?", (limit,))]
+    
+    def get_stats(self):
+        return {"writes": self.writes, "write_ms": self.write_seconds * 1000}
+
+
+class UIEventQueue:
+    """Bounded hand-off from listener/monitor threads to the Tk thread.
+    
+    Records are ("call", func) or ("log", entry, level); the Tk thread drains them in batches
+    from a single periodic tick instead of one root.after() per event. Overflow policy: once
+    `maxsize` records are waiting, droppable records (log lines, notices) are refused and counted;
+    step records are still accepted up to `hard_limit` so captured actions are not lost to a log burst.
+    
+    Lock-free: producers only append() and the Tk thread only popleft(), both atomic on a deque. The
+    depth check and the append are not one step, so concurrent producers can overshoot a limit by one
+    record each, and the counters are statistics that may miss an increment under contention.
+    """
+
+    def __init__(self, maxsize=UI_QUEUE_MAXSIZE, hard_limit=None):
+        self.maxsize = maxsize
+        self.hard_limit = hard_limit or maxsize * 4
+        self._records = deque()
+        self.posted = 0
+        self.dropped = 0  # Droppable records refused while the queue was full
+        self.dropped_steps = 0  # Step records refused beyond the hard limit
+        self.peak_depth = 0
+        self.batches = 0
+        self.last_batch = 0
+
+    def _put(self, record, droppable):
+        depth = len(self._records)
+        if depth >= (self.maxsize if droppable else self.hard_limit):
+            if droppable:
+                self.dropped += 1
+            else:
+                self.dropped_steps += 1
+            return False
+        self._records.append(record)
+        self.posted += 1
+        if depth + 1 > self.peak_depth:
+            self.peak_depth = depth + 1
+        return True
+
+    def post_call(self, func, droppable=False):
+        """Queue func() to run on the Tk thread"""
+        return self._put(("call", func), droppable)
+
+    def post_log(self, entry, level):
+        """Queue a formatted log line (always droppable)"""
+        return self._put(("log", entry, level), True)
+
+    def drain(self, limit=UI_TICK_BATCH):
+        """Pop up to `limit` records in FIFO order (Tk thread)"""
+        # Single consumer: the records counted here are still there (producers only append)
+        count = min(limit, len(self._records))
+        batch = [self._records.popleft() for _ in range(count)]
+        if batch:
+            self.batches += 1
+        self.last_batch = len(batch)
+        return batch
+
+    def depth(self):
+        return len(self._records)
+
+    def get_stats(self):
+        """Counters for the status label / diagnostics"""
+        return {
+            "depth": len(self._records),
+            "peak_depth": self.peak_depth,
+            "posted": self.posted,
+            "dropped": self.dropped,
+            "dropped_steps": self.dropped_steps,
+            "batches": self.batches,
+            "last_batch": self.last_batch,
+        }
+
+
+# Step timestamps are time.perf_counter_ns() values; one (wall ns, perf ns) pair taken at startup
+# maps them back to wall-clock time without mixing clocks
+CLOCK_ORIGIN_NS = (time.time_ns(), time.perf_counter_ns())
+
+
+def perf_ns_to_datetime(perf_ns):
+    """Wall-clock datetime of a perf_counter_ns() timestamp"""
+    wall_ns, origin_perf_ns = CLOCK_ORIGIN_NS
+    return datetime.fromtimestamp((wall_ns + perf_ns - origin_perf_ns) / 1e9)
+
+
+def classify_action(text):
+    """Step kind from its text, for steps that arrive without one (same buckets as the capture log)"""
+    text = text.lower()
+    if "dropdown" in text or "menu" in text:
+        return "dropdown"
+    if "switch" in text and "tab" in text:
+        return "tab"
+    if "click" in text:
+        return "click"
+    if "text" in text or "typing" in text:
+        return "text"
+    if "navigate" in text or "window" in text:
+        return "navigation"
+    return "action"
+
+
+class Action:
+    """One captured test step (the actions listbox only displays these)"""
+    __slots__ = ("ts", "kind", "x", "y", "key", "url", "module", "page", "tab", "browser", "text", "step_id",
+                 "since_prev_ms", "since_nav_ms", "seq", "screenshot")
+
+    def __init__(self, text, kind=None, ts=None, x=None, y=None, key=None, url="", module="", page="",
+                 tab="", browser=None, step_id=None):
+        self.ts = ts if ts is not None else time.perf_counter_ns()  # perf_counter_ns() when it happened
+        self.kind = kind or classify_action(text)
+        self.x = x
+        self.y = y
+        self.key = key  # Key name / mouse button / scroll direction
+        self.url = url
+        self.module = module
+        self.page = page
+        self.tab = tab
+        self.browser = browser
+        self.text = text  # Step text without its number, e.g. "[10:15:02] Click button 'Save'"
+        self.step_id = step_id  # ActionMonitor step id (None for manual steps)
+        self.since_prev_ms = 0.0  # Think time since the previous step (set by ActionModel.append)
+        self.since_nav_ms = None  # Time since the last navigation (None before the first one)
+        self.seq = None  # Journal sequence number (ActionJournal.append)
+        self.screenshot = None  # ScreenshotStore id of the screen after the step
+
+    def __repr__(self):
+        return f"Action({self.kind!r}, {self.text!r})"
+
+
+# Captured steps are journaled to disk (crash recovery); only the newest ones stay in memory / in the listbox
+ACTION_JOURNAL_FILE = "test_case_actions.journal"
+ACTION_MEMORY_WINDOW = 500
+ACTION_VIEW_WINDOW = 500
+
+
+class ActionJournal:
+    """Append-only binary journal of captured steps.
+    
+    Layout: MAGIC, then records of RECORD_HEADER (type, payload length, CRC32 of the payload) + payload.
+    STRING records intern kind/key/URL/module/page/tab/browser strings, which ACTION/UPDATE records
+    reference by id; the step text follows the fixed ACTION struct. REMOVE records drop a step by seq,
+    SAVED records note the last seq written to Excel.
+    open() replays the file and cuts off a torn or corrupt tail, so a crash loses at most the record
+    being written. reset() truncates it once nothing unsaved is left.
+    """
+    
+    MAGIC = b"TCJ2\n"
+    RECORD_HEADER = struct.Struct("<BII")
+    # seq, wall-clock ns, ms since previous step, ms since navigation (-1 = none), x, y,
+    # string ids: kind, key, url, module, page, tab, browser, screenshot
+    ACTION = struct.Struct("<Iqffii8I")
+    STRING, ACTION_RECORD, UPDATE, REMOVE, SAVED = 1, 2, 3, 4, 5
+    NO_COORD = -2 ** 31
+
+    def __init__(self, path=ACTION_JOURNAL_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        self._reader = None
+        self.next_seq = 1
+        self.truncated_bytes = 0  # Torn/corrupt tail dropped by the last open()
+        self.saved_seq = 0  # Steps up to this seq are in the workbook
+        self.unsaved_on_open = 0  # Live steps found by open() that were never saved
+        self._reset_strings()
+
+    def _reset_strings(self):
+        self._strings = [None]  # id -> string (0 = None)
+        self._string_ids = {}
+
+    # Opening / recovery
+    
+    def open(self):
+        """Open (creating if needed) and replay the journal; returns the offsets of the live steps in order"""
+        with self._lock:
+            live = []  # Record offsets of live steps
+            seq_index = {}  # seq -> position in live
+            good_end = len(self.MAGIC)
+            self._reset_strings()
+            try:
+                with open(self.path, "rb") as f:
+                    if f.read(len(self.MAGIC)) != self.MAGIC:
+                        raise ValueError("not a journal")
+                    while True:
+                        offset = f.tell()
+                        header = f.read(self.RECORD_HEADER.size)
+                        if len(header) < self.RECORD_HEADER.size:
+                            break
+                        kind, length, crc = self.RECORD_HEADER.unpack(header)
+                        payload = f.read(length)
+                        if len(payload) < length or zlib.crc32(payload) != crc:
+                            break  # Torn write - everything from here on is dropped
+                        if kind == self.STRING:
+                            self._strings.append(payload.decode("utf-8", "replace"))
+                        elif kind in (self.ACTION_RECORD, self.UPDATE):
+                            seq = struct.unpack_from("<I", payload)[0]
+                            if kind == self.UPDATE and seq in seq_index:
+                                live[seq_index[seq]] = offset
+                            elif kind == self.ACTION_RECORD:
+                                seq_index[seq] = len(live)
+                                live.append(offset)
+                            self.next_seq = max(self.next_seq, seq + 1)
+                        elif kind == self.SAVED:
+                            self.saved_seq = struct.unpack_from("<I", payload)[0]
+                        elif kind == self.REMOVE:
+                            seq = struct.unpack_from("<I", payload)[0]
+                            position = seq_index.pop(seq, None)
+                            if position is not None:
+                                del live[position]
+                                for other, i in seq_index.items():
+                                    if i > position:
+                                        seq_index[other] = i - 1
+                        good_end = f.tell()
+                    size = f.seek(0, os.SEEK_END)
+            except (FileNotFoundError, ValueError):
+                size = None
+            
+            mode = "r+b" if size is not None else "w+b"
+            self._file = open(self.path, mode)
+            if size is None:
+                self._file.write(self.MAGIC)
+                self.truncated_bytes = 0
+            else:
+                self.truncated_bytes = size - good_end
+                self._file.truncate(good_end)
+            self._file.seek(0, os.SEEK_END)
+            self._file.flush()
+            self._string_ids = {string: i for i, string in enumerate(self._strings) if i}
+            self._reader = open(self.path, "rb")
+            self.unsaved_on_open = sum(1 for seq in seq_index if seq > self.saved_seq)
+            return live
+
+    def close(self):
+        with self._lock:
+            for f in (self._file, self._reader):
+                if f:
+                    f.close()
+            self._file = self._reader = None
+
+    def reset(self):
+        """Nothing unsaved is left - drop every record (keeps the file small across a long session)"""
+        with self._lock:
+            if not self._file:
+                return
+            self._file.seek(len(self.MAGIC))
+            self._file.truncate()
+            self._file.flush()
+            self._reset_strings()
+            self.saved_seq = self.next_seq - 1
+
+    # Writing
+    
+    def _write(self, kind, payload):
+        """Append one record; returns its offset"""
+        offset = self._file.tell()
+        self._file.write(self.RECORD_HEADER.pack(kind, len(payload), zlib.crc32(payload)) + payload)
+        return offset
+
+    def _intern(self, string):
+        if not string:
+            return 0
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._strings.append(string)
+            self._string_ids[string] = string_id
+            self._write(self.STRING, string.encode("utf-8"))
+        return string_id
+
+    def _encode(self, action):
+        wall_ns = CLOCK_ORIGIN_NS[0] + action.ts - CLOCK_ORIGIN_NS[1]
+        return self.ACTION.pack(
+            action.seq, wall_ns, action.since_prev_ms,
+            -1.0 if action.since_nav_ms is None else action.since_nav_ms,
+            self.NO_COORD if action.x is None else int(action.x),
+            self.NO_COORD if action.y is None else int(action.y),
+            self._intern(action.kind), self._intern(action.key), self._intern(action.url),
+            self._intern(action.module), self._intern(action.page), self._intern(action.tab),
+            self._intern(action.browser), self._intern(action.screenshot)) + action.text.encode("utf-8")
+
+    def append(self, action):
+        """Journal a new step (assigns action.seq); returns the record offset"""
+        with self._lock:
+            action.seq = self.next_seq
+            self.next_seq += 1
+            offset = self._write(self.ACTION_RECORD, self._encode(action))
+            self._file.flush()  # In the OS cache - survives the process dying
+            return offset
+
+    def update(self, action):
+        """Journal a changed step; returns the offset of its new record"""
+        with self._lock:
+            offset = self._write(self.UPDATE, self._encode(action))
+            self._file.flush()
+            return offset
+
+    def remove(self, seq):
+        with self._lock:
+            self._write(self.REMOVE, struct.pack("<I", seq))
+            self._file.flush()
+
+    def mark_saved(self, seq=None):
+        """Every step journaled so far (or up to seq) is in the workbook"""
+        with self._lock:
+            self.saved_seq = self.next_seq - 1 if seq is None else max(self.saved_seq, seq)
+            self._write(self.SAVED, struct.pack("<I", self.saved_seq))
+            self._file.flush()
+
+    # Reading
+    
+    def read(self, offset):
+        """Page a step back in from its record offset"""
+        with self._lock:
+            self._reader.seek(offset)
+            kind, length, crc = self.RECORD_HEADER.unpack(self._reader.read(self.RECORD_HEADER.size))
+            payload = self._reader.read(length)
+        (seq, wall_ns, since_prev_ms, since_nav_ms, x, y,
+         kind_id, key_id, url_id, module_id, page_id, tab_id, browser_id,
+         screenshot_id) = self.ACTION.unpack_from(payload)
+        strings = self._strings
+        action = Action(payload[self.ACTION.size:].decode("utf-8", "replace"), strings[kind_id],
+                        ts=wall_ns - CLOCK_ORIGIN_NS[0] + CLOCK_ORIGIN_NS[1],
+                        x=None if x == self.NO_COORD else x, y=None if y == self.NO_COORD else y,
+                        key=strings[key_id], url=strings[url_id] or "", module=strings[module_id] or "",
+                        page=strings[page_id] or "", tab=strings[tab_id] or "", browser=strings[browser_id])
+        action.seq = seq
+        action.screenshot = strings[screenshot_id]
+        action.since_prev_ms = since_prev_ms
+        action.since_nav_ms = None if since_nav_ms < 0 else since_nav_ms
+        return action
+
+    def size(self):
+        with self._lock:
+            return self._file.tell() if self._file else 0
+
+
+class ActionModel:
+    """Ordered steps of the test case being captured - appends and counts are O(1).
+    With a journal, every step is written to disk and only the newest `window` stay in memory;
+    older ones are paged back in from their journal offsets when read."""
+
+    def __init__(self, journal=None, window=ACTION_MEMORY_WINDOW):
+        self.journal = journal
+        self.window = window
+        self.actions = []  # Steps in memory (all of them, or the newest ones when journaled)
+        self.offsets = array('q')  # Journal record offset of every step (journaled models only)
+        self.paged = 0  # Leading steps that are only on disk
+        self._by_step_id = {}
+        self.last_ts = None  # perf_counter_ns() of the latest step (kept across clear())
+        self.last_navigation_ts = None
+
+    def __len__(self):
+        return self.paged + len(self.actions)
+
+    def __iter__(self):
+        for index in range(self.paged):
+            yield self.journal.read(self.offsets[index])
+        yield from list(self.actions)
+
+    def get(self, index):
+        if index < self.paged:
+            return self.journal.read(self.offsets[index])
+        return self.actions[index - self.paged]
+
+    def recover(self):
+        """Load the steps a previous run left in the journal (newest `window` into memory); returns the count"""
+        offsets = self.journal.open()
+        self.clear(keep_journal=True)
+        self.offsets = array('q', offsets)
+        keep = min(self.window, len(offsets))
+        self.paged = len(offsets) - keep
+        self.actions = [self.journal.read(offset) for offset in offsets[self.paged:]]
+        if self.actions:
+            self.last_ts = self.actions[-1].ts
+        return len(offsets)
+
+    def append(self, action):
+        """Add a step and time it against the previous step / last navigation; returns its 1-based step number"""
+        if self.last_ts is not None:
+            action.since_prev_ms = max(0.0, (action.ts - self.last_ts) / 1e6)
+        if self.last_navigation_ts is not None:
+            action.since_nav_ms = max(0.0, (action.ts - self.last_navigation_ts) / 1e6)
+        self.last_ts = max(action.ts, self.last_ts or action.ts)
+        if action.kind == "navigation":
+            self.last_navigation_ts = action.ts
+        if self.journal:
+            self.offsets.append(self.journal.append(action))
+        self.actions.append(action)
+        if action.step_id is not None:
+            self._by_step_id[action.step_id] = action
+        if self.journal and len(self.actions) > self.window:
+            # Page out the oldest quarter (they stay readable from the journal)
+            evicted = self.window // 4 or 1
+            for old in self.actions[:evicted]:
+                self._by_step_id.pop(old.step_id, None)
+            del self.actions[:evicted]
+            self.paged += evicted
+        return len(self)
+
+    def remove(self, index):
+        action = self.get(index)
+        if self.journal:
+            self.journal.remove(action.seq)
+            del self.offsets[index]
+        if index < self.paged:
+            self.paged -= 1
+        else:
+            del self.actions[index - self.paged]
+        self._by_step_id.pop(action.step_id, None)
+        return action
+
+    def set_text(self, index, text):
+        """Change a step's text (journaled)"""
+        action = self.get(index)
+        action.text = text
+        if self.journal:
+            self.offsets[index] = self.journal.update(action)
+        return action
+
+    def set_screenshot(self, action, screenshot_id):
+        """Attach a screenshot to a step that is still in memory (journaled); False if it is gone"""
+        for i in range(len(self.actions) - 1, -1, -1):
+            if self.actions[i] is action:
+                action.screenshot = screenshot_id
+                if self.journal:
+                    self.offsets[self.paged + i] = self.journal.update(action)
+                return True
+        return False
+    
+    def clear(self, keep_journal=False):
+        self.actions = []
+        self.offsets = array('q')
+        self.paged = 0
+        self._by_step_id.clear()
+        if self.journal and not keep_journal:
+            self.journal.reset()
+
+    def find_step(self, step_id):
+        """(index, action) of a captured step by ActionMonitor step id, or (None, None)"""
+        action = self._by_step_id.get(step_id)
+        if action is None:
+            return None, None
+        return self.paged + self.actions.index(action), action
+
+    def line(self, index):
+        """Numbered step text as shown and saved"""
+        return f"{index + 1}. {self.get(index).text}"
+
+    def lines(self, start=0, end=None):
+        end = len(self) if end is None else end
+        return [f"{index + 1}. {self.get(index).text}" for index in range(start, end)]
+
+    def steps_text(self):
+        return '\n'.join(f"{number}. {action.text}" for number, action in enumerate(self, 1))
+
+    def timing_text(self):
+        """One line per step: wall-clock time (ms), think time since the previous step and since the last navigation"""
+        lines = []
+        for number, action in enumerate(self, 1):
+            line = (f"{number}. {perf_ns_to_datetime(action.ts).strftime('%H:%M:%S.%f')[:-3]} "
+                    f"+{action.since_prev_ms:.0f} ms")
+            if action.since_nav_ms is not None:
+                line += f" (nav +{action.since_nav_ms:.0f} ms)"
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def screenshots_text(self):
+        """"<step>. <screenshot id>" for every step that has a screenshot"""
+        return '\n'.join(f"{number}. {action.screenshot}" for number, action in enumerate(self, 1) if action.screenshot)
+    
+    def browsers(self):
+        """Distinct browsers the steps came from, in first-seen order"""
+        return list(dict.fromkeys(action.browser for action in self if action.browser))
+
+
+class InputCoalescer:
+    """Merges raw input events into steps before they are captured: scroll bursts, double-clicks
+    and typing runs. Records are handed to emit(record) as dicts with a "kind" of "click", "scroll"
+    or "text". All methods take an optional `now` (defaults to clock()) so event streams can be
+    replayed deterministically; flush_due(now) releases groups whose time is up. start() runs a
+    timer thread that calls flush_due() for live input. A step emit() fails on is reported to
+    on_error(record, exception)."""
+
+    def __init__(self, emit, scroll_gap=COALESCE_SCROLL_GAP, double_click_gap=COALESCE_DOUBLE_CLICK_GAP,
+                 double_click_distance=COALESCE_DOUBLE_CLICK_DISTANCE, typing_idle=COALESCE_TYPING_IDLE,
+                 clock=time.monotonic, on_error=None):
+        self.emit = emit
+        self.on_error = on_error
+        self.scroll_gap = scroll_gap
+        self.double_click_gap = double_click_gap
+        self.double_click_distance = double_click_distance
+        self.typing_idle = typing_idle
+        self.clock = clock
+        self._lock = threading.RLock()
+        self._wake = threading.Condition(self._lock)
+        self._running = False
+        self.click = None  # Pending click (waiting to see whether a second one follows)
+        self.scroll = None  # Scroll burst in progress
+        self.typing = None  # Typing run in progress
+        self.merged = 0  # Raw events folded into another step
+
+    # Timer thread
+    
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        """Stop the timer thread and release everything still pending"""
+        with self._lock:
+            self._running = False
+            self._wake.notify()
+        self.flush()
+
+    def _run(self):
+        with self._lock:
+            while self._running:
+                deadline = self.next_deadline()
+                timeout = None if deadline is None else max(0.0, deadline - self.clock())
+                self._wake.wait(timeout)
+                if self._running:
+                    self.flush_due()
+
+    def next_deadline(self):
+        """Earliest time a pending group is due (None if nothing is pending)"""
+        deadlines = []
+        if self.click:
+            deadlines.append(self.click["t"] + self.double_click_gap)
+        if self.scroll:
+            deadlines.append(self.scroll["t"] + self.scroll_gap)
+        if self.typing:
+            deadlines.append(self.typing["t"] + self.typing_idle)
+        return min(deadlines) if deadlines else None
+
+    # Input
+    
+    def on_click(self, x, y, button, step_id=None, now=None):
+        """Mouse click; returns True when it was folded into the previous click (double-click)"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            pending = self.click
+            if (pending and pending["button"] == button and pending["count"] == 1
+                    and now - pending["t"] <= self.double_click_gap
+                    and abs(x - pending["x"]) <= self.double_click_distance
+                    and abs(y - pending["y"]) <= self.double_click_distance):
+                pending["count"] = 2
+                self.merged += 1
+                self.click = None
+                self._emit(pending)
+                return True
+            # A click ends scrolling, and moves focus away from the field being typed in
+            self._flush_groups(click=True, scroll=True, typing=True)
+            self.click = {"kind": "click", "x": x, "y": y, "button": button, "count": 1,
+                          "step_id": step_id, "t": now, "ts": now, "ts_ns": time.perf_counter_ns()}
+            self._wake.notify()
+            return False
+
+    def on_scroll(self, x, y, direction, now=None):
+        now = self.clock() if now is None else now
+        with self._lock:
+            burst = self.scroll
+            if burst and burst["direction"] == direction and now - burst["t"] <= self.scroll_gap:
+                burst["count"] += 1
+                burst["t"] = now
+                self.merged += 1
+                return
+            self._flush_groups(click=True, scroll=True)
+            self.scroll = {"kind": "scroll", "x": x, "y": y, "direction": direction, "count": 1,
+                           "t": now, "ts": now, "ts_ns": time.perf_counter_ns()}
+            self._wake.notify()
+
+    def on_char(self, now=None):
+        """Printable character typed"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            run = self.typing
+            if run and now - run["t"] <= self.typing_idle:
+                run["count"] += 1
+                run["t"] = now
+                self.merged += 1
+                return run["count"]
+            self._flush_groups(click=True, scroll=True, typing=True)
+            self.typing = {"kind": "text", "count": 1, "corrections": 0, "t": now, "ts": now,
+                           "ts_ns": time.perf_counter_ns(), "key": None}
+            self._wake.notify()
+            return 1
+
+    def on_correction(self, now=None):
+        """Backspace/Delete - folded into a typing run in progress; returns False when there is none"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            run = self.typing
+            if not run or now - run["t"] > self.typing_idle:
+                return False
+            run["corrections"] += 1
+            run["t"] = now
+            self.merged += 1
+            return True
+
+    def on_boundary(self, key=None, now=None):
+        """Enter/Tab/focus or window change - ends the typing run (key = what ended it)"""
+        with self._lock:
+            if self.typing:
+                self.typing["key"] = key
+            self._flush_groups(click=True, scroll=True, typing=True)
+
+    # Release
+    
+    def flush_due(self, now=None):
+        """Release every group whose idle/gap time has passed"""
+        now = self.clock() if now is None else now
+        with self._lock:
+            self._flush_groups(
+                click=bool(self.click and now - self.click["t"] >= self.double_click_gap),
+                scroll=bool(self.scroll and now - self.scroll["t"] >= self.scroll_gap),
+                typing=bool(self.typing and now - self.typing["t"] >= self.typing_idle))
+
+    def flush(self):
+        """Release everything pending (stop, window change)"""
+        with self._lock:
+            self._flush_groups(click=True, scroll=True, typing=True)
+
+    def _flush_groups(self, click=False, scroll=False, typing=False):
+        # Release in the order the groups started so steps stay chronological
+        pending = []
+        if click and self.click:
+            pending.append(self.click)
+            self.click = None
+        if scroll and self.scroll:
+            pending.append(self.scroll)
+            self.scroll = None
+        if typing and self.typing:
+            pending.append(self.typing)
+            self.typing = None
+        for record in sorted(pending, key=lambda record: record["ts"]):
+            self._emit(record)
+
+    def _emit(self, record):
+        try:
+            self.emit(record)
+        except Exception as e:
+            if self.on_error:
+                self.on_error(record, e)
+            else:
+                print(f"Coalesced step failed: {e}")
 
 
 class ActionMonitor:
@@ -424,16 +4330,40 @@ class ActionMonitor:
         self.click_count = 0
         self.key_count = 0
         self.is_target_application = False  # Track if we're on target application
-        self.manual_url_set = False  # Track if URL was set manually
+        self._manual_url_set = False  # Track if URL was set manually (see manual_url_set)
         self.log_callback = None  # Callback for logging
         self.last_window_title = ""  # Track window title to detect tab switches
         self.last_title_check_time = 0  # Throttle title checks
+        self.dom_capture = False  # Capture DOM events inside the page instead of OS-wide hooks
+        self.root = None
+        self.ui_queue = None  # UIEventQueue drained by the Tk thread (falls back to root.after)
+        # Click coordinates -> element under them, resolved in the background
+        self.element_resolver = ElementResolver(browser_monitor) if browser_monitor else None
+        self.step_update_callback = None  # step_update_callback(step_id, old_text, new_text)
+        self._step_lock = threading.Lock()
+        self._next_step_id = 0
+        self._sent_steps = OrderedDict()  # step_id -> text already sent to the callback (awaiting resolution)
+        self._resolved_steps = {}  # step_id -> upgraded text that arrived before the step was sent
+        self._double_clicks = OrderedDict()  # step ids whose click turned out to be a double-click (oldest first)
+        # Scroll bursts, double-clicks and typing runs become single steps (OS-level hooks only)
+        self.coalescer = InputCoalescer(self._emit_coalesced, on_error=self._on_coalesced_error)
+        self.focus = browser_monitor.focus if browser_monitor else create_focus_backend()
+        
+    def start_monitoring(self, dom_capture=False):
+        """Start monitoring actions (dom_capture = in-page capture via DevTools, no OS hooks)"""
+        if dom_capture:
+            if not self.browser_monitor:
+                return False
+            self.dom_capture = True
+            self.monitoring = True
+            self.last_action_time = time.time()
+            self.browser_monitor.set_dom_capture(True, self.on_dom_event)
+            return True
         
-    def start_monitoring(self):
-        """Start monitoring actions"""
         if not PYNPUT_AVAILABLE:
             return False
         
+        self.dom_capture = False
         self.monitoring = True
         self.last_action_time = time.time()
         
@@ -453,51 +4383,98 @@ class ActionMonitor:
             on_release=self.on_key_release
         )
         self.keyboard_listener.start()
+        self.coalescer.start()
         
-        # Start window monitoring thread
-        if PSUTIL_AVAILABLE:
-            window_thread = threading.Thread(target=self.monitor_windows, daemon=True)
-            window_thread.start()
+        # Follow the foreground window (pushed by the focus backend)
+        self.focus.start(self._on_window_title)
         
         return True
     
     def stop_monitoring(self):
         """Stop monitoring actions"""
         self.monitoring = False
+        if self.dom_capture and self.browser_monitor:
+            self.browser_monitor.set_dom_capture(False)
+        self.dom_capture = False
         if self.mouse_listener:
             self.mouse_listener.stop()
+            self.mouse_listener = None
         if self.keyboard_listener:
             self.keyboard_listener.stop()
+            self.keyboard_listener = None
+        self.coalescer.stop()  # Release a pending click/scroll burst/typing run
+        self.focus.stop()  # No more window-change events (get_title() still works on demand)
     
-    def _check_target_application(self):
-        """Check if current window is target application"""
-        # If URL was manually set, trust the user and always return True
-        if self.manual_url_set:
-            return True
-        
-        # Check if current URL matches base URL
-        if self.browser_monitor and self.browser_monitor.current_url:
-            url = self.browser_monitor.current_url
-            base_url = self.browser_monitor.base_url or BASE_URL
-            # Allow if URL matches base URL (or if base_url not set yet, allow any URL)
-            if not base_url or url.startswith(base_url):
-                return True
-            # Also allow if we're monitoring and URL was previously set (might be transitioning after login)
-            if self.monitoring and hasattr(self.browser_monitor, 'last_valid_url'):
-                if self.browser_monitor.last_valid_url:
-                    if not base_url or self.browser_monitor.last_valid_url.startswith(base_url):
-                        return True
+    def on_dom_event(self, event, browser=None):
+        """Handle an event reported by the in-page capture script (DevTools event loop thread)"""
+        if not self.monitoring or not self.dom_capture:
+            return
+        if self.browser_monitor:
+            self.browser_monitor.note_activity()
         
-        return False
+        kind = event.get("kind")
+        if kind == "click":
+            self.click_count += 1
+        elif kind == "keydown":
+            self.key_count += 1
+        action = describe_dom_event(event)
+        details = {"kind": kind, "x": event.get("x"), "y": event.get("y"), "key": event.get("key"),
+                   "ts": time.perf_counter_ns()}
+        try:
+            when = datetime.fromtimestamp(event["ts"] / 1000.0)
+        except (KeyError, TypeError, ValueError, OverflowError, OSError):
+            when = datetime.now()
+        
+        if kind in ("click", "submit") or (kind == "keydown" and event.get("key") == "Enter"):
+            # May navigate - record the step with the page that is active once it settles
+            if self.browser_monitor and self.browser_monitor.monitoring:
+                self.browser_monitor.request_refresh(
+                    lambda url: self.capture_action(action, url=url, when=when, browser=browser, details=details))
+                return
+        url = event.get("url") or None
+        if self.browser_monitor:
+            # Don't overtake a click that is still waiting on its re-check
+            self.browser_monitor.after_pending_refresh(
+                lambda refreshed: self.capture_action(action, url=url, when=when, browser=browser, details=details))
+        else:
+            self.capture_action(action, url=url, when=when, browser=browser, details=details)
+    
+    @property
+    def manual_url_set(self):
+        if self.browser_monitor:
+            return self.browser_monitor.manual_override
+        return self._manual_url_set
+    
+    @manual_url_set.setter
+    def manual_url_set(self, manual):
+        self._manual_url_set = manual
+        if self.browser_monitor:
+            self.browser_monitor.manual_override = manual  # Part of the published target verdict
+    
+    def _target(self):
+        """Current TargetVerdict snapshot (read once per event)"""
+        if self.browser_monitor:
+            return self.browser_monitor.target
+        return compute_target_verdict("", None, None, self._manual_url_set)
+    
+    def _check_target_application(self, target=None):
+        """Check if current window is target application (reads the published TargetVerdict snapshot)"""
+        target = target or self._target()
+        # Manually set URL: trust the user. Otherwise the URL must be under the base URL, or - while
+        # monitoring - the last valid one must be (might be transitioning after login)
+        return target.manual or target.on_target or (self.monitoring and target.continuity)
     
     def on_mouse_click(self, x, y, button, pressed):
         """Handle mouse click events"""
         if not self.monitoring or not pressed:
             return
+        if self.browser_monitor:
+            self.browser_monitor.note_activity()  # Keep URL polling fast while the user is active
         
         # Check if we should capture this click
-        is_target = self._check_target_application()
-        has_url_set = self.browser_monitor and self.browser_monitor.current_url
+        target = self._target()  # One snapshot for this event
+        is_target = self._check_target_application(target)
+        has_url_set = target.has_url
         
         # Log click detection for debugging
         if hasattr(self, 'root') and self.root:
@@ -507,46 +4484,51 @@ class ActionMonitor:
                     pass  # Will be logged in capture_action
                 else:
                     # Log filtered click
-                    url = self.browser_monitor.current_url
-                    self.root.after(0, lambda: self._log_filtered_action(
+                    url = target.url
+                    self._post(lambda: self._log_filtered_action(
                         f"Mouse click detected at ({x}, {y}) but filtered - URL '{url}' doesn't match base URL"))
             else:
                 # Log that URL is not set
-                self.root.after(0, lambda: self._log_filtered_action(
+                self._post(lambda: self._log_filtered_action(
                     f"Mouse click detected at ({x}, {y}) but filtered - URL not set"))
         
         # Capture if on target OR if URL is manually set (trust user)
         # If URL was manually set, we trust the user and capture all clicks
         # Also capture if monitoring is active (even if URL check fails temporarily after login)
-        should_capture = is_target or (has_url_set and self.manual_url_set) or (self.monitoring and has_url_set)
+        should_capture = is_target or (has_url_set and target.manual) or (self.monitoring and has_url_set)
         
         if should_capture:
             self.click_count += 1
             # Capture click - could be button, dropdown, menu, link, etc.
+            # (held briefly by the coalescer in case it is the first half of a double-click)
             action = f"Mouse {button.name} click at ({x}, {y})"
-            
-            # Log click with more detail - identify potential dropdown/menu clicks
-            if self.log_callback and self.root:
-                # Log every click with context
-                self.root.after(0, lambda: self.log_callback(
-                    f"🖱️ Click captured at ({x}, {y}) - Could be button/dropdown/menu/link", "ACTION"))
-            
-            self.capture_action(action)
+            step_id = self._new_step_id()
+            if not self.coalescer.on_click(x, y, button.name, step_id):
+                # Look up the element under the pointer without blocking the listener - the step text is upgraded later
+                if self.element_resolver:
+                    self.element_resolver.resolve_async(
+                        x, y, lambda element: self._on_element_resolved(step_id, action, element, x, y, button.name))
+                
+                # Log click with more detail - identify potential dropdown/menu clicks
+                if self.log_callback and self.root:
+                    # Log every click with context
+                    self._post(lambda: self.log_callback(
+                        f"🖱️ Click captured at ({x}, {y}) - Could be button/dropdown/menu/link", "ACTION"))
             
             # Check for tab switch after click (delay to allow title to update)
             if self.root:
-                self.root.after(500, self._check_tab_switch_after_click)  # Check after 500ms
+                self._post(lambda: self.root.after(500, self._check_tab_switch_after_click))  # Check after 500ms
         else:
             # Log why click wasn't captured (only log occasionally to avoid spam)
             if self.click_count % 10 == 0:  # Log every 10th filtered click
                 if has_url_set:
-                    url = self.browser_monitor.current_url
+                    url = target.url
                     if self.log_callback and self.root:
-                        self.root.after(0, lambda: self.log_callback(
+                        self._post(lambda: self.log_callback(
                             f"Click filtered - URL '{url}' doesn't match {BASE_URL}. Set URL manually to capture all clicks.", "WARNING"))
                 else:
                     if self.log_callback and self.root:
-                        self.root.after(0, lambda: self.log_callback(
+                        self._post(lambda: self.log_callback(
                             f"Click filtered - URL not set. Please set URL in Manual Override section!", "WARNING"))
     
     def _log_filtered_action(self, message):
@@ -561,24 +4543,28 @@ class ActionMonitor:
         """Handle mouse scroll events"""
         if not self.monitoring:
             return
+        if self.browser_monitor:
+            self.browser_monitor.note_activity()
+        if self.element_resolver:
+            self.element_resolver.bump_layout()  # Different elements are under the pointer now
         
         # Only capture if on target application
         if not self._check_target_application():
             return
         
         direction = "down" if dy < 0 else "up"
-        action = f"Scroll {direction} at ({x}, {y})"
-        self.capture_action(action)
+        self.coalescer.on_scroll(x, y, direction)  # One step per burst, released once the wheel rests
     
     def on_key_press(self, key):
         """Handle key press events"""
         if not self.monitoring:
             return
+        if self.browser_monitor:
+            self.browser_monitor.note_activity()
         
         # Check if we should capture
-        is_target = self._check_target_application()
-        has_url_set = self.browser_monitor and self.browser_monitor.current_url
-        should_capture = is_target or (has_url_set and self.manual_url_set)
+        target = self._target()
+        should_capture = self._check_target_application(target) or (target.has_url and target.manual)
         
         if not should_capture:
             return
@@ -589,7 +4575,6 @@ class ActionMonitor:
                 special_keys = {
                     Key.enter: "Enter key pressed",
                     Key.tab: "Tab key pressed",
-                    Key.space: "Space key pressed",
                     Key.backspace: "Backspace key pressed",
                     Key.delete: "Delete key pressed",
                     Key.esc: "Escape key pressed"
@@ -597,153 +4582,239 @@ class ActionMonitor:
             else:
                 special_keys = {}
             
-            if key in special_keys:
-                action = special_keys[key]
-                self.capture_action(action)
-                if self.log_callback and self.root:
-                    self.root.after(0, lambda: self.log_callback(f"Special key: {action}", "ACTION"))
-                return
-            
-            # Handle regular character keys
-            if hasattr(key, 'char') and key.char:
+            # Handle regular character keys (space is part of the text being typed)
+            if (hasattr(key, 'char') and key.char) or (Key and key == Key.space):
                 self.key_count += 1
+                self.coalescer.on_char()  # One "Entered text" step per typing run
                 
                 # Log every keystroke in activity log (but don't spam actions)
                 if self.log_callback and self.root:
                     # Only log every 5th keystroke to avoid spam
                     if self.key_count % 5 == 0:
-                        self.root.after(0, lambda: self.log_callback(
+                        self._post(lambda: self.log_callback(
                             f"Text input detected ({self.key_count} characters typed)", "ACTION"))
-                
-                # Capture text input more frequently (every 5 keystrokes instead of 20)
-                if self.key_count % 5 == 0:
-                    action = f"Text input entered ({self.key_count} characters)"
-                    self.capture_action(action)
-                # Also capture on first keystroke to show typing started
-                elif self.key_count == 1:
-                    action = "Started typing text"
-                    self.capture_action(action)
+                return
+            
+            if Key and key in (Key.backspace, Key.delete) and self.coalescer.on_correction():
+                return  # Correction inside a typing run
+            
+            if key in special_keys:
+                action = special_keys[key]
+                details = {"kind": "key", "key": str(key).replace('Key.', '')}
+                if Key and key in (Key.enter, Key.tab):
+                    self.coalescer.on_boundary(details["key"])  # Typing run ends here
+                if Key and key == Key.enter:
+                    self._capture_after_refresh(action, details=details)  # Enter often submits/navigates
+                else:
+                    self.capture_action(action, details=details)
+                if self.log_callback and self.root:
+                    self._post(lambda: self.log_callback(f"Special key: {action}", "ACTION"))
+                return
         except AttributeError:
             # Handle special keys that don't have char attribute
             try:
                 key_name = str(key).replace('Key.', '')
                 if key_name not in ['ctrl', 'alt', 'shift', 'cmd']:
                     if self.log_callback and self.root:
-                        self.root.after(0, lambda: self.log_callback(
+                        self._post(lambda: self.log_callback(
                             f"Key pressed: {key_name}", "ACTION"))
             except:
                 pass
     
     def on_key_release(self, key):
         """Handle key release events"""
-        # Capture when user stops typing (releases Enter or Tab)
+        # The typing run itself was captured by the coalescer when Enter/Tab went down
         if not self.monitoring:
             return
         
-        is_target = self._check_target_application()
-        has_url_set = self.browser_monitor and self.browser_monitor.current_url
-        should_capture = is_target or (has_url_set and self.manual_url_set)
+        target = self._target()
+        should_capture = self._check_target_application(target) or (target.has_url and target.manual)
         
         if should_capture:
             try:
                 if Key:
                     if key == Key.enter:
                         if self.key_count > 0:
-                            action = f"Finished entering text ({self.key_count} characters total)"
-                            self.capture_action(action)
                             if self.log_callback and self.root:
-                                self.root.after(0, lambda: self.log_callback(
+                                self._post(lambda: self.log_callback(
                                     f"Text entry completed: {self.key_count} characters", "ACTION"))
                             self.key_count = 0  # Reset counter
                     elif key == Key.tab:
                         if self.key_count > 0:
-                            action = f"Tabbed after entering text ({self.key_count} characters)"
-                            self.capture_action(action)
                             if self.log_callback and self.root:
-                                self.root.after(0, lambda: self.log_callback(
+                                self._post(lambda: self.log_callback(
                                     f"Tabbed after text entry: {self.key_count} characters", "ACTION"))
                             self.key_count = 0  # Reset counter
             except:
                 pass
     
-    def monitor_windows(self):
-        """Monitor active window changes"""
-        if not PSUTIL_AVAILABLE:
+    def _on_window_title(self, window_title):
+        """Foreground window or its title changed (focus backend thread)"""
+        if not self.monitoring or not window_title or window_title == self.current_window:
             return
-        
-        while self.monitoring:
-            try:
-                # Get active window (Windows-specific)
-                if sys.platform == "win32":
-                    try:
-                        import win32gui
-                        hwnd = win32gui.GetForegroundWindow()
-                        window_title = win32gui.GetWindowText(hwnd)
-                        
-                        if window_title and window_title != self.current_window:
-                            self.last_window = self.current_window
-                            self.current_window = window_title
-                            
-                            # Update last_window_title for tab switch detection
-                            if window_title != self.last_window_title:
-                                old_title = self.last_window_title
-                                self.last_window_title = window_title
-                                
-                                # Check for tab switch (same window, different tab)
-                                if old_title and any(browser in window_title.lower() for browser in ['chrome', 'edge', 'microsoft edge', 'firefox']):
-                                    if self._check_target_application():
-                                        # Check if this is a tab switch (title changed but likely same URL)
-                                        self._check_tab_switch_in_title(window_title, old_title)
-                            
-                            # Only capture if it's a browser window (might contain our app)
-                            if any(browser in window_title.lower() for browser in ['chrome', 'edge', 'microsoft edge', 'firefox']):
-                                if self.last_window:  # Don't capture initial window
-                                    action = f"Switched to window: {window_title}"
-                                    # Only capture if on target application
-                                    if self._check_target_application():
-                                        self.capture_action(action)
-                    except ImportError:
-                        pass  # win32gui not available
-            except:
-                pass
+        try:
+            self.last_window = self.current_window
+            self.current_window = window_title
+            is_browser = any(browser in window_title.lower() for browser in BROWSER_WINDOW_KEYWORDS)
+            
+            # Update last_window_title for tab switch detection
+            if window_title != self.last_window_title:
+                old_title = self.last_window_title
+                self.last_window_title = window_title
+                
+                # Check for tab switch (same window, different tab)
+                if old_title and is_browser and self._check_target_application():
+                    # Check if this is a tab switch (title changed but likely same URL)
+                    self._check_tab_switch_in_title(window_title, old_title)
             
-            time.sleep(0.5)  # Check every 500ms
+            # Only capture if it's a browser window (might contain our app)
+            if is_browser and self.last_window:  # Don't capture initial window
+                action = f"Switched to window: {window_title}"
+                # Only capture if on target application
+                if self._check_target_application():
+                    self.coalescer.on_boundary("window")  # Focus moved to another window
+                    self.capture_action(action, details={"kind": "window"})
+        except Exception as e:
+            pass
+    
+    def _capture_after_refresh(self, action_description, step_id=None, details=None):
+        """Capture a step once the URL monitor has re-checked which page is active after it"""
+        details = dict(details or {})
+        details.setdefault("ts", time.perf_counter_ns())  # When it happened, not when it settled
+        if not (self.browser_monitor and self.browser_monitor.monitoring):
+            self.capture_action(action_description, step_id=step_id, details=details)
+            return
+        self.browser_monitor.request_refresh(
+            lambda url: self.capture_action(action_description, url=url, step_id=step_id, details=details))
+    
+    def _emit_coalesced(self, record):
+        """Capture a step released by the input coalescer (click, scroll burst or typing run)"""
+        kind = record["kind"]
+        details = {"kind": kind, "x": record.get("x"), "y": record.get("y"), "ts": record["ts_ns"]}
+        if kind == "click":
+            details["key"] = record["button"]
+            if record["count"] > 1:
+                with self._step_lock:
+                    self._double_clicks[record["step_id"]] = True
+                    while len(self._double_clicks) > 1000:
+                        self._double_clicks.popitem(last=False)
+                action = f"Mouse {record['button']} double-click at ({record['x']}, {record['y']})"
+            else:
+                action = f"Mouse {record['button']} click at ({record['x']}, {record['y']})"
+            self._capture_after_refresh(action, step_id=record["step_id"], details=details)
+            return
+        if kind == "scroll":
+            details["key"] = record["direction"]
+            if record["count"] > 1:
+                action = f"Scrolled {record['direction']} {record['count']} notches at ({record['x']}, {record['y']})"
+            else:
+                action = f"Scroll {record['direction']} at ({record['x']}, {record['y']})"
+        else:
+            details["key"] = record.get("key")
+            action = f"Entered text in field ({record['count']} characters"
+            if record["corrections"]:
+                action += f", {record['corrections']} corrections"
+            action += ")"
+        if self.browser_monitor:
+            # Don't overtake a click that is still waiting on its re-check
+            self.browser_monitor.after_pending_refresh(
+                lambda refreshed: self.capture_action(action, details=details))
+        else:
+            self.capture_action(action, details=details)
+    
+    def _on_coalesced_error(self, record, error):
+        """A coalesced step could not be captured - it is lost, so say so in the activity log"""
+        message = f"❌ {record['kind'].capitalize()} step was not captured: {error}"
+        if self.log_callback and self.root:
+            self._post(lambda: self.log_callback(message, "ERROR"), droppable=False)
+        else:
+            print(message)
     
-    def capture_action(self, action_description):
-        """Capture an action and send to callback"""
+    @staticmethod
+    def _as_double_click(text):
+        return text.replace("Click", "Double-click", 1)
+    
+    def _new_step_id(self):
+        with self._step_lock:
+            self._next_step_id += 1
+            return self._next_step_id
+    
+    def _on_element_resolved(self, step_id, action, element, x, y, button="left"):
+        """Element under a captured click is known (DevTools thread) - upgrade the step text"""
+        resolved = describe_dom_event(dict(element, kind="click"))
+        if button != "left":
+            resolved = resolved.replace("Click", f"{button.capitalize()}-click", 1)
+        resolved += f" at ({x}, {y})"
+        with self._step_lock:
+            sent = self._sent_steps.pop(step_id, None)
+            if sent is None:
+                self._resolved_steps[step_id] = resolved  # capture_action will use it directly
+                return
+            if step_id in self._double_clicks:
+                resolved = self._as_double_click(resolved)
+        if self.step_update_callback and self.root:
+            self._post(lambda: self.step_update_callback(step_id, sent, resolved), droppable=False)
+    
+    def capture_action(self, action_description, url=None, when=None, browser=None, step_id=None, details=None):
+        """Capture an action and send to callback (url = page active after the action, if known;
+        step_id = id for upgrading the step text later; details = kind/x/y/key/ts of the input)"""
+        details = details or {}
+        details.setdefault("ts", time.perf_counter_ns())
+        if step_id is not None:
+            with self._step_lock:
+                resolved = self._resolved_steps.pop(step_id, None)
+                if resolved:
+                    action_description = resolved
+                    if step_id in self._double_clicks:
+                        action_description = self._as_double_click(resolved)
+                else:
+                    self._sent_steps[step_id] = action_description
+                    while len(self._sent_steps) > 1000:
+                        self._sent_steps.popitem(last=False)  # Never resolved (nothing under the pointer)
         current_time = time.time()
-        time_since_last = current_time - self.last_action_time
         
-        # Add timestamp to action
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        # Add timestamp to action (wall clock of the input itself, not of its delivery)
+        timestamp = (when or perf_ns_to_datetime(details["ts"])).strftime("%H:%M:%S")
         action_with_time = f"[{timestamp}] {action_description}"
         
         # Log action capture for debugging (if log callback available)
         if self.log_callback and self.root:
-            self.root.after(0, lambda: self.log_callback(
+            self._post(lambda: self.log_callback(
                 f"Action being captured: {action_description}", "INFO"))
         
-        # Send to callback (main thread)
+        # Send to callback (main thread) - attributed to the browser the user is working in
         if self.callback:
-            self.root.after(0, lambda: self.callback(action_with_time))
+            browser = browser or self._active_browser()
+            self._post(lambda: self.callback(action_with_time, url, browser=browser, step_id=step_id,
+                                             details=details), droppable=False)
         else:
             # If callback not available, log warning
             if self.log_callback and self.root:
-                self.root.after(0, lambda: self.log_callback(
+                self._post(lambda: self.log_callback(
                     f"⚠️ Action captured but callback not available: {action_description}", "WARNING"))
         
         self.last_action_time = current_time
     
+    def _post(self, func, droppable=True):
+        """Hand UI work to the Tk thread - via the bounded UI event queue when one is attached
+        (droppable = log/notice work that may be shed when the queue overflows)"""
+        if self.ui_queue:
+            self.ui_queue.post_call(func, droppable)
+        elif self.root:
+            self.root.after(0, func)
+    
+    def _post_logs(self, lines):
+        """Queue several (message, level) log lines as a single record"""
+        if self.log_callback and self.root:
+            self._post(lambda: [self.log_callback(message, level) for message, level in lines])
+    
+    def _active_browser(self):
+        """Name of the monitored browser the user is working in (None if unknown)"""
+        return self.browser_monitor.active_label() if self.browser_monitor else None
+    
     def _get_window_title(self):
         """Get current window title"""
-        try:
-            if sys.platform == "win32":
-                import win32gui
-                hwnd = win32gui.GetForegroundWindow()
-                return win32gui.GetWindowText(hwnd)
-        except:
-            pass
-        return ""
+        return self.focus.get_title()
     
     def _check_tab_switch_after_click(self):
         """Check if a tab switch occurred after a click by monitoring window title changes"""
@@ -780,27 +4851,21 @@ class ActionMonitor:
                     if self.callback and self.root:
                         timestamp = datetime.now().strftime("%H:%M:%S")
                         action = f"Switched to '{detected_tab}' tab"
-                        self.root.after(0, lambda: self.callback(f"[{timestamp}] {action}"))
+                        browser = self._active_browser()
+                        self._post(lambda: self.callback(f"[{timestamp}] {action}", browser=browser,
+                                                          details={"kind": "tab", "ts": time.perf_counter_ns()}), droppable=False)
                         
-                        # Also log it prominently with tab name clearly displayed
-                        if self.log_callback:
-                            self.root.after(0, lambda: self.log_callback(
-                                "=" * 60, "INFO"))
-                            self.root.after(0, lambda: self.log_callback(
-                                f"🔄 TAB SWITCH AUTO-DETECTED: Switched to '{detected_tab}' tab", "ACTION"))
-                            self.root.after(0, lambda: self.log_callback(
-                                f"Tab Name: {detected_tab}", "INFO"))
-                            if current_url:
-                                self.root.after(0, lambda: self.log_callback(
-                                    f"URL unchanged: {current_url}", "INFO"))
-                            self.root.after(0, lambda: self.log_callback(
-                                f"Previous title: {self.last_window_title}", "INFO"))
-                            self.root.after(0, lambda: self.log_callback(
-                                f"New title: {current_title}", "INFO"))
-                            self.root.after(0, lambda: self.log_callback(
-                                f"Tab switch captured automatically", "SUCCESS"))
-                            self.root.after(0, lambda: self.log_callback(
-                                "=" * 60, "INFO"))
+                        # Also log it prominently with tab name clearly displayed (one queued record)
+                        self._post_logs([
+                            ("=" * 60, "INFO"),
+                            (f"🔄 TAB SWITCH AUTO-DETECTED: Switched to '{detected_tab}' tab", "ACTION"),
+                            (f"Tab Name: {detected_tab}", "INFO"),
+                        ] + ([(f"URL unchanged: {current_url}", "INFO")] if current_url else []) + [
+                            (f"Previous title: {self.last_window_title}", "INFO"),
+                            (f"New title: {current_title}", "INFO"),
+                            ("Tab switch captured automatically", "SUCCESS"),
+                            ("=" * 60, "INFO"),
+                        ])
                 else:
                     # Update last title even if no tab switch detected
                     self.last_window_title = current_title
@@ -811,7 +4876,7 @@ class ActionMonitor:
         except Exception as e:
             # Silently handle errors to avoid disrupting click capture
             if self.log_callback and self.root:
-                self.root.after(0, lambda: self.log_callback(
+                self._post(lambda: self.log_callback(
                     f"Error checking tab switch: {e}", "ERROR"))
     
     def _extract_tab_name_from_title_change(self, old_title, new_title):
@@ -956,33 +5021,27 @@ class ActionMonitor:
                 if self.callback and self.root:
                     timestamp = datetime.now().strftime("%H:%M:%S")
                     action = f"Switched to '{detected_tab}' tab"
-                    self.root.after(0, lambda: self.callback(f"[{timestamp}] {action}"))
+                    browser = self._active_browser()
+                    self._post(lambda: self.callback(f"[{timestamp}] {action}", browser=browser,
+                                                          details={"kind": "tab", "ts": time.perf_counter_ns()}), droppable=False)
                     
-                    # Also log it prominently with tab name clearly displayed
-                    if self.log_callback:
-                        self.root.after(0, lambda: self.log_callback(
-                            "=" * 60, "INFO"))
-                        self.root.after(0, lambda: self.log_callback(
-                            f"🔄 TAB SWITCH AUTO-DETECTED: Switched to '{detected_tab}' tab", "ACTION"))
-                        self.root.after(0, lambda: self.log_callback(
-                            f"Tab Name: {detected_tab}", "INFO"))
-                        if current_url:
-                            self.root.after(0, lambda: self.log_callback(
-                                f"URL unchanged: {current_url}", "INFO"))
-                        self.root.after(0, lambda: self.log_callback(
-                            f"Previous title: {old_title}", "INFO"))
-                        self.root.after(0, lambda: self.log_callback(
-                            f"New title: {window_title}", "INFO"))
-                        self.root.after(0, lambda: self.log_callback(
-                            f"Tab switch captured automatically from window title change", "SUCCESS"))
-                        self.root.after(0, lambda: self.log_callback(
-                            "=" * 60, "INFO"))
+                    # Also log it prominently with tab name clearly displayed (one queued record)
+                    self._post_logs([
+                        ("=" * 60, "INFO"),
+                        (f"🔄 TAB SWITCH AUTO-DETECTED: Switched to '{detected_tab}' tab", "ACTION"),
+                        (f"Tab Name: {detected_tab}", "INFO"),
+                    ] + ([(f"URL unchanged: {current_url}", "INFO")] if current_url else []) + [
+                        (f"Previous title: {old_title}", "INFO"),
+                        (f"New title: {window_title}", "INFO"),
+                        ("Tab switch captured automatically from window title change", "SUCCESS"),
+                        ("=" * 60, "INFO"),
+                    ])
         except Exception as e:
             pass  # Silently handle errors
 
 
 class TestCaseCapture:
-    def __init__(self, root):
+    def __init__(self, root, store_path=None):
         self.root = root
         self.root.title("Enhanced Auto Test Case Capture Tool")
         self.root.geometry("1100x900")
@@ -994,6 +5053,11 @@ class TestCaseCapture:
         
         # Excel file path
         self.excel_file_path = "Doceree_TC.xlsx"
+        self.excel_writer = ExcelWorkbookWriter(self.excel_file_path)  # Incremental saves
+        self.store = TestCaseStore(store_path) if store_path else None  # Optional SQLite store (--sqlite)
+        self._recovered_versions = None  # Store versions of the test cases queued for the workbook at startup
+        self.persistence = None  # ExcelPersistenceWorker - writes the workbook off the Tk thread
+        self._excel_error_shown = False
         
         # Test case counter per module
         self.test_case_counters = {}  # {module: counter}
@@ -1006,6 +5070,13 @@ class TestCaseCapture:
         self.previous_tab = ""  # Track previous tab for switch detection
         self.current_functionality = ""
         self.current_test_steps = []
+        # Captured steps - journaled to disk, newest ones in memory; actions_listbox is a view of a window of them
+        self.actions, recovered_steps = self._open_action_model()
+        self._view_start = 0  # Model index of the first listbox row
+        self.saved_steps = OrderedDict()  # step_id -> (test_case, line) for steps already saved
+        self.current_browser = None  # Browser (BrowserInstance label) of the current URL
+        self.batch_replay = None  # BatchReplayRunner while "Replay All" runs
+        self.launched_browsers = {}  # user_data_dir -> {'browser', 'mode', 'port', 'process'} for tool-launched browsers
         self.current_expected_result = ""
         self.current_actual_result = ""
         
@@ -1019,23 +5090,48 @@ class TestCaseCapture:
         self.url_change_alert_showing = False  # Flag to track if alert dialog is currently open
         self._url_cleared_flag = False  # Flag to prevent browser monitor from re-setting URL after clear
         
+        # Listener/monitor threads -> Tk: one bounded queue drained by a periodic tick (_ui_tick)
+        self.ui_queue = UIEventQueue()
+        self._ui_stats_shown = None  # Last (depth, dropped) shown in ui_queue_label
+        
         # Browser monitoring - start with no base_url, will be set dynamically
         self.browser_monitor = BrowserMonitor(self.on_url_changed, base_url=None)
+        self.browser_monitor.focus.on_error = lambda message: self.log_message(f"⚠️ {message}", "WARNING")
         
         # Action monitoring
         self.monitor = ActionMonitor(self.on_action_captured, self.browser_monitor)
         self.monitor.root = self.root
+        self.monitor.ui_queue = self.ui_queue
+        self.monitor.log_callback = self.log_message
+        self.monitor.step_update_callback = self.update_step
+        
+        # Step screenshots (taken and written off the Tk thread, stored once per distinct screen)
+        self.screenshots = ScreenshotCapturer(self.browser_monitor)
+        self._screenshot_pending = set()  # Actions whose screenshot is still being taken
+        self.saved_screenshots = {}  # Pending action -> (saved test case, step number)
         self.monitoring_active = False
         self.auto_save_enabled = False
         self.auto_save_interval = 5  # Auto-save after 5 actions
         self.manual_url_set = False  # Track if URL was set manually
         
         # Logging system
-        self.log_messages = []  # Store log messages
         self.max_log_lines = 100  # Maximum log lines to keep
-        
-        # Load existing test cases
-        self.load_existing_test_cases()
+        self.log_messages = deque(maxlen=self.max_log_lines)  # Store log messages
+        
+        # Load existing test cases (workbook + journaled ones a crash kept out of it, or the SQLite store),
+        # then hand the workbook to the background writer - an export view of the store when there is one
+        self.test_case_journal = TestCaseJournal()
+        recovered = self.load_existing_test_cases()
+        self.persistence = ExcelPersistenceWorker(self.excel_writer, self.post_ui,
+                                                  journal=None if self.store else self.test_case_journal,
+                                                  on_saved=self._on_excel_saved, on_error=self._on_excel_error)
+        self.persistence.start()
+        synced = self._mark_synced(self._recovered_versions)
+        if self.excel_writer.needs_export:
+            # Rewrite older layouts in the current one
+            self.persistence.export_all(self.test_cases_by_module, on_written=synced if recovered else None)
+        elif recovered:
+            self.persistence.recover(recovered, on_written=synced)
         
         # Create GUI
         self.notebook = None
@@ -1043,6 +5139,10 @@ class TestCaseCapture:
         
         # Initialize logging after GUI is created
         self.root.after(100, self._initialize_logging)
+        if recovered_steps:
+            self.root.after(300, lambda: self._offer_recovered_steps(recovered_steps))
+        self.root.after(UI_TICK_MS, self._ui_tick)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
     
     def _initialize_logging(self):
         """Initialize logging system"""
@@ -1053,49 +5153,107 @@ class TestCaseCapture:
         self.log_message("=" * 60, "INFO")
     
     def load_existing_test_cases(self):
-        """Load existing test cases from Excel"""
+        """Load existing test cases from Excel, then the journaled ones not in it yet; returns those
+        journal entries (to be written to the workbook)"""
+        if self.store:
+            try:
+                return self._load_from_store()
+            except Exception as e:
+                print(f"Error opening test case store {self.store.path}: {e} - using the Excel workbook only")
+                self.store.close()
+                self.store = None
+                self.test_cases_by_module.clear()
+                self.test_case_counters.clear()
         try:
-            wb = load_workbook(self.excel_file_path)
-            for sheet_name in wb.sheetnames:
-                ws = wb[sheet_name]
-                module = sheet_name
-                if module not in self.test_cases_by_module:
-                    self.test_cases_by_module[module] = []
-                    self.test_case_counters[module] = 0
-                
-                # Read test cases from sheet (skip header row)
-                for row in ws.iter_rows(min_row=2, values_only=False):
-                    if row[0].value:  # If Test Case ID exists
-                        test_case = {
-                            "test_id": row[0].value,
-                            "test_name": row[1].value or "",
-                            "description": row[2].value or "",
-                            "preconditions": row[3].value or "",
-                            "test_steps": row[4].value or "",
-                            "expected_result": row[5].value or "",
-                            "actual_result": row[6].value or "",
-                            "status": row[7].value or "Not Executed",
-                            "priority": row[8].value or "Medium",
-                            "module": row[9].value or module,
-                            "page": row[10].value or "",
-                            "tab": row[11].value if len(row) > 11 else "",
-                            "url": row[12].value if len(row) > 12 else "",
-                            "created_date": row[13].value if len(row) > 13 and isinstance(row[13].value, str) and ':' in str(row[13].value) else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                        self.test_cases_by_module[module].append(test_case)
-                        # Extract counter from test_id
-                        try:
-                            if test_case["test_id"]:
-                                parts = test_case["test_id"].split('_')
-                                if len(parts) > 1:
-                                    counter = int(parts[-1])
-                                    self.test_case_counters[module] = max(self.test_case_counters[module], counter)
-                        except:
-                            pass
-        except FileNotFoundError:
-            pass  # File doesn't exist yet
+            for module, test_cases in self.excel_writer.load().items():
+                self.test_cases_by_module.setdefault(module, []).extend(test_cases)
         except Exception as e:
             print(f"Error loading existing test cases: {e}")
+        recovered = []
+        try:
+            entries = self.test_case_journal.open()
+        except Exception as e:
+            print(f"Error opening test case journal: {e}")
+            entries = []
+        if entries:
+            by_id = {str(test_case.get("test_id")): test_case
+                     for test_cases in self.test_cases_by_module.values() for test_case in test_cases}
+            for op, module, test_case in entries:
+                existing = by_id.get(str(test_case.get("test_id")))
+                if op == "append" and existing is None:
+                    test_case = dict(test_case)
+                    self.test_cases_by_module.setdefault(module, []).append(test_case)
+                    by_id[str(test_case.get("test_id"))] = test_case
+                    recovered.append((op, module, test_case))
+                elif op == "update" and existing is not None:
+                    existing.update(test_case)
+                    recovered.append((op, None, existing))
+            if recovered:
+                print(f"Recovered {len(recovered)} test case changes from {TEST_CASE_JOURNAL_FILE}")
+        for module, test_cases in self.test_cases_by_module.items():
+            self.test_case_counters.setdefault(module, 0)
+            for test_case in test_cases:
+                # Extract counter from test_id
+                try:
+                    parts = str(test_case["test_id"]).split('_')
+                    if len(parts) > 1:
+                        counter = int(parts[-1])
+                        self.test_case_counters[module] = max(self.test_case_counters[module], counter)
+                except:
+                    pass
+        return recovered
+    
+    def _load_from_store(self):
+        """--sqlite: load from the store, importing the workbook (and journal) on first use; returns
+        the test cases the workbook doesn't have yet"""
+        self.store.open()
+        if not self.store.is_empty():
+            self.test_cases_by_module.update(self.store.load())
+            self.test_case_counters.update(self.store.counters())
+            items, self._recovered_versions = self.store.unsynced()
+            return [("upsert", sheet, test_case) for sheet, test_case in items]
+        store, self.store = self.store, None
+        try:
+            recovered = self.load_existing_test_cases()
+        finally:
+            self.store = store
+        pending = {str(test_case.get("test_id")) for op, module, test_case in recovered}
+        items = [(module, test_case) for module, test_cases in self.test_cases_by_module.items()
+                 for test_case in test_cases]
+        self.store.add_many([item for item in items if str(item[1].get("test_id")) not in pending], synced=True)
+        self._recovered_versions = self.store.add_many(
+            [item for item in items if str(item[1].get("test_id")) in pending])
+        self.test_case_journal.checkpoint(self.test_case_journal.position())  # Its entries are in the store
+        print(f"Imported {len(items)} test cases from {self.excel_file_path} into {self.store.path}")
+        return recovered
+    
+    def _mark_synced(self, versions, then=None):
+        """on_written callback: with the SQLite store, note these versions ({test ID: version}, see
+        TestCaseStore) are in the workbook; then then()"""
+        def on_written():
+            if self.store and versions:
+                self.store.mark_synced(versions)
+            if then:
+                then()
+        return on_written
+    
+    def _select_test_cases(self, module=None, status=None):
+        """[(sheet, test case)] saved in `module` with `status` (None = any): an indexed query with the
+        SQLite store, otherwise a scan of the loaded test cases"""
+        if self.store:
+            return self.store.query(module=module, status=status)
+        return [(sheet, test_case) for sheet, test_cases in self.test_cases_by_module.items()
+                for test_case in test_cases
+                if (module is None or (test_case.get("module") or sheet) == module)
+                and (status is None or test_case.get("status") == status)]
+    
+    def _count_test_cases(self, module=None, status=None):
+        if self.store:
+            return self.store.count(module=module, status=status)
+        if status is None:
+            return sum(len(test_cases) for sheet, test_cases in self.test_cases_by_module.items()
+                       if module is None or sheet == module)
+        return len(self._select_test_cases(module, status))
     
     def create_widgets(self):
         # Create notebook for tabs
@@ -1151,10 +5309,20 @@ class TestCaseCapture:
                  font=("Arial", 8), foreground="gray").grid(
             row=4, column=1, sticky=tk.W, padx=10)
         
+        # DevTools ports (for shops running several debug browsers)
+        ttk.Label(parent, text="DevTools Ports:", font=("Arial", 10)).grid(
+            row=5, column=0, sticky=tk.W, pady=10)
+        self.devtools_ports_var = tk.StringVar(value=format_port_spec(DEVTOOLS_PORTS))
+        ttk.Entry(parent, textvariable=self.devtools_ports_var, width=30, font=("Arial", 10)).grid(
+            row=5, column=1, sticky=tk.W, pady=10, padx=10)
+        ttk.Label(parent, text="(Ports or ranges probed concurrently, e.g. 9222-9230,9300)", 
+                 font=("Arial", 8), foreground="gray").grid(
+            row=6, column=1, sticky=tk.W, padx=10)
+        
         # Start button
         ttk.Button(parent, text="Start Browser Monitoring & Auto-Capture", 
                   command=self.start_browser_monitoring, width=40).grid(
-            row=5, column=0, columnspan=2, pady=20)
+            row=7, column=0, columnspan=2, pady=20)
         
         parent.columnconfigure(1, weight=1)
     
@@ -1290,6 +5458,20 @@ class TestCaseCapture:
         ttk.Checkbutton(control_frame, text="Auto-save after 5 actions", 
                        variable=self.auto_save_var).pack(side=tk.LEFT, padx=10)
         
+        # In-page capture: the page reports clicks/changes/submits over DevTools (no OS-wide hooks)
+        self.dom_capture_var = tk.BooleanVar(value=not PYNPUT_AVAILABLE)
+        ttk.Checkbutton(control_frame, text="In-page capture (DevTools)", 
+                       variable=self.dom_capture_var).pack(side=tk.LEFT, padx=10)
+        
+        # Screenshot of the page after every step (Page.captureScreenshot), saved under SCREENSHOT_DIR
+        self.screenshot_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="Screenshot each step", 
+                       variable=self.screenshot_var).pack(side=tk.LEFT, padx=10)
+        
+        # Depth / drops of the listener -> UI event queue
+        self.ui_queue_label = ttk.Label(control_frame, text="UI queue: 0", foreground="gray")
+        self.ui_queue_label.pack(side=tk.LEFT, padx=10)
+        
         # Captured Actions Section
         actions_frame = ttk.LabelFrame(scrollable_frame, text="Automatically Captured Actions", padding="10")
         actions_frame.grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=10)
@@ -1324,6 +5506,8 @@ class TestCaseCapture:
                   command=self.add_manual_action, width=12).pack(side=tk.LEFT, padx=5)
         ttk.Button(manual_frame, text="Remove Selected", 
                   command=self.remove_action, width=15).pack(side=tk.LEFT, padx=5)
+        ttk.Button(manual_frame, text="Load Earlier", 
+                  command=self.load_earlier_actions, width=12).pack(side=tk.LEFT, padx=5)
         
         # Quick action templates
         template_frame = ttk.Frame(actions_frame)
@@ -1388,6 +5572,24 @@ class TestCaseCapture:
                   command=self.clear_actions, width=20).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Clear Logs", 
                   command=self.clear_logs, width=15).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Export All to Excel", 
+                  command=self.export_all_to_excel, width=18).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Replay Test Case...", 
+                  command=self.replay_test_case, width=20).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Replay All (Headless)", 
+                  command=self.replay_all_test_cases, width=22).pack(side=tk.LEFT, padx=5)
+        self.replay_speed_var = tk.StringVar(value="1x")
+        ttk.Combobox(button_frame, textvariable=self.replay_speed_var, values=list(REPLAY_SPEEDS),
+                     state="readonly", width=5).pack(side=tk.LEFT)
+        # Which test cases "Replay All" runs
+        self.replay_module_var = tk.StringVar(value=REPLAY_ALL_FILTER)
+        module_combo = ttk.Combobox(button_frame, textvariable=self.replay_module_var, state="readonly", width=16)
+        module_combo.configure(postcommand=lambda: module_combo.configure(
+            values=[REPLAY_ALL_FILTER] + sorted(self.test_cases_by_module)))
+        module_combo.pack(side=tk.LEFT, padx=(10, 0))
+        self.replay_status_var = tk.StringVar(value=REPLAY_ALL_FILTER)
+        ttk.Combobox(button_frame, textvariable=self.replay_status_var, state="readonly", width=12,
+                     values=[REPLAY_ALL_FILTER, "Not Executed", "Pass", "Fail", "Blocked"]).pack(side=tk.LEFT, padx=5)
         
         # Activity Log Section - Make it larger and resizable
         log_frame = ttk.LabelFrame(scrollable_frame, text="📊 Activity Log & Processing Status (Resizable - Drag window to resize)", padding="10")
@@ -1433,6 +5635,14 @@ class TestCaseCapture:
     def start_browser_monitoring(self):
         """Start browser URL monitoring"""
         self.log_message("Starting browser monitoring...", "INFO")
+        ports = parse_port_spec(self.devtools_ports_var.get()) if hasattr(self, 'devtools_ports_var') else []
+        if ports:
+            # Keep the ports of browsers launched from this tool - they are not in the Setup list
+            ports += [info['port'] for info in self.launched_browsers.values()
+                      if info.get('port') and info['port'] not in ports]
+            self.browser_monitor.port_scanner.set_ports(ports)
+            self.browser_monitor.note_activity()  # Un-park the poller so the new ports are probed
+            self.log_message(f"DevTools ports to probe: {self.devtools_ports_var.get().strip()} ({len(ports)} ports)", "INFO")
         if self.browser_monitor.start_monitoring():
             self.log_message("Browser monitoring started successfully", "SUCCESS")
             self.status_label.config(text="Browser monitoring started! You can open browser manually and use 'Detect URL from Browser' button.")
@@ -1445,8 +5655,8 @@ class TestCaseCapture:
             self.log_message("Failed to start browser monitoring", "ERROR")
             messagebox.showerror("Error", "Failed to start browser monitoring!")
     
-    def on_url_changed(self, action, url, module, page):
-        """Callback when URL changes - automatically updates URL without popup"""
+    def on_url_changed(self, action, url, module, page, browser=None):
+        """Callback when URL changes - automatically updates URL without popup (browser = where it happened)"""
         # If URL was just cleared, ignore auto-updates for a short time
         if hasattr(self, '_url_cleared_flag') and self._url_cleared_flag:
             # URL was cleared - don't auto-update for 2 seconds
@@ -1466,6 +5676,8 @@ class TestCaseCapture:
         # Log URL detection prominently
         self.log_message("=" * 60, "INFO")
         self.log_message(f"🌐 URL CHANGE DETECTED: {url}", "URL")
+        if browser and self.browser_monitor.several_browsers():
+            self.log_message(f"Browser: {browser}", "INFO")
         if old_url:
             self.log_message(f"Previous URL: {old_url}", "INFO")
         self.log_message(f"New URL: {url}", "SUCCESS")
@@ -1477,12 +5689,13 @@ class TestCaseCapture:
         self.current_url = url
         self.current_module = module
         self.current_page = page
+        self.current_browser = browser
         
         # Update UI
-        self.root.after(0, lambda: self.update_url_info(url, module, page))
+        self.post_ui(lambda: self.update_url_info(url, module, page))
         
         # Add navigation action to list
-        self.root.after(0, lambda: self.add_navigation_action(action))
+        self.post_ui(lambda: self.add_navigation_action(action, browser))
     
     def _show_url_change_alert(self, old_url, new_url, module, page):
         """Show alert when URL changes and ask user what to do"""
@@ -1620,6 +5833,7 @@ class TestCaseCapture:
         
         # Set detection flag
         self._detection_in_progress = True
+        self.browser_monitor.note_activity()  # Wake a parked URL poller too
         
         # Track if URL was detected (for timeout check)
         self._url_detected_flag = False
@@ -1657,7 +5871,7 @@ class TestCaseCapture:
                 try:
                     browser_hwnd = self._find_and_activate_any_browser_window()
                     if browser_hwnd:
-                        self.root.after(0, lambda: self.log_message("✅ Browser window found and activated", "SUCCESS"))
+                        self.log_message("✅ Browser window found and activated", "SUCCESS")
                         import time
                         time.sleep(0.2)  # Reduced wait time
                     else:
@@ -1665,23 +5879,23 @@ class TestCaseCapture:
                         active_browser = self._verify_active_window_is_browser()
                         if not active_browser:
                             detection_details.append("⚠️ No browser window found - please open a browser first")
-                            self.root.after(0, lambda: self.log_message("⚠️ No browser window found. Please open your browser first.", "WARNING"))
+                            self.log_message("⚠️ No browser window found. Please open your browser first.", "WARNING")
                         else:
-                            self.root.after(0, lambda: self.log_message(f"✅ Active window is a browser: {active_browser}", "INFO"))
+                            self.log_message(f"✅ Active window is a browser: {active_browser}", "INFO")
                 except Exception as e:
                     detection_details.append(f"Window activation error: {str(e)}")
-                    self.root.after(0, lambda: self.log_message(f"⚠️ Error activating browser window: {str(e)}", "WARNING"))
+                    self.log_message(f"⚠️ Error activating browser window: {str(e)}", "WARNING")
                 
                 # Log detection state for debugging
-                self.root.after(0, lambda: self.log_message(f"🔍 Detection state: _detection_in_progress={getattr(self, '_detection_in_progress', 'NOT SET')}", "INFO"))
+                self.log_message(f"🔍 Detection state: _detection_in_progress={getattr(self, '_detection_in_progress', 'NOT SET')}", "INFO")
                 
                 # Method 1: Try keyboard automation first (most reliable - works for all browsers)
                 # This should work even if window title doesn't have URL
-                self.root.after(0, lambda: self.log_message("Method 1: Trying keyboard automation (Ctrl+L, Ctrl+C)...", "INFO"))
+                self.log_message("Method 1: Trying keyboard automation (Ctrl+L, Ctrl+C)...", "INFO")
                 try:
                     url = self._try_get_url_via_keyboard()
                     if url:
-                        self.root.after(0, lambda: self.log_message(f"✅ URL found via keyboard: {url}", "SUCCESS"))
+                        self.log_message(f"✅ URL found via keyboard: {url}", "SUCCESS")
                     else:
                         detection_details.append("Keyboard: Could not copy URL from address bar (make sure browser window is active)")
                 except Exception as e:
@@ -1689,23 +5903,23 @@ class TestCaseCapture:
                 
                 if not url:
                     # Method 2: Try Chrome DevTools Protocol (works for Chrome and Edge - ~0.2s per port)
-                    self.root.after(0, lambda: self.log_message("Method 2: Trying Chrome DevTools Protocol...", "INFO"))
+                    self.log_message("Method 2: Trying Chrome DevTools Protocol...", "INFO")
                     try:
                         url = self._get_url_from_chrome_devtools_simple()
                         if url:
-                            self.root.after(0, lambda: self.log_message(f"✅ URL found via DevTools: {url}", "SUCCESS"))
+                            self.log_message(f"✅ URL found via DevTools: {url}", "SUCCESS")
                         else:
-                            detection_details.append("DevTools: No browser with remote debugging found (ports 9222-9226)")
+                            detection_details.append(f"DevTools: No browser with remote debugging found (ports {self.devtools_ports_var.get().strip()})")
                     except Exception as e:
                         detection_details.append(f"DevTools error: {str(e)}")
                 
                 if not url:
                     # Method 3: Try window title detection (many browsers don't show URL in title)
-                    self.root.after(0, lambda: self.log_message("Method 3: Trying window title detection...", "INFO"))
+                    self.log_message("Method 3: Trying window title detection...", "INFO")
                     try:
                         url = self._get_url_from_window_title_simple()
                         if url:
-                            self.root.after(0, lambda: self.log_message(f"✅ URL found via window title: {url}", "SUCCESS"))
+                            self.log_message(f"✅ URL found via window title: {url}", "SUCCESS")
                         else:
                             detection_details.append("Window title: No URL found in browser window title (this is normal for most browsers)")
                     except Exception as e:
@@ -1713,11 +5927,11 @@ class TestCaseCapture:
                 
                 # Log detection details if all methods failed
                 if not url and detection_details:
-                    self.root.after(0, lambda: self.log_message("=" * 60, "INFO"))
-                    self.root.after(0, lambda: self.log_message("❌ All detection methods failed:", "WARNING"))
+                    self.log_message("=" * 60, "INFO")
+                    self.log_message("❌ All detection methods failed:", "WARNING")
                     for detail in detection_details:
-                        self.root.after(0, lambda d=detail: self.log_message(f"  • {d}", "WARNING"))
-                    self.root.after(0, lambda: self.log_message("=" * 60, "INFO"))
+                        self.log_message(f"  • {detail}", "WARNING")
+                    self.log_message("=" * 60, "INFO")
                 
                 # Mark URL as detected if found
                 if url:
@@ -1732,12 +5946,13 @@ class TestCaseCapture:
                     self._detection_in_progress = False
                 # else: keep flag True so timeout can detect it
                 
-                self.root.after(0, lambda: self._handle_detection_result(url))
+                self.post_ui(lambda: self._handle_detection_result(url))
             except Exception as e:
                 import traceback
                 error_details = traceback.format_exc()
                 # Don't reset flag here - let timeout handle it
-                self.root.after(0, lambda: self._handle_detection_error(f"{str(e)}\n\nDetails:\n{error_details}"))
+                message = f"{str(e)}\n\nDetails:\n{error_details}"
+                self.post_ui(lambda: self._handle_detection_error(message))
         
         # Start detection thread
         thread = threading.Thread(target=detect_in_thread, daemon=True)
@@ -2047,9 +6262,6 @@ class TestCaseCapture:
     def _get_url_from_chrome_devtools_simple(self):
         """Simple Chrome DevTools URL detection - checks active browser window or finds one"""
         try:
-            import json as json_lib
-            import urllib.request
-            import urllib.error
             import win32gui
             
             # Get the active/foreground window
@@ -2092,14 +6304,9 @@ class TestCaseCapture:
             if active_browser_type and 'firefox' in active_browser_type:
                 return None
             
-            # Try multiple common ports with reduced timeout for faster response
-            ports = [9222, 9223, 9224, 9225, 9226]
-            for port in ports:
+            # Sticky last-good port first, remaining ports probed concurrently (0.2s timeout)
+            for port, tabs in self.browser_monitor.port_scanner.iter_responses("/json", timeout=0.2):
                 try:
-                    # Reduced timeout to 0.2s for even faster response
-                    response = urllib.request.urlopen(f"http://localhost:{port}/json", timeout=0.2)
-                    tabs = json_lib.loads(response.read().decode())
-                    
                     if not tabs:
                         continue
                     
@@ -2161,9 +6368,6 @@ class TestCaseCapture:
                                     if not url.startswith('chrome://') and not url.startswith('about:'):
                                         return url
                     
-                except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError):
-                    # Skip this port and try next one
-                    continue
                 except:
                     continue
         except:
@@ -3083,7 +7287,8 @@ class TestCaseCapture:
         
         # Use provided URL or default to empty (browser will open to default page)
         base_url = url if url else ""
-        port = 9222
+        port = 0  # Let the browser pick a free port - read back from DevToolsActivePort
+        user_data_dir = None
         
         try:
             if browser == "chrome":
@@ -3242,14 +7447,36 @@ class TestCaseCapture:
                 self.log_message(f"Unknown browser: {browser}", "ERROR")
                 return
             
+            # Drop a stale DevToolsActivePort so the watcher only sees the one this launch writes,
+            # unless a browser from an earlier launch is still serving this profile
+            reuse_port = None
+            if user_data_dir:
+                previous = read_devtools_active_port(user_data_dir)
+                if previous:
+                    try:
+                        self.browser_monitor.devtools_client.get_json(previous[0], "/json/version", timeout=0.3)
+                        reuse_port = previous
+                    except Exception:
+                        try:
+                            os.remove(os.path.join(user_data_dir, DEVTOOLS_ACTIVE_PORT_FILE))
+                        except OSError:
+                            pass
+            
             # Launch browser
-            subprocess.Popen(cmd, shell=False)
-            self.log_message(f"✅ {browser.capitalize()} launched in {mode} mode with remote debugging on port {port}", "SUCCESS")
+            process = subprocess.Popen(cmd, shell=False)
+            if user_data_dir:
+                self.launched_browsers[user_data_dir] = {'browser': browser, 'mode': mode, 'port': None, 'process': process}
+                self.log_message(f"✅ {browser.capitalize()} launched in {mode} mode with remote debugging (port chosen by the browser)", "SUCCESS")
+            else:
+                self.log_message(f"✅ {browser.capitalize()} launched in {mode} mode", "SUCCESS")
             if base_url:
                 self.log_message(f"Browser will open: {base_url}", "INFO")
             else:
                 self.log_message("Browser will open to default page (no URL specified)", "INFO")
             
+            # A browser is coming up - make sure a parked poller starts probing again
+            self.browser_monitor.note_activity()
+            
             # Start browser monitoring if not already started
             if not self.browser_monitor.monitoring:
                 self.log_message("Starting browser monitoring...", "INFO")
@@ -3258,16 +7485,48 @@ class TestCaseCapture:
                 else:
                     self.log_message("⚠️ Failed to start browser monitoring", "WARNING")
             
-            self.log_message("Waiting 5 seconds for browser to fully start, then attempting URL detection...", "INFO")
-            
-            # Wait a bit for browser to start, then try to detect URL (retry multiple times)
-            self.root.after(5000, lambda: self._try_detect_url_after_launch(attempt=1))
+            if user_data_dir:
+                # Connect as soon as the browser reports its DevTools port - no fixed startup wait
+                self.log_message("Waiting for the browser to report its DevTools port...", "INFO")
+                threading.Thread(target=self._wait_for_launched_browser,
+                                 args=(user_data_dir, process, reuse_port),
+                                 daemon=True, name="devtools-active-port").start()
+            else:
+                self.log_message("Waiting 5 seconds for browser to fully start, then attempting URL detection...", "INFO")
+                
+                # Wait a bit for browser to start, then try to detect URL (retry multiple times)
+                self.root.after(5000, lambda: self._try_detect_url_after_launch(attempt=1))
             
         except Exception as e:
             self.log_message(f"❌ Error launching browser: {e}", "ERROR")
             messagebox.showerror("Error", f"Failed to launch {browser}:\n{e}\n\nPlease launch the browser manually and use 'Detect URL from Browser' or Manual Override.")
     
-    def _try_detect_url_after_launch(self, attempt=1, max_attempts=5):
+    def _wait_for_launched_browser(self, user_data_dir, process, reuse_port=None):
+        """Watch the profile's DevToolsActivePort file and start URL detection once it appears (background thread)"""
+        started = time.monotonic()
+        result = reuse_port or wait_for_devtools_active_port(user_data_dir, process)
+        info = self.launched_browsers.get(user_data_dir, {})
+        if not result:
+            # Browser did not report a port - fall back to probing the configured ports
+            self.log_message(
+                "⚠️ Browser did not report a DevTools port - probing the configured ports instead", "WARNING")
+            self.post_ui(lambda: self._try_detect_url_after_launch(attempt=1))
+            return
+        
+        port = result[0]
+        info['port'] = port
+        label = info.get('browser', 'browser').capitalize()
+        if info.get('mode') == 'incognito':
+            label += " incognito"
+        self.browser_monitor.add_port(port, label)
+        elapsed = time.monotonic() - started
+        self.log_message(
+            f"✅ {info.get('browser', 'Browser').capitalize()} DevTools listening on port {port} "
+            f"(ready after {elapsed:.1f}s)", "SUCCESS")
+        # The first page may still be loading - retry quickly rather than waiting seconds
+        self.post_ui(lambda: self._try_detect_url_after_launch(attempt=1, max_attempts=20, retry_ms=250))
+    
+    def _try_detect_url_after_launch(self, attempt=1, max_attempts=5, retry_ms=2000):
         """Try to detect URL after browser launch (with retries)"""
         try:
             self.log_message(f"Attempting to detect URL from launched browser (attempt {attempt}/{max_attempts})...", "INFO")
@@ -3293,9 +7552,10 @@ class TestCaseCapture:
                                   f"Please try using 'Detect URL from Browser' or 'Paste URL Manually' button."))
             else:
                 if attempt < max_attempts:
-                    # Retry after 2 more seconds
-                    self.log_message(f"URL not detected yet. Retrying in 2 seconds... (attempt {attempt}/{max_attempts})", "INFO")
-                    self.root.after(2000, lambda: self._try_detect_url_after_launch(attempt=attempt+1, max_attempts=max_attempts))
+                    # Retry shortly
+                    self.log_message(f"URL not detected yet. Retrying in {retry_ms / 1000:g} seconds... (attempt {attempt}/{max_attempts})", "INFO")
+                    self.root.after(retry_ms, lambda: self._try_detect_url_after_launch(
+                        attempt=attempt+1, max_attempts=max_attempts, retry_ms=retry_ms))
                 else:
                     # Always show popup when URL is not detected after all attempts
                     self.log_message("URL not detected after multiple attempts.", "WARNING")
@@ -3322,13 +7582,9 @@ class TestCaseCapture:
                               f"2. Or use 'Paste URL Manually' button\n"
                               f"3. Or use Manual Override section"))
     
-    def add_navigation_action(self, action):
+    def add_navigation_action(self, action, browser=None):
         """Add navigation action to list"""
-        step_number = len(self.actions_listbox.get(0, tk.END)) + 1
-        self.actions_listbox.insert(tk.END, f"{step_number}. {action}")
-        self.actions_listbox.see(tk.END)
-        count = len(self.actions_listbox.get(0, tk.END))
-        self.action_count_label.config(text=f"Actions captured: {count}")
+        self._add_step(self._with_browser(action, browser), "navigation", browser=browser)
     
     def start_monitoring(self):
         """Start automatic action monitoring"""
@@ -3337,16 +7593,18 @@ class TestCaseCapture:
             messagebox.showwarning("Warning", "Browser monitoring not started! Please start it first from Setup tab.")
             return
         
-        if not PYNPUT_AVAILABLE:
+        dom_capture = self.dom_capture_var.get()
+        if not dom_capture and not PYNPUT_AVAILABLE:
             self.log_message("pynput library not installed", "ERROR")
             messagebox.showerror("Error", 
                 "pynput library not installed!\n\n"
                 "Please install it using:\n"
-                "pip install pynput")
+                "pip install pynput\n\n"
+                "Or tick 'In-page capture (DevTools)' to capture inside the browser instead.")
             return
         
         self.log_message("Starting action monitoring...", "INFO")
-        if self.monitor.start_monitoring():
+        if self.monitor.start_monitoring(dom_capture=dom_capture):
             self.monitoring_active = True
             self.monitor_status_label.config(text="Status: Monitoring ON", foreground="green")
             self.start_monitor_btn.config(state=tk.DISABLED)
@@ -3354,7 +7612,13 @@ class TestCaseCapture:
             self.auto_save_enabled = self.auto_save_var.get()
             self.status_label.config(text="Auto-capture ACTIVE - Actions are being captured automatically!")
             self.log_message("Action monitoring started successfully", "SUCCESS")
-            self.log_message("Mouse and keyboard listeners active", "INFO")
+            if dom_capture:
+                self.log_message("In-page capture active - clicks, changes, submits and Enter/Escape/Tab "
+                                 "are reported by the page itself (no mouse/keyboard hooks)", "INFO")
+                if not any(b.tracked for b in self.browser_monitor.browsers.values()):
+                    self.log_message("⚠ No DevTools session yet - capture starts as soon as a debug browser is connected", "WARNING")
+            else:
+                self.log_message("Mouse and keyboard listeners active", "INFO")
             self.log_message("✅ All actions (clicks, typing, scrolling, dropdowns, menus) will be captured", "SUCCESS")
             if self.current_url:
                 self.log_message(f"Monitoring actions on: {self.current_url}", "INFO")
@@ -3385,9 +7649,175 @@ class TestCaseCapture:
         self.stop_monitor_btn.config(state=tk.DISABLED)
         self.status_label.config(text="Auto-capture STOPPED")
         self.log_message("Action monitoring stopped", "INFO")
+        self.log_devtools_stats()
+    
+    def log_devtools_stats(self):
+        """Log what DevTools HTTP polling has cost so far (per port) and the poll schedule"""
+        state = self.browser_monitor.scheduler.get_state()
+        self.log_message(
+            f"URL poll schedule: every {state['current_interval']:.2f}s"
+            f"{' (parked - no browser answering)' if state['parked'] else ''}, "
+            f"observed {state['polls_per_second'] * 60:.1f} polls/min "
+            f"[fast {state['fast_interval']}s for {state['active_window']}s after input, "
+            f"idle {state['idle_interval']}s x{state['backoff']} up to {state['max_interval']}s]", "INFO")
+        queue = self.ui_queue.get_stats()
+        self.log_message(
+            f"UI event queue: depth {queue['depth']} (peak {queue['peak_depth']}), {queue['posted']} records in "
+            f"{queue['batches']} ticks, dropped {queue['dropped']} log / {queue['dropped_steps']} step records", "INFO")
+        resolver = self.monitor.element_resolver
+        if resolver:
+            stats = resolver.get_stats()
+            if stats['hits'] or stats['misses']:
+                self.log_message(
+                    f"Click-to-element lookups: {stats['misses']} via DevTools, {stats['hits']} from cache, "
+                    f"{stats['failures']} failed", "INFO")
+        stats = self.screenshots.get_stats()
+        if stats['taken'] or stats['dropped'] or stats['failures']:
+            self.log_message(
+                f"Step screenshots: {stats['taken']} taken, {stats['written']} written, "
+                f"{stats['deduplicated']} identical to an earlier one, {stats['dropped']} dropped (busy), "
+                f"{stats['failures']} failed", "INFO")
+        stats = self.persistence.get_stats()
+        if stats['requests']:
+            self.log_message(
+                f"Excel saves: {stats['requests']} requests coalesced into {stats['writes']} writes "
+                f"(last {stats['last_write_seconds']:.2f}s), {stats['failures']} failed, "
+                f"{stats['pending']} pending", "INFO")
+            if self.store:
+                stats = self.store.get_stats()
+                self.log_message(f"Test case store {self.store.path}: {stats['writes']} transactions "
+                                 f"({stats['write_ms']:.1f} ms)", "INFO")
+            else:
+                stats = self.test_case_journal.get_stats()
+                self.log_message(
+                    f"Test case journal: {stats['appended']} entries ({stats['sync_ms']:.1f} ms writing with fsync), "
+                    f"compacted into the workbook {stats['checkpoints']} times", "INFO")
+        for port, stats in sorted(self.browser_monitor.devtools_client.get_stats().items()):
+            self.log_message(
+                f"DevTools port {port}: {stats['requests']} requests, {stats['connects']} connects, "
+                f"{stats['failures']} failures, avg {stats['avg_ms']:.1f} ms "
+                f"(last {stats['last_ms']:.1f} ms, max {stats['max_ms']:.1f} ms)", "INFO")
+    
+    def _with_browser(self, action, browser):
+        """Prefix a step with its browser when several browsers are monitored"""
+        if browser and self.browser_monitor.several_browsers():
+            return f"[{browser}] {action}"
+        return action
+    
+    def _open_action_model(self):
+        """Action model backed by the on-disk journal (memory-only if it can't be opened);
+        returns (model, steps recovered from a previous run)"""
+        model = ActionModel(ActionJournal(ACTION_JOURNAL_FILE))
+        try:
+            count = model.recover()
+            if count and not model.journal.unsaved_on_open:
+                model.clear()  # Everything left over was saved already
+                count = 0
+            return model, count
+        except Exception as e:
+            print(f"Action journal unavailable ({e}) - keeping steps in memory only")
+            return ActionModel(), 0
+    
+    def _offer_recovered_steps(self, count):
+        """Steps from a previous run that were never saved were found in the journal"""
+        truncated = self.actions.journal.truncated_bytes if self.actions.journal else 0
+        if truncated:
+            self.log_message(f"Action journal: dropped {truncated} bytes of an incomplete last record", "WARNING")
+        unsaved = self.actions.journal.unsaved_on_open if self.actions.journal else count
+        if messagebox.askyesno("Recover Captured Steps",
+                               f"The previous session left {count} captured steps "
+                               f"({unsaved} not saved to Excel).\n\n"
+                               f"Restore them?"):
+            self._refresh_actions_view()
+            self.log_message(f"♻️ Restored {count} captured steps from {ACTION_JOURNAL_FILE}", "SUCCESS")
+        else:
+            self.actions.clear()
+            self.log_message(f"Discarded {count} unsaved steps from the previous session", "INFO")
+    
+    def _add_step(self, text, kind=None, url=None, browser=None, step_id=None, details=None):
+        """Append a step to the action model and its listbox view; returns the step count"""
+        details = details or {}
+        action = Action(text, kind or details.get("kind"), ts=details.get("ts"),
+                        x=details.get("x"), y=details.get("y"), key=details.get("key"),
+                        url=url or self.current_url, module=self.current_module, page=self.current_page,
+                        tab=self.current_tab, browser=browser or self.current_browser, step_id=step_id)
+        count = self.actions.append(action)
+        if self.screenshot_var.get() and self.screenshots.request(
+                lambda screenshot_id: self.post_ui(lambda: self._attach_screenshot(action, screenshot_id))):
+            self._screenshot_pending.add(action)
+        self.actions_listbox.insert(tk.END, self.actions.line(count - 1))
+        if self.actions_listbox.size() > ACTION_VIEW_WINDOW:
+            # Keep the view bounded - older rows can be paged back in with "Load Earlier"
+            dropped = ACTION_VIEW_WINDOW // 4
+            self.actions_listbox.delete(0, dropped - 1)
+            self._view_start += dropped
+        self.actions_listbox.see(tk.END)  # Scroll to bottom
+        self._update_action_count()
+        return count
+    
+    def _attach_screenshot(self, action, screenshot_id):
+        """A step's screenshot is stored - reference it from the step, or from the test case it was saved in"""
+        self._screenshot_pending.discard(action)
+        saved = self.saved_screenshots.pop(action, None)
+        if not screenshot_id or self.actions.set_screenshot(action, screenshot_id) or not saved:
+            return
+        test_case, number = saved
+        lines = [line for line in test_case.get("screenshots", "").split("\n") if line]
+        lines.append(f"{number}. {screenshot_id}")
+        test_case["screenshots"] = "\n".join(sorted(lines, key=lambda line: int(line.split(".", 1)[0])))
+        self.save_to_excel(test_case)
+    
+    def _update_action_count(self):
+        count = len(self.actions)
+        text = f"Actions captured: {count}"
+        if self._view_start:
+            text += f" (showing {self._view_start + 1}-{count})"
+        self.action_count_label.config(text=text)
+    
+    def _refresh_actions_view(self):
+        """Redraw the listbox from the action model (after removals renumber the steps) - newest steps only"""
+        self.actions_listbox.delete(0, tk.END)
+        self._view_start = max(0, len(self.actions) - ACTION_VIEW_WINDOW)
+        if len(self.actions):
+            self.actions_listbox.insert(tk.END, *self.actions.lines(self._view_start))
+            self.actions_listbox.see(tk.END)
+        self._update_action_count()
+    
+    def load_earlier_actions(self):
+        """Page older steps back into the listbox from the journal"""
+        if not self._view_start:
+            return
+        start = max(0, self._view_start - ACTION_VIEW_WINDOW // 2)
+        self.actions_listbox.insert(0, *self.actions.lines(start, self._view_start))
+        self._view_start = start
+        self.actions_listbox.see(0)
+        self._update_action_count()
+    
+    def update_step(self, step_id, old_text, new_text):
+        """Replace a step's text in place (e.g. click coordinates resolved to the element clicked)"""
+        index, action = self.actions.find_step(step_id)
+        if action is not None:
+            if old_text not in action.text:
+                return
+            action.kind = "click"
+            self.actions.set_text(index, action.text.replace(old_text, new_text, 1))
+            row = index - self._view_start
+            if row >= 0:
+                self.actions_listbox.delete(row)
+                self.actions_listbox.insert(row, self.actions.line(index))
+            self.log_message(f"🔎 Step {index + 1} resolved: {new_text}", "ACTION")
+        elif step_id in self.saved_steps:
+            # Already saved (auto-save) - fix the saved test steps and rewrite the workbook
+            test_case, line = self.saved_steps.pop(step_id)
+            if line not in test_case.get("test_steps", ""):
+                return
+            test_case["test_steps"] = test_case["test_steps"].replace(line, line.replace(old_text, new_text, 1), 1)
+            self.log_message(f"🔎 Saved step in {test_case.get('test_id')} resolved: {new_text}", "ACTION")
+            self.save_to_excel(test_case)
     
-    def on_action_captured(self, action):
-        """Callback when an action is automatically captured"""
+    def on_action_captured(self, action, url=None, browser=None, step_id=None, details=None):
+        """Callback when an action is automatically captured (url = page active after the action, browser = where,
+        details = kind/x/y/key/ts from the monitor)"""
         # Always log actions, even if monitoring seems inactive (might be a timing issue)
         if not self.monitoring_active:
             self.log_message("⚠️ Action received but monitoring appears inactive - checking status...", "WARNING")
@@ -3408,14 +7838,9 @@ class TestCaseCapture:
         else:
             self.log_message(f"📝 ACTION CAPTURED: {action}", "ACTION")
         
-        # Add to listbox
-        step_number = len(self.actions_listbox.get(0, tk.END)) + 1
-        self.actions_listbox.insert(tk.END, f"{step_number}. {action}")
-        self.actions_listbox.see(tk.END)  # Scroll to bottom
-        
-        # Update count
-        count = len(self.actions_listbox.get(0, tk.END))
-        self.action_count_label.config(text=f"Actions captured: {count}")
+        # Add to the action model (and its listbox view)
+        count = self._add_step(self._with_browser(action, browser), url=url, browser=browser,
+                               step_id=step_id, details=details)
         
         # Auto-save if enabled and threshold reached
         if self.auto_save_enabled and count > 0 and count % self.auto_save_interval == 0:
@@ -3426,13 +7851,9 @@ class TestCaseCapture:
         """Add a manual action"""
         action = self.manual_action_entry.get().strip()
         if action:
-            step_number = len(self.actions_listbox.get(0, tk.END)) + 1
             timestamp = datetime.now().strftime("%H:%M:%S")
-            self.actions_listbox.insert(tk.END, f"{step_number}. [{timestamp}] {action}")
+            self._add_step(f"[{timestamp}] {action}", "manual")
             self.manual_action_entry.delete(0, tk.END)
-            count = len(self.actions_listbox.get(0, tk.END))
-            self.action_count_label.config(text=f"Actions captured: {count}")
-            self.actions_listbox.see(tk.END)  # Scroll to bottom
             
             # Log manual action
             action_lower = action.lower()
@@ -3445,12 +7866,8 @@ class TestCaseCapture:
     
     def add_template_action(self, template):
         """Add a template action"""
-        step_number = len(self.actions_listbox.get(0, tk.END)) + 1
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.actions_listbox.insert(tk.END, f"{step_number}. [{timestamp}] {template}")
-        count = len(self.actions_listbox.get(0, tk.END))
-        self.action_count_label.config(text=f"Actions captured: {count}")
-        self.actions_listbox.see(tk.END)  # Scroll to bottom
+        self._add_step(f"[{timestamp}] {template}", "template")
         
         # Enhanced logging for template actions
         if "dropdown" in template.lower() or "menu" in template.lower():
@@ -3513,12 +7930,8 @@ class TestCaseCapture:
             self.log_message("=" * 60, "INFO")
         
         # Add to actions list
-        step_number = len(self.actions_listbox.get(0, tk.END)) + 1
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.actions_listbox.insert(tk.END, f"{step_number}. [{timestamp}] {action}")
-        count = len(self.actions_listbox.get(0, tk.END))
-        self.action_count_label.config(text=f"Actions captured: {count}")
-        self.actions_listbox.see(tk.END)
+        self._add_step(f"[{timestamp}] {action}", "tab")
         
         # Update tab tracking
         self.previous_tab = self.current_tab
@@ -3536,43 +7949,68 @@ class TestCaseCapture:
     def remove_action(self):
         """Remove selected action"""
         selection = self.actions_listbox.curselection()
-        if selection:
-            self.actions_listbox.delete(selection[0])
-            # Renumber actions
-            items = list(self.actions_listbox.get(0, tk.END))
-            self.actions_listbox.delete(0, tk.END)
-            for i, item in enumerate(items, 1):
-                # Remove old number and add new one
-                action_text = item.split('. ', 1)[1] if '. ' in item else item
-                self.actions_listbox.insert(tk.END, f"{i}. {action_text}")
-            count = len(self.actions_listbox.get(0, tk.END))
-            self.action_count_label.config(text=f"Actions captured: {count}")
+        if selection and self._view_start + selection[0] < len(self.actions):
+            self.actions.remove(self._view_start + selection[0])
+            self._refresh_actions_view()  # Renumber actions
     
     def log_message(self, message, level="INFO"):
         """Add a log message to the log panel"""
         timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]  # Include milliseconds
         log_entry = f"[{timestamp}] [{level}] {message}\n"
         
-        # Add to log storage
+        # Add to log storage (bounded deque)
         self.log_messages.append((timestamp, level, message))
-        if len(self.log_messages) > self.max_log_lines:
-            self.log_messages.pop(0)
         
-        # Update UI (thread-safe) - check if log_text exists
+        # Update UI (thread-safe) - queued and written by the next _ui_tick
+        self.ui_queue.post_log(log_entry, level)
+    
+    def post_ui(self, func, droppable=False):
+        """Run func() on the Tk thread at the next UI tick (safe from any thread)"""
+        self.ui_queue.post_call(func, droppable)
+    
+    def _ui_tick(self):
+        """Drain the UI event queue once per tick: consecutive log lines are written as one batch,
+        other records run in order"""
         try:
-            if hasattr(self, 'log_text') and self.log_text:
-                self.root.after(0, lambda: self._update_log_ui(log_entry, level))
-        except:
-            pass  # Log panel not ready yet
+            logs = []
+            for record in self.ui_queue.drain():
+                if record[0] == "log":
+                    logs.append(record[1:])
+                    continue
+                if logs:
+                    self._update_log_ui(logs)
+                    logs = []
+                try:
+                    record[1]()
+                except Exception as e:
+                    self.log_message(f"UI event failed: {e}", "ERROR")  # Shown by the next tick
+            if logs:
+                self._update_log_ui(logs)
+            self._update_ui_queue_label()
+        finally:
+            self.root.after(UI_TICK_MS, self._ui_tick)
     
-    def _update_log_ui(self, log_entry, level):
-        """Update log UI (called from main thread)"""
+    def _update_ui_queue_label(self):
+        """Show queue depth and drops (only touches the widget when they change)"""
+        stats = self.ui_queue.get_stats()
+        shown = (stats['depth'], stats['dropped'], stats['dropped_steps'])
+        if shown == self._ui_stats_shown or not hasattr(self, 'ui_queue_label'):
+            return
+        self._ui_stats_shown = shown
+        text = f"UI queue: {stats['depth']}"
+        if stats['dropped'] or stats['dropped_steps']:
+            text += f" (dropped {stats['dropped']} log"
+            text += f", {stats['dropped_steps']} steps)" if stats['dropped_steps'] else ")"
+        self.ui_queue_label.config(text=text, foreground="red" if stats['dropped_steps'] else
+                                   "orange" if stats['dropped'] else "gray")
+    
+    def _update_log_ui(self, entries):
+        """Write a batch of (log_entry, level) lines to the log panel (called from main thread)"""
         try:
-            self.log_text.insert(tk.END, log_entry)
-            # Apply color tag based on level
-            start_pos = self.log_text.index(tk.END + "-1c linestart")
-            end_pos = self.log_text.index(tk.END + "-1c lineend")
-            self.log_text.tag_add(level, start_pos, end_pos)
+            if not getattr(self, 'log_text', None):
+                return
+            for log_entry, level in entries[-self.max_log_lines:]:
+                self.log_text.insert(tk.END, log_entry, level)  # Color tag by level
             self.log_text.see(tk.END)  # Auto-scroll to bottom
             
             # Limit log size in UI
@@ -3590,6 +8028,8 @@ class TestCaseCapture:
     
     def clear_actions(self):
         """Clear all captured actions"""
+        self.actions.clear()  # Also empties the journal - nothing unsaved left
+        self._view_start = 0
         self.actions_listbox.delete(0, tk.END)
         self.action_count_label.config(text="Actions captured: 0")
         self.expected_result_text.delete(1.0, tk.END)
@@ -3599,7 +8039,7 @@ class TestCaseCapture:
     
     def auto_save_test_case(self):
         """Automatically save test case when threshold is reached"""
-        if len(self.actions_listbox.get(0, tk.END)) >= self.auto_save_interval:
+        if len(self.actions) >= self.auto_save_interval:
             # Use default values for auto-save
             expected_result = self.expected_result_text.get(1.0, tk.END).strip() or self._generate_expected_result()
             actual_result = self.actual_result_text.get(1.0, tk.END).strip() or "Captured automatically"
@@ -3612,7 +8052,7 @@ class TestCaseCapture:
     
     def _generate_expected_result(self):
         """Generate expected result based on navigation and actions"""
-        actions_text = ' '.join(self.actions_listbox.get(0, tk.END)).lower()
+        actions_text = ' '.join(action.text for action in self.actions).lower()
         
         if self.current_module and self.current_page:
             # Check if tab switching is involved
@@ -3701,6 +8141,160 @@ class TestCaseCapture:
         tab_info = f" | Tab: {self.current_tab}" if self.current_tab else ""
         self.session_info_label.config(text=f"Module: {module} | Page: {page}{tab_info}")
     
+    def replay_test_case(self):
+        """Re-run a saved test case (Excel workbook or JSON backup) in a DevTools-enabled browser"""
+        path = filedialog.askopenfilename(
+            title="Replay Test Case", initialdir=os.path.dirname(os.path.abspath(self.excel_file_path)),
+            initialfile=os.path.basename(self.excel_file_path),
+            filetypes=[("Test cases", "*.xlsx *.json"), ("All files", "*.*")])
+        if not path:
+            return
+        if self.store and os.path.abspath(path) == os.path.abspath(self.excel_file_path):
+            # The workbook is an export of the store - look the test case up by its index instead of reading it
+            count, ids, find = self.store.count(), self.store.recent_ids(), self.store.find
+        else:
+            try:
+                test_cases = load_replay_test_cases(path)
+            except Exception as e:
+                messagebox.showerror("Replay", f"Could not read test cases from {path}:\n{e}")
+                return
+            count, ids = len(test_cases), [test_case.get("test_id", "") for test_case in test_cases][::-1][:5]
+            find = lambda test_id: next((tc for tc in test_cases if tc.get("test_id") == test_id), None)
+        if not count:
+            messagebox.showinfo("Replay", f"No test cases found in {path}")
+            return
+        
+        test_id = simpledialog.askstring("Replay Test Case",
+                                         f"Test case ID to replay ({count} available, e.g. {', '.join(ids[::-1])}):",
+                                         initialvalue=ids[0])
+        if not test_id:
+            return
+        test_case = find(test_id.strip())
+        if test_case is None:
+            messagebox.showerror("Replay", f"Test case '{test_id}' not found in {path}")
+            return
+        
+        port = self._replay_port()
+        if port is None:
+            messagebox.showerror("Replay", "No DevTools-enabled browser found.\n\n"
+                                           "Launch one from the Setup tab or start Chrome/Edge with --remote-debugging-port.")
+            return
+        if self.monitor.monitoring and not messagebox.askyesno(
+                "Replay", "Auto-capture is running and may record the replayed steps.\n\nReplay anyway?"):
+            return
+        
+        speed_name = self.replay_speed_var.get()
+        self.log_message(f"▶️ Replaying {test_id} at {speed_name} (DevTools port {port})...", "INFO")
+        threading.Thread(target=self._run_replay, args=(test_case, port, REPLAY_SPEEDS.get(speed_name, 1.0)),
+                         daemon=True, name="replay").start()
+    
+    def _replay_port(self):
+        """DevTools port to replay on - the browser being worked in, else any known or answering one"""
+        browser = self.browser_monitor.active_browser
+        if browser and browser.port:
+            return browser.port
+        ports = [port for port in self.browser_monitor.browsers if port is not None]
+        if ports:
+            return ports[0]
+        found = self.browser_monitor.port_scanner.scan("/json/version")
+        return found[0][0] if found else None
+    
+    def _run_replay(self, test_case, port, speed):
+        """Replay thread - progress goes to the activity log, the full report to a dialog"""
+        test_id = test_case.get("test_id", "")
+        
+        def on_step(test_case, result):
+            line = f"   Step {result.number}: {result.status} ({result.duration_ms:.0f} ms)"
+            if result.error:
+                line += f" - {result.error}"
+            self.log_message(line, {"Pass": "SUCCESS", "Fail": "ERROR"}.get(result.status, "WARNING"))
+        
+        try:
+            engine = ReplayEngine(browser_ws_url(port, self.browser_monitor.devtools_client), speed, on_step=on_step)
+            report = engine.replay(test_case)
+        except Exception as e:
+            self.log_message(f"❌ Replay of {test_id} failed: {e}", "ERROR")
+            return
+        summary = format_replay_report(report)
+        passed = report["status"] == "Pass"
+        self.log_message(f"{'✅' if passed else '❌'} {test_id}: {summary.splitlines()[0]}", "SUCCESS" if passed else "ERROR")
+        show = messagebox.showinfo if passed else messagebox.showwarning
+        # Scheduled from the UI tick rather than run in it, so the open dialog doesn't stall the queue
+        self.post_ui(lambda: self.root.after(0, lambda: show(f"Replay {test_id}", summary)))
+    
+    def replay_all_test_cases(self):
+        """Replay the saved test cases picked by the module/status filters in parallel headless browsers and
+        record Status/Actual_Output. The cases come from the store or the loaded test cases, not the workbook
+        file - saves still queued for the background writer are replayed too, and results are written back
+        by test ID (update_many)."""
+        module = self.replay_module_var.get()
+        status = self.replay_status_var.get()
+        module = None if module == REPLAY_ALL_FILTER else module
+        status = None if status == REPLAY_ALL_FILTER else status
+        test_cases = []
+        for sheet, test_case in self._select_test_cases(module, status):
+            if test_case.get("test_id"):
+                # Same shape as load_replay_test_cases() rows (string cells, no row - written back by ID)
+                test_cases.append({key: "" if value is None else str(value) for key, value in test_case.items()})
+                test_cases[-1]["sheet"] = sheet[:31]
+        selection = " ".join(part for part in (status, module and f"in {module}") if part)
+        if not test_cases:
+            messagebox.showinfo("Replay All", f"There are no saved {selection + ' ' if selection else ''}"
+                                              f"test cases to replay.")
+            return
+        if self.batch_replay:
+            messagebox.showinfo("Replay All", "A batch replay is already running.")
+            return
+        executable = find_chromium_browser()
+        if not executable:
+            messagebox.showerror("Replay All", "No Chrome/Edge/Chromium installation found for headless replay.")
+            return
+        if not messagebox.askyesno("Replay All",
+                                   f"Replay {len(test_cases)} test cases{' (' + selection + ')' if selection else ''} in up to "
+                                   f"{default_replay_workers()} headless browsers?\n\n"
+                                   f"Status and Actual_Output will be updated with the results."):
+            return
+        
+        def on_result(test_case, report):
+            self.log_message(f"   {report['test_id']}: {report['status']} in {report['duration_ms'] / 1000:.1f}s"
+                             + (f" - {report['error']}" if report["error"] else ""),
+                             {"Pass": "SUCCESS", "Fail": "ERROR"}.get(report["status"], "WARNING"))
+        
+        self.batch_replay = BatchReplayRunner(self.excel_file_path, speed=REPLAY_SPEEDS.get(self.replay_speed_var.get()),
+                                              executable=executable, on_result=on_result, test_cases=test_cases)
+        self.log_message(f"▶️ Replaying {len(test_cases)} test cases{' (' + selection + ')' if selection else ''} "
+                         f"(headless {executable})...", "INFO")
+        threading.Thread(target=self._run_batch_replay, daemon=True, name="batch-replay").start()
+    
+    def _run_batch_replay(self):
+        """Batch replay thread - the results are written back on the Tk thread, where saves happen"""
+        try:
+            reports, summary = self.batch_replay.run()
+        except Exception as e:
+            self.log_message(f"❌ Batch replay failed: {e}", "ERROR")
+            self.batch_replay = None
+            return
+        self.batch_replay = None
+        self.log_message(f"🏁 {format_batch_summary(summary)}", "SUCCESS" if summary["cases"] == summary["Pass"] else "WARNING")
+        self.post_ui(lambda: self._store_replay_results(reports))
+    
+    def _store_replay_results(self, reports):
+        """Record batch replay outcomes in the loaded test cases and the workbook (one bulk write)"""
+        by_id = {report["test_id"]: report for report in reports}
+        updated = []
+        for test_cases in self.test_cases_by_module.values():
+            for test_case in test_cases:
+                report = by_id.get(test_case.get("test_id"))
+                if report:
+                    test_case["status"] = report["status"]
+                    test_case["actual_result"] = format_replay_report(report)[:EXCEL_CELL_LIMIT]
+                    updated.append(test_case)
+        if updated:
+            versions = self.store.update_many(updated) if self.store else None
+            on_written = self._mark_synced(versions, lambda: self.log_message(
+                f"✅ Replay results written for {len(updated)} test cases in {self.excel_file_path}", "SUCCESS"))
+            self.persistence.update_many(updated, on_written=on_written)
+    
     def save_test_case(self):
         """Save current test case to Excel"""
         # Check if we have module - if not, try to use manual override or show helpful error
@@ -3741,7 +8335,7 @@ class TestCaseCapture:
                     return
         
         # Get test steps
-        test_steps = '\n'.join(self.actions_listbox.get(0, tk.END))
+        test_steps = self.actions.steps_text()
         if not test_steps:
             # Allow saving with no actions, but show a warning
             response = messagebox.askyesno(
@@ -3775,7 +8369,7 @@ class TestCaseCapture:
     def save_test_case_internal(self, expected_result, actual_result, status, silent=False):
         """Internal method to save test case"""
         # Get test steps
-        test_steps = '\n'.join(self.actions_listbox.get(0, tk.END))
+        test_steps = self.actions.steps_text()
         
         # Get functionality
         functionality = self.functionality_text.get(1.0, tk.END).strip() or f"{self.current_module} - {self.current_page}"
@@ -3794,7 +8388,7 @@ class TestCaseCapture:
         self.log_message(f"Module: {self.current_module}, Page: {self.current_page}", "INFO")
         if self.current_tab:
             self.log_message(f"📑 Tab: {self.current_tab}", "INFO")
-        self.log_message(f"Test steps: {len(self.actions_listbox.get(0, tk.END))} actions", "INFO")
+        self.log_message(f"Test steps: {len(self.actions)} actions", "INFO")
         
         # Check if test case includes tab switches
         test_steps_text = test_steps.lower()
@@ -3825,22 +8419,38 @@ class TestCaseCapture:
             "page": page_name,
             "url": self.current_url,
             "tab": self.current_tab if self.current_tab else "",
+            "browser": ", ".join(self.actions.browsers()) or self.current_browser or "",
+            "step_timing": self.actions.timing_text(),
+            "screenshots": self.actions.screenshots_text(),
             "created_date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
         # Add to test cases
         self.test_cases_by_module[self.current_module].append(test_case)
         
-        # Save to Excel
+        # Screenshots still being taken are added to the saved test case when they arrive
+        for number, action in enumerate(self.actions, 1):
+            if action in self._screenshot_pending:
+                self.saved_screenshots[action] = (test_case, number)
+        
+        # Steps whose element lookup is still running get patched in the saved test case later
+        for index, action in enumerate(self.actions):
+            if action.step_id is not None:
+                self.saved_steps[action.step_id] = (test_case, self.actions.line(index))
+        while len(self.saved_steps) > 500:
+            self.saved_steps.popitem(last=False)
+        
+        # Save to Excel (journaled now, written by the background writer after a short quiet period)
         try:
-            self.log_message("Exporting to Excel...", "INFO")
-            self.export_to_excel()
-            self.log_message(f"Test case saved successfully to Excel: {self.excel_file_path}", "SUCCESS")
+            self.save_to_excel(test_case, new=True, on_written=lambda: self.log_message(
+                f"Test case {test_id} saved to Excel: {self.excel_file_path}", "SUCCESS"))
+            if self.actions.journal:
+                self.actions.journal.mark_saved()  # Not "unsaved" for crash recovery any more
             
             # Update status
             if not silent:
                 self.status_label.config(
-                    text=f"Test case {test_id} saved to {self.current_module} module! Total: {len(self.test_cases_by_module[self.current_module])} test cases in this module")
+                    text=f"Test case {test_id} saved to {self.current_module} module! Total: {self._count_test_cases(self.current_module)} test cases in this module")
                 messagebox.showinfo("Success", 
                                   f"Test case {test_id} saved to {self.current_module} module in {self.excel_file_path}!")
             else:
@@ -3852,118 +8462,101 @@ class TestCaseCapture:
             if not silent:
                 messagebox.showerror("Error", f"Failed to save test case: {str(e)}")
     
-    def export_to_excel(self):
-        """Export all test cases to Excel file organized by module"""
-        try:
-            # Try to load existing workbook
-            try:
-                wb = load_workbook(self.excel_file_path)
-            except FileNotFoundError:
-                wb = Workbook()
-                wb.remove(wb.active)  # Remove default sheet
-            
-            # Define headers - new structure as per requirements
-            headers = [
-                "TC_ID", "TC_Module", "Prerequisite", "Execution_Steps",
-                "Expected_Output", "Actual_Output", "Status", "Priority",
-                "URL", "Created Date"
-            ]
-            
-            # Style for header
-            header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-            header_font = Font(bold=True, color="FFFFFF", size=11)
-            border = Border(
-                left=Side(style='thin'),
-                right=Side(style='thin'),
-                top=Side(style='thin'),
-                bottom=Side(style='thin')
-            )
-            
-            # Create/update sheets for each module
-            for module, test_cases in self.test_cases_by_module.items():
-                if not test_cases:
-                    continue
-                
-                # Create or get sheet for module
-                sheet_name = module[:31]  # Excel sheet name limit
-                if sheet_name in wb.sheetnames:
-                    ws = wb[sheet_name]
-                    # Clear existing data (keep header)
-                    if ws.max_row > 1:
-                        ws.delete_rows(2, ws.max_row)
-                else:
-                    ws = wb.create_sheet(title=sheet_name)
-            
-                # Write headers for this sheet
-                for col_num, header in enumerate(headers, 1):
-                    cell = ws.cell(row=1, column=col_num, value=header)
-                cell.fill = header_fill
-                cell.font = header_font
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-                cell.border = border
-            
-                # Write test cases for this module - new column structure
-                for row_num, test_case in enumerate(test_cases, 2):
-                    # Column 1: TC_ID
-                    ws.cell(row=row_num, column=1, value=test_case.get("test_id", "")).border = border
-                    # Column 2: TC_Module
-                    ws.cell(row=row_num, column=2, value=test_case.get("module", "")).border = border
-                    # Column 3: Prerequisite
-                    ws.cell(row=row_num, column=3, value=test_case.get("preconditions", "")).border = border
-                    # Column 4: Execution_Steps
-                    ws.cell(row=row_num, column=4, value=test_case.get("test_steps", "")).border = border
-                    # Column 5: Expected_Output
-                    ws.cell(row=row_num, column=5, value=test_case.get("expected_result", "")).border = border
-                    # Column 6: Actual_Output
-                    ws.cell(row=row_num, column=6, value=test_case.get("actual_result", "")).border = border
-                    # Column 7: Status
-                    ws.cell(row=row_num, column=7, value=test_case.get("status", "")).border = border
-                    # Column 8: Priority
-                    ws.cell(row=row_num, column=8, value=test_case.get("priority", "")).border = border
-                    # Column 9: URL
-                    ws.cell(row=row_num, column=9, value=test_case.get("url", "")).border = border
-                    # Column 10: Created Date
-                    ws.cell(row=row_num, column=10, value=test_case.get("created_date", "")).border = border
-                    
-                    # Color code status (now in column 7)
-                    status_cell = ws.cell(row=row_num, column=7)
-                status = test_case.get("status", "")
-                if status == "Pass":
-                    status_cell.fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-                elif status == "Fail":
-                    status_cell.fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-                elif status == "Blocked":
-                    status_cell.fill = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid")
-            
-                # Auto-adjust column widths for this sheet
-                for col_num, header in enumerate(headers, 1):
-                    max_length = len(header)
-                    for row_num in range(2, len(test_cases) + 2):
-                        cell_value = ws.cell(row=row_num, column=col_num).value
-                        if cell_value:
-                            max_length = max(max_length, len(str(cell_value)))
-                    ws.column_dimensions[get_column_letter(col_num)].width = min(max_length + 2, 50)
-            
-                # Enable text wrapping for columns with long text
-                for row_num in range(2, len(test_cases) + 2):
-                    for col_num in [3, 4, 5, 6]:  # Prerequisite, Execution_Steps, Expected_Output, Actual_Output
-                        ws.cell(row=row_num, column=col_num).alignment = Alignment(
-                            wrap_text=True, vertical="top"
-                        )
-            
-            # Freeze header row
-            ws.freeze_panes = "A2"
-            
-            # Save file
-            wb.save(self.excel_file_path)
-            
-        except Exception as e:
-            raise Exception(f"Failed to export to Excel: {str(e)}")
+    def save_to_excel(self, test_case, new=False, on_written=None):
+        """Journal a new (new=True) or edited test case and queue it for the background writer - only its
+        row is written, see ExcelWorkbookWriter; on_written() runs on the Tk thread once it is in the workbook.
+        With the SQLite store the test case is committed there instead of journaled."""
+        module = test_case.get("module") or self.current_module
+        if self.store:
+            versions = self.store.add(module, test_case) if new else self.store.update(test_case)
+            on_written = self._mark_synced(versions, on_written)
+        if new:
+            self.persistence.append(module, test_case, on_written)
+        else:
+            self.persistence.update(test_case, on_written)
+    
+    def export_to_excel(self, on_written=None):
+        """Export all test cases to Excel file organized by module (full rewrite of every module sheet)"""
+        self.persistence.export_all(self.test_cases_by_module, on_written)
+    
+    def export_all_to_excel(self):
+        """Explicit full export (rebuilds every module sheet from the loaded test cases)"""
+        count = self._count_test_cases()
+        self.log_message(f"Exporting {count} test cases to {self.excel_file_path}...", "INFO")
+        self.export_to_excel(on_written=lambda: self.log_message(
+            f"Exported {count} test cases to {self.excel_file_path}", "SUCCESS"))
+    
+    def _on_excel_saved(self, count, seconds):
+        self._excel_error_shown = False
+        self.log_message(f"💾 Workbook saved ({count} change{'s' if count != 1 else ''} in one write, "
+                         f"{seconds:.2f}s)", "INFO")
+    
+    def _on_excel_error(self, error):
+        """A background save failed - the changes stay queued in memory and are written with the next save"""
+        self.log_message(f"❌ Failed to save to Excel: {error} (will retry with the next save)", "ERROR")
+        self.status_label.config(text=f"Could not save {self.excel_file_path} - is it open in Excel?")
+        if not self._excel_error_shown:  # Once until a save succeeds again
+            self._excel_error_shown = True
+            self.root.after(0, lambda: messagebox.showerror("Error", f"Failed to save to Excel: {error}"))
+    
+    def on_close(self):
+        """Window closed: write everything still queued (atomic save) before exiting"""
+        if self.monitoring_active:
+            self.monitor.stop_monitoring()
+        if self.persistence.pending():
+            self.status_label.config(text="Saving test cases to Excel...")
+            self.root.update_idletasks()
+        if not self.persistence.stop(EXCEL_SHUTDOWN_FLUSH_TIMEOUT):
+            if not messagebox.askyesno(
+                    "Unsaved Test Cases",
+                    f"Some test cases could not be written to {self.excel_file_path} "
+                    f"(they are kept in {self.store.path if self.store else TEST_CASE_JOURNAL_FILE} "
+                    "and added on the next start).\n\n"
+                    "Close anyway? (Choose No, close the file in Excel and try again.)"):
+                self.persistence.start()
+                return
+        self.test_case_journal.close()
+        if self.store:
+            self.store.close()
+        self.root.destroy()
+
+
+def run_batch_replay(args):
+    """Command-line batch replay (e.g. nightly): prints one line per test case and the summary;
+    exit status 0 only when every case passed"""
+    def on_result(test_case, report):
+        print(f"{report['test_id']}: {report['status']} in {report['duration_ms'] / 1000:.1f}s"
+              + (f" - {report['error']}" if report["error"] else ""), flush=True)
+    
+    runner = BatchReplayRunner(args.replay_all, workers=args.workers, speed=REPLAY_SPEEDS[args.speed],
+                               executable=args.browser, on_result=on_result)
+    try:
+        reports, summary = runner.run()
+        if reports:
+            write_replay_results(args.replay_all, reports)
+    except Exception as e:
+        print(f"Batch replay failed: {e}", file=sys.stderr)
+        return 2
+    print(format_batch_summary(summary))
+    return 0 if summary["cases"] == summary["Pass"] else 1
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Enhanced Auto Test Case Capture Tool")
+    parser.add_argument("--replay-all", nargs="?", const="Doceree_TC.xlsx", metavar="WORKBOOK",
+                        help="replay every test case in WORKBOOK headless (default Doceree_TC.xlsx) and exit")
+    parser.add_argument("--workers", type=int, help="headless browsers to run in parallel (default: one per core)")
+    parser.add_argument("--speed", choices=list(REPLAY_SPEEDS), default="Max", help="replay speed (default Max)")
+    parser.add_argument("--browser", help="Chrome/Edge/Chromium executable to use for --replay-all")
+    parser.add_argument("--sqlite", nargs="?", const=TEST_CASE_DB_FILE, metavar="DB",
+                        help=f"keep test cases in a SQLite database (default {TEST_CASE_DB_FILE}); "
+                             "the Excel workbook is kept up to date as an export")
+    args = parser.parse_args()
+    if args.replay_all:
+        sys.exit(run_batch_replay(args))
+    
     root = tk.Tk()
-    app = TestCaseCapture(root)
+    app = TestCaseCapture(root, store_path=args.sqlite)
     root.mainloop()
 
 
@@ -0,0 +1,184 @@
+"""CDPNavigationTracker / BrowserMonitor against a fake DevTools browser endpoint (a WebSocket server that
+answers the Target/Page commands the tracker sends and pushes the events a real browser would)."""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_case_capture as tcc
+
+
+class FakeDevToolsBrowser:
+    """One page target ("T1") - runs on the shared CDPEventLoop like the tracker"""
+
+    def __init__(self):
+        self.calls = []  # Methods received, in order
+        self.attached = threading.Event()  # Page.enable received for the page target
+        self.writers = []
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"ws://127.0.0.1:{port}/devtools/browser/fake"
+
+    async def emit(self, method, params, session_id="S1"):
+        for writer in self.writers:
+            await self._send(writer, {"method": method, "params": params, "sessionId": session_id})
+
+    async def drop(self):
+        """Browser closed: the socket goes away without a close frame"""
+        for writer in self.writers:
+            writer.close()
+        self.writers = []
+
+    async def close(self):
+        await self.drop()
+        self.server.close()
+
+    @staticmethod
+    async def _send(writer, message):
+        payload = json.dumps(message).encode()
+        header = bytearray([0x81])  # Server frames are not masked
+        if len(payload) < 126:
+            header.append(len(payload))
+        else:
+            header.append(126)
+            header += struct.pack("!H", len(payload))
+        writer.write(bytes(header) + payload)
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        request = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+        key = next(line.split(":", 1)[1].strip() for line in request.split("\r\n")
+                   if line.lower().startswith("sec-websocket-key"))
+        accept = base64.b64encode(hashlib.sha1((key + tcc.WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        self.writers.append(writer)
+        try:
+            while True:
+                head = await reader.readexactly(2)
+                length = head[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack("!H", await reader.readexactly(2))[0]
+                mask = await reader.readexactly(4)
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(await reader.readexactly(length)))
+                if head[0] & 0x0F == 0x8:
+                    break
+                await self._command(writer, json.loads(payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    async def _command(self, writer, message):
+        method = message["method"]
+        self.calls.append(method)
+        result = {"sessionId": "S1"} if method == "Target.attachToTarget" else {}
+        await self._send(writer, {"id": message["id"], "result": result})
+        if method == "Target.setDiscoverTargets":
+            # Existing targets are announced once discovery is on
+            for target_id, kind in (("T1", "page"), ("W1", "service_worker")):
+                await self._send(writer, {"method": "Target.targetCreated", "params": {"targetInfo": {
+                    "targetId": target_id, "type": kind, "url": "about:blank"}}})
+        elif method == "Page.enable":
+            self.attached.set()
+
+
+def wait_until(predicate, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_tracker_reports_each_navigation_once():
+    loop = tcc.CDPEventLoop.instance()
+    browser = FakeDevToolsBrowser()
+    ws_url = loop.run(browser.start(), timeout=5)
+    navigations = []
+    tracker = tcc.CDPNavigationTracker(ws_url, lambda url, target_id: navigations.append((url, target_id)))
+    try:
+        loop.run(tracker.start(), timeout=5)
+        assert browser.attached.wait(3)
+        assert browser.calls == ["Target.setDiscoverTargets", "Target.attachToTarget", "Page.enable"]
+
+        login = "https://app.example.com/login"
+        events = [
+            ("Page.frameNavigated", {"frame": {"id": "F1", "url": login}}),
+            ("Page.frameNavigated", {"frame": {"id": "F2", "parentId": "F1", "url": "https://ads.example.com/"}}),
+            ("Target.targetInfoChanged", {"targetInfo": {"targetId": "T1", "type": "page", "url": login}}),
+            ("Page.navigatedWithinDocument", {"frameId": "F1", "url": "https://app.example.com/app#/dashboard"}),
+            ("Page.navigatedWithinDocument", {"frameId": "F2", "url": "https://ads.example.com/#2"}),
+            ("Page.frameNavigated", {"frame": {"id": "F1", "url": "https://app.example.com/settings"}}),
+        ]
+        for method, params in events:
+            loop.run(browser.emit(method, params, session_id=None if method.startswith("Target.") else "S1"))
+        assert wait_until(lambda: len(navigations) >= 3)
+        time.sleep(0.1)  # Nothing else may follow
+        assert navigations == [(login, "T1"), ("https://app.example.com/app#/dashboard", "T1"),
+                               ("https://app.example.com/settings", "T1")]
+    finally:
+        loop.run(tracker.stop(), timeout=5)
+        loop.run(browser.close(), timeout=5)
+
+
+def test_monitor_falls_back_to_polling_when_the_socket_drops():
+    loop = tcc.CDPEventLoop.instance()
+    fake = FakeDevToolsBrowser()
+    ws_url = loop.run(fake.start(), timeout=5)
+    monitor = tcc.BrowserMonitor(callback=None, base_url="https://app.example.com", ports=[9222])
+    browser = monitor._browser(9222)
+    polled = []
+
+    def poll_browsers(browsers):
+        polled.append([b.port for b in browsers])
+        return "https://app.example.com/login"
+
+    monitor._discover_browsers = lambda: {}
+    monitor._poll_browsers = poll_browsers
+    monitor.monitoring = True
+    assert monitor._start_cdp_tracking([(browser, ws_url)]) == 1
+    assert browser.tracked and fake.attached.wait(3)
+
+    thread = threading.Thread(target=monitor._monitor_urls, daemon=True)
+    thread.start()
+    try:
+        time.sleep(0.3)
+        assert polled == []  # Event-driven - the monitor thread is parked
+
+        dropped = time.monotonic()
+        loop.run(fake.drop(), timeout=5)
+        assert wait_until(lambda: polled, timeout=tcc.CDP_RECONNECT_INTERVAL)
+        assert time.monotonic() - dropped < 1.0  # Woken by the drop, not by the reconnect timer
+        assert polled[0] == [9222] and not browser.tracked and browser.tracker is None
+    finally:
+        monitor.monitoring = False
+        monitor.scheduler.wake()
+        monitor._cdp_state_changed.set()
+        thread.join(5)
+        loop.run(fake.close(), timeout=5)
+
+
+def test_restarting_the_monitor_keeps_one_refresh_worker():
+    monitor = tcc.BrowserMonitor(callback=None, ports=[9222])
+    monitor._monitor_urls = lambda: None  # No discovery - only the re-check worker matters here
+
+    def refresh_workers():
+        return [thread for thread in threading.enumerate() if thread.name == "url-refresh"]
+
+    for _ in range(5):
+        monitor.start_monitoring()
+        monitor.stop_monitoring()
+        monitor.start_monitoring()
+        assert len(refresh_workers()) == 1
+        monitor.stop_monitoring()
+    assert refresh_workers() == [] and monitor._refresh_thread is None
@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_case_capture as tcc
+
+
+class UIQueue:
+    """Stands in for TestCaseCapture.post_ui: callbacks run later, like _ui_tick would"""
+
+    def __init__(self):
+        self.calls = []
+
+    def post(self, func):
+        self.calls.append(func)
+
+    def drain(self):
+        calls, self.calls = self.calls, []
+        for func in calls:
+            func()
+
+
+def make_case(number, status="Pass"):
+    return {"test_id": f"TC_LOGIN_{number:03d}", "test_name": f"Case {number}", "module": "Login", "status": status}
+
+
+def test_failed_save_reaches_on_error(tmp_path):
+    writer = tcc.ExcelWorkbookWriter(str(tmp_path / "cases.xlsx"))
+    writer.load()
+
+    def locked():
+        raise PermissionError("file is open in Excel")
+
+    writer.save = locked
+    ui = UIQueue()
+    errors = []
+    worker = tcc.ExcelPersistenceWorker(writer, ui.post, on_error=errors.append, debounce=0.01)
+    worker.start()
+    worker.append("Login", make_case(1))
+    assert not worker.flush(5)
+    ui.drain()  # Runs after the except block is gone, as on the Tk thread
+    assert len(errors) == 1
+    assert isinstance(errors[0], PermissionError)
+    worker.stop(1)
+
+
+def test_rows_of_a_failed_save_survive_a_reload(tmp_path):
+    path = str(tmp_path / "cases.xlsx")
+    writer = tcc.ExcelWorkbookWriter(path)
+    writer.load()
+    journal = tcc.TestCaseJournal(str(tmp_path / "journal.jsonl"))
+    journal.open()
+    ui = UIQueue()
+    worker = tcc.ExcelPersistenceWorker(writer, ui.post, journal=journal, debounce=0.01)
+    worker.start()
+    worker.append("Login", make_case(1))
+    assert worker.flush(5)
+
+    save = writer.save
+    writer.save = lambda: (_ for _ in ()).throw(PermissionError("locked"))
+    worker.append("Login", make_case(2))
+    worker.update(make_case(1, status="Fail"))
+    assert not worker.flush(5)
+    assert os.path.getsize(journal.path) > 0
+
+    # Someone else saves the workbook meanwhile - the loaded copy (with the unsaved rows) is reloaded
+    workbook = tcc.load_workbook(path)
+    workbook["Login"].cell(row=1, column=20, value="Reviewed")
+    workbook.save(path)
+    os.utime(path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+
+    writer.save = save
+    worker.append("Login", make_case(3))
+    assert worker.flush(5)
+    assert worker.stop(5)
+    rows = list(tcc.load_workbook(path)["Login"].iter_rows(min_row=2, values_only=True))
+    status = tcc.EXCEL_HEADERS.index("Status")
+    assert [(row[0], row[status]) for row in rows] == [
+        ("TC_LOGIN_001", "Fail"), ("TC_LOGIN_002", "Pass"), ("TC_LOGIN_003", "Pass")]
+    assert tcc.load_workbook(path)["Login"].cell(row=1, column=20).value == "Reviewed"
+    assert os.path.getsize(journal.path) == 0  # Checkpointed only once everything was on disk
+    journal.close()
+
+
+def test_stop_waits_at_most_its_timeout(tmp_path):
+    writer = tcc.ExcelWorkbookWriter(str(tmp_path / "cases.xlsx"))
+    writer.load()
+    release = threading.Event()
+    writer.save = lambda: release.wait(5)  # A save that hangs (file on a stalled share)
+    worker = tcc.ExcelPersistenceWorker(writer, UIQueue().post, debounce=0.01)
+    worker.start()
+    worker.append("Login", make_case(1))
+    started = time.monotonic()
+    assert worker.stop(0.3) is False
+    elapsed = time.monotonic() - started
+    release.set()
+    assert 0.25 < elapsed < 0.45  # One deadline for flush and join, not 0.3 s each
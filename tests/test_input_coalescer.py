@@ -0,0 +1,127 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_case_capture as tcc
+
+
+def make_coalescer():
+    records = []
+    coalescer = tcc.InputCoalescer(records.append, scroll_gap=0.4, double_click_gap=0.35,
+                                   double_click_distance=4, typing_idle=1.5, clock=lambda: 0.0)
+    return coalescer, records
+
+
+def summary(records):
+    return [(record["kind"], record["count"]) for record in records]
+
+
+def test_single_click_passes_through_unchanged():
+    coalescer, records = make_coalescer()
+    assert coalescer.on_click(100, 200, "left", step_id=7, now=10.0) is False
+    coalescer.flush_due(now=10.2)
+    assert records == []  # Still waiting for a possible second click
+    coalescer.flush_due(now=10.4)
+    assert summary(records) == [("click", 1)]
+    assert (records[0]["x"], records[0]["y"], records[0]["button"], records[0]["step_id"]) == (100, 200, "left", 7)
+    assert coalescer.merged == 0
+
+
+def test_double_click_is_folded():
+    coalescer, records = make_coalescer()
+    coalescer.on_click(100, 200, "left", now=10.0)
+    assert coalescer.on_click(102, 199, "left", now=10.2) is True
+    assert summary(records) == [("click", 2)]
+    assert coalescer.merged == 1
+    assert coalescer.click is None
+
+
+def test_clicks_too_far_apart_are_not_folded():
+    coalescer, records = make_coalescer()
+    coalescer.on_click(100, 200, "left", now=10.0)
+    assert coalescer.on_click(100, 200, "left", now=10.5) is False  # Too late
+    assert coalescer.on_click(150, 200, "left", now=10.6) is False  # Too far
+    coalescer.flush()
+    assert summary(records) == [("click", 1), ("click", 1), ("click", 1)]
+
+
+def test_scroll_burst_folds_into_one_step():
+    coalescer, records = make_coalescer()
+    for i in range(5):
+        coalescer.on_scroll(300, 400, "down", now=20.0 + i * 0.1)
+    coalescer.flush_due(now=20.5)
+    assert records == []
+    coalescer.flush_due(now=20.8)
+    assert summary(records) == [("scroll", 5)]
+    assert records[0]["direction"] == "down"
+    assert coalescer.merged == 4
+
+
+def test_scroll_direction_change_starts_a_new_step():
+    coalescer, records = make_coalescer()
+    coalescer.on_scroll(300, 400, "down", now=20.0)
+    coalescer.on_scroll(300, 400, "down", now=20.1)
+    coalescer.on_scroll(300, 400, "up", now=20.2)
+    coalescer.flush()
+    assert [(record["direction"], record["count"]) for record in records] == [("down", 2), ("up", 1)]
+
+
+def test_typing_run_is_flushed_on_idle():
+    coalescer, records = make_coalescer()
+    for i in range(4):
+        coalescer.on_char(now=30.0 + i * 0.2)
+    assert coalescer.on_correction(now=30.8) is True
+    coalescer.flush_due(now=32.0)
+    assert records == []
+    coalescer.flush_due(now=32.4)
+    assert summary(records) == [("text", 4)]
+    assert records[0]["corrections"] == 1 and records[0]["key"] is None
+
+
+def test_typing_run_is_flushed_on_enter_and_tab():
+    coalescer, records = make_coalescer()
+    coalescer.on_char(now=40.0)
+    coalescer.on_char(now=40.1)
+    coalescer.on_boundary(key="Tab", now=40.2)
+    coalescer.on_char(now=40.3)
+    coalescer.on_boundary(key="Enter", now=40.4)
+    assert summary(records) == [("text", 2), ("text", 1)]
+    assert [record["key"] for record in records] == ["Tab", "Enter"]
+
+
+def test_click_ends_typing_and_steps_stay_chronological():
+    coalescer, records = make_coalescer()
+    coalescer.on_scroll(1, 1, "down", now=50.0)
+    coalescer.on_char(now=50.1)
+    coalescer.on_click(5, 5, "left", now=50.2)
+    assert summary(records) == [("scroll", 1), ("text", 1)]
+    coalescer.flush_due(now=51.0)
+    assert summary(records) == [("scroll", 1), ("text", 1), ("click", 1)]
+
+
+def test_monitor_keeps_the_newest_double_clicks():
+    monitor = tcc.ActionMonitor(lambda *args, **kwargs: None)
+    monitor._capture_after_refresh = lambda *args, **kwargs: None
+    for step_id in range(1, 1101):
+        monitor._emit_coalesced({"kind": "click", "x": 1, "y": 2, "button": "left", "count": 2,
+                                 "step_id": step_id, "ts_ns": 0})
+        assert step_id in monitor._double_clicks  # Never the one just added
+    assert len(monitor._double_clicks) == 1000
+    assert list(monitor._double_clicks)[0] == 101  # Oldest ones evicted first
+
+
+def test_failed_step_is_reported_to_the_monitor_log():
+    monitor = tcc.ActionMonitor(lambda *args, **kwargs: None)
+    posted, logged = [], []
+    monitor.root = object()
+    monitor.ui_queue = types.SimpleNamespace(post_call=lambda func, droppable: posted.append((func, droppable)))
+    monitor.log_callback = lambda message, level: logged.append((level, message))
+    monitor._emit_coalesced = lambda record: 1 / 0
+    monitor.coalescer.emit = monitor._emit_coalesced
+    monitor.coalescer.on_scroll(1, 2, "down", now=1.0)
+    monitor.coalescer.flush()
+    assert [droppable for func, droppable in posted] == [False]  # Not shed when the queue is full
+    posted[0][0]()
+    assert logged == [("ERROR", "❌ Scroll step was not captured: division by zero")]
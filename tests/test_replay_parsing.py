@@ -0,0 +1,41 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_case_capture as tcc
+
+
+def test_plain_steps():
+    steps = tcc.parse_test_steps("1. [10:15:02] Navigated to: https://example.com/login\n"
+                                 "2. [10:15:04] Mouse left click at (812, 433)")
+    assert [(step.number, step.action) for step in steps] == [(1, "navigate"), (2, "click")]
+    assert steps[0].args == {"url": "https://example.com/login"}
+    assert steps[1].args["x"] == 812 and steps[1].args["y"] == 433
+
+
+def test_browser_tagged_steps():
+    steps = tcc.parse_test_steps("1. [Chrome :9222] [10:15:02] Navigated to: https://example.com/login\n"
+                                 "2. [Chrome :9222] [10:15:03] Mouse left click at (812, 433)\n"
+                                 "3. [Edge :9223] [10:15:05] Enter 'bob' in input (#user)\n"
+                                 "4. [Edge :9223] Press Enter (#user)")
+    assert [step.action for step in steps] == ["navigate", "click", "type", "key"]
+    assert steps[0].args["url"] == "https://example.com/login"
+    assert steps[1].text == "Mouse left click at (812, 433)"
+    assert steps[2].args["value"] == "bob" and steps[2].args["selector"] == "#user"
+    assert [step.args["browser"] for step in steps] == ["Chrome :9222", "Chrome :9222", "Edge :9223", "Edge :9223"]
+
+
+def test_timestamp_is_not_taken_for_a_browser_tag():
+    step, = tcc.parse_test_steps("1. [10:15:02] Mouse left click at (1, 2)")
+    assert step.action == "click" and "browser" not in step.args
+
+
+def test_continuation_lines_stay_with_tagged_step():
+    steps = tcc.parse_test_steps("1. [Chrome :9222] [10:15:02] Mouse left click at (5, 6)\n"
+                                 "   Module: Login | Page: Login\n"
+                                 "2. [Chrome :9222] [10:15:03] Scrolled down 3 notches at (5, 6)",
+                                 "1. 10:15:02.000 +0 ms\n2. 10:15:03.000 +1000 ms")
+    assert [step.action for step in steps] == ["click", "scroll"]
+    assert steps[0].text.endswith("Module: Login | Page: Login")
+    assert steps[1].gap_ms == 1000.0 and steps[1].args["count"] == 3
@@ -0,0 +1,70 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_case_capture as tcc
+
+
+def make_case(number, module, status, created_date):
+    return {"test_id": f"TC_{module.upper()}_{number:03d}", "module": module, "status": status,
+            "url": f"https://app.example.com/{module.lower()}", "created_date": created_date}
+
+
+SUITE = {
+    "Login": [make_case(1, "Login", "Pass", "2026-03-01 10:00:00"), make_case(2, "Login", "Fail", "2026-03-02 10:00:00"),
+              make_case(3, "Login", "Fail", "2026-03-03 10:00:00")],
+    "Home": [make_case(1, "Home", "Fail", "2026-03-02 11:00:00"), make_case(2, "Home", "Blocked", "2026-03-04 09:00:00")],
+}
+
+
+def open_store(tmp_path):
+    store = tcc.TestCaseStore(str(tmp_path / "cases.db"))
+    store.open()
+    store.add_many([(sheet, test_case) for sheet, test_cases in SUITE.items() for test_case in test_cases])
+    return store
+
+
+def ids(items):
+    return [test_case["test_id"] for sheet, test_case in items]
+
+
+def test_query_filters(tmp_path):
+    store = open_store(tmp_path)
+    assert ids(store.query(module="Login", status="Fail")) == ["TC_LOGIN_002", "TC_LOGIN_003"]
+    assert ids(store.query(status="Fail")) == ["TC_LOGIN_002", "TC_LOGIN_003", "TC_HOME_001"]
+    assert ids(store.query(url="https://app.example.com/home")) == ["TC_HOME_001", "TC_HOME_002"]
+    assert ids(store.query(created_from="2026-03-02", created_to="2026-03-03")) == ["TC_LOGIN_002", "TC_HOME_001"]
+    assert store.query(module="Login")[0][0] == "Login"
+    assert store.count() == 5 and store.count(module="Login", status="Fail") == 2 and store.count(status="Skipped") == 0
+    store.update({**SUITE["Login"][1], "status": "Pass"})
+    assert ids(store.query(module="Login", status="Fail")) == ["TC_LOGIN_003"]
+    # Filter values are bound parameters, never SQL
+    assert store.query(module="Login' OR '1'='1") == []
+    store.close()
+
+
+def test_query_uses_the_indexes(tmp_path):
+    store = open_store(tmp_path)
+    for filters, index in (({"module": "Login", "status": "Fail"}, "test_cases_module"),
+                           ({"status": "Fail"}, "test_cases_status"),
+                           ({"url": "https://app.example.com/home"}, "test_cases_url"),
+                           ({"created_from": "2026-03-02", "created_to": "2026-03-03"}, "test_cases_created")):
+        where, params = store._where(**filters)
+        plan = " ".join(row[-1] for row in store.db.execute("EXPLAIN QUERY PLAN SELECT data FROM test_cases" + where, params))
+        assert index in plan, (filters, plan)
+    store.close()
+
+
+def test_app_selection_matches_with_and_without_the_store(tmp_path):
+    store = open_store(tmp_path)
+    with_store = types.SimpleNamespace(store=store, test_cases_by_module=SUITE)
+    without_store = types.SimpleNamespace(store=None, test_cases_by_module=SUITE)
+    for app in (with_store, without_store):
+        app._select_test_cases = types.MethodType(tcc.TestCaseCapture._select_test_cases, app)
+        assert ids(app._select_test_cases("Login", "Fail")) == ["TC_LOGIN_002", "TC_LOGIN_003"]
+        assert len(app._select_test_cases()) == 5
+        assert tcc.TestCaseCapture._count_test_cases(app, "Home") == 2
+        assert tcc.TestCaseCapture._count_test_cases(app, status="Fail") == 3
+    store.close()
@@ -0,0 +1,46 @@
+import os
+import sys
+import threading
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_case_capture as tcc
+
+
+def test_log_lines_are_dropped_before_steps():
+    queue = tcc.UIEventQueue(maxsize=2, hard_limit=4)
+    assert queue.post_log("a", "INFO") and queue.post_call(print)
+    assert not queue.post_log("b", "INFO")  # Full for droppable records
+    assert queue.post_call(print) and queue.post_call(print)
+    assert not queue.post_call(print)  # Beyond the hard limit
+    stats = queue.get_stats()
+    assert (stats["depth"], stats["dropped"], stats["dropped_steps"], stats["peak_depth"]) == (4, 1, 1, 4)
+    assert [record[0] for record in queue.drain(3)] == ["log", "call", "call"]
+    assert queue.depth() == 1 and queue.last_batch == 3
+
+
+def test_concurrent_producers_lose_nothing_below_the_limit():
+    queue = tcc.UIEventQueue(maxsize=100000)
+    producers = [threading.Thread(target=lambda n=n: [queue.post_call((n, i)) for i in range(5000)])
+                 for n in range(4)]
+    drained = []
+    for producer in producers:
+        producer.start()
+    while any(producer.is_alive() for producer in producers) or queue.depth():
+        drained.extend(record[1] for record in queue.drain())
+    for n in range(4):
+        assert [i for producer, i in drained if producer == n] == list(range(5000))  # FIFO per producer
+
+
+def test_ui_tick_logs_failing_callbacks():
+    logged, written = [], []
+    app = types.SimpleNamespace(ui_queue=tcc.UIEventQueue(), root=types.SimpleNamespace(after=lambda ms, func: None),
+                                log_message=lambda message, level="INFO": logged.append((level, message)),
+                                _update_log_ui=written.extend, _update_ui_queue_label=lambda: None, _ui_tick=None)
+    ran = []
+    app.ui_queue.post_call(lambda: 1 / 0)
+    app.ui_queue.post_call(lambda: ran.append(True))
+    tcc.TestCaseCapture._ui_tick(app)
+    assert logged == [("ERROR", "UI event failed: division by zero")]
+    assert ran == [True]  # The next record still runs
@@ -0,0 +1,116 @@
+"""Focus backends. The X11 test runs against a real X server (Xvfb, skipped without one); Xvfb has no window
+manager, so the test plays its part: it sets _NET_ACTIVE_WINDOW on the root window the way an EWMH window
+manager does on focus changes."""
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import test_case_capture as tcc
+
+needs_xvfb = pytest.mark.skipif(not (shutil.which("Xvfb") and tcc.XLIB_AVAILABLE),
+                                reason="needs Xvfb and python-xlib")
+
+# Titles must arrive well inside the 500 ms the polling fallback would take
+EVENT_TIMEOUT = 0.25
+
+
+@pytest.fixture
+def x_display():
+    number = next(n for n in range(99, 200) if not os.path.exists(f"/tmp/.X11-unix/X{n}"))
+    server = subprocess.Popen(["Xvfb", f":{number}", "-screen", "0", "640x480x24", "-nolisten", "tcp"],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(f"/tmp/.X11-unix/X{number}"):
+        if server.poll() is not None or time.monotonic() > deadline:
+            server.kill()
+            pytest.skip("Xvfb did not start")
+        time.sleep(0.05)
+    try:
+        yield f":{number}"
+    finally:
+        server.terminate()
+        server.wait(5)
+
+
+class WindowManager:
+    """Creates windows and focuses/retitles them on the test's own connection"""
+
+    def __init__(self, display_name):
+        self.d = tcc.xdisplay.Display(display_name)
+        self.root = self.d.screen().root
+        self.active_atom = self.d.intern_atom("_NET_ACTIVE_WINDOW")
+        self.name_atom = self.d.intern_atom("_NET_WM_NAME")
+        self.utf8_atom = self.d.intern_atom("UTF8_STRING")
+        self.window_atom = self.d.intern_atom("WINDOW")
+
+    def create(self, title):
+        window = self.root.create_window(0, 0, 100, 100, 0, self.d.screen().root_depth)
+        window.map()
+        self.retitle(window, title)
+        return window
+
+    def retitle(self, window, title):
+        window.change_property(self.name_atom, self.utf8_atom, 8, title.encode("utf-8"))
+        self.d.flush()
+
+    def focus(self, window):
+        self.root.change_property(self.active_atom, self.window_atom, 32, [window.id])
+        self.d.flush()
+
+    def close(self):
+        self.d.close()
+
+
+def next_title(titles):
+    started = time.monotonic()
+    title = titles.get(timeout=EVENT_TIMEOUT)
+    return title, time.monotonic() - started
+
+
+@needs_xvfb
+def test_focus_and_title_changes_are_pushed(x_display):
+    wm = WindowManager(x_display)
+    login = wm.create("Login - Chrome")
+    wm.focus(login)
+
+    titles = queue.Queue()
+    backend = tcc.X11FocusBackend(x_display)
+    assert backend.event_driven
+    assert backend.start(titles.put)
+    try:
+        assert next_title(titles)[0] == "Login - Chrome"  # Initial title
+
+        wm.retitle(login, "Dashboard - Chrome")
+        title, waited = next_title(titles)
+        assert title == "Dashboard - Chrome" and waited < EVENT_TIMEOUT
+
+        editor = wm.create("notes.txt - Editor")
+        wm.focus(editor)
+        assert next_title(titles)[0] == "notes.txt - Editor"
+
+        wm.retitle(login, "Settings - Chrome")  # No longer focused - not reported
+        wm.focus(login)
+        assert next_title(titles)[0] == "Settings - Chrome"
+        assert titles.empty()
+        assert backend.get_title() == "Settings - Chrome"
+        assert backend.changes == 4
+    finally:
+        backend.stop()
+        wm.close()
+
+
+def test_focus_tracker_failures_reach_on_error():
+    backend = tcc.FocusBackend()
+    errors = []
+    backend.on_error = errors.append
+    backend.on_change = lambda title: 1 / 0
+    backend._deliver("Login - Chrome")
+    assert backend.title == "Login - Chrome"
+    assert len(errors) == 1 and errors[0].startswith("Window title handler failed")